@@ -0,0 +1,501 @@
+"""Incremental ingestion of new images while a dataset is acquired."""
+
+import ctypes
+import ctypes.util
+import glob
+import os
+import select
+import sys
+import time
+import traceback
+
+import numpy as np
+import pandas as pd
+
+from .ProcessFullDataset import (EnviHeaderCache, findNearestDates,
+                                 getHighresHeaderPath,
+                                 getHyperspectralCatalog,
+                                 getHyperspectralFiles,
+                                 getHyperspectralTasks, getLwirCatalog,
+                                 getProcessingParameters,
+                                 getSoilMoistureIndex,
+                                 getSoilMoistureSensorRegistry, processImage,
+                                 readConfig, splitSpectra)
+from .SpectralStore import SpectralStore
+
+__all__ = [
+    "IN_CLOSE_WRITE", "IN_CREATE", "IN_MOVED_TO", "DirectoryWatcher",
+    "IngestionDaemon", "initInotify", "isSettled", "runIngestion"]
+
+# inotify events of new or completely written files and folders
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+
+class DirectoryWatcher():
+    """
+    Watcher of new files in directories and their subfolders.
+
+    On Linux, the directories are watched with inotify, i.e. :meth:`wait`
+    returns as soon as a file is written, created, or moved into one of the
+    directories. If inotify is not available (or disabled), the watcher
+    falls back to polling: :meth:`wait` only sleeps and the caller is
+    expected to scan the directories afterwards.
+
+    Parameters
+    ----------
+    directories : list of str
+        Directories to watch. Their existing and new subfolders are watched
+        as well (one level deep).
+    use_inotify : bool, optional (default=True)
+        If false, the watcher always polls.
+
+    Attributes
+    ----------
+    mode : str
+        "inotify" or "polling"
+    watched : set
+        Folders watched with inotify
+
+    """
+
+    def __init__(self, directories: list, use_inotify: bool = True):
+        """Initialize DirectoryWatcher instance."""
+        self.directories = list(directories)
+        self.watched = set()
+        self.libc, self.fd = None, None
+        if use_inotify:
+            self.libc, self.fd = initInotify()
+        self.mode = "polling" if self.fd is None else "inotify"
+        self.addWatches()
+
+    def __enter__(self):
+        """Enter context, return the watcher."""
+        return self
+
+    def __exit__(self, *args):
+        """Exit context, stop watching."""
+        self.close()
+
+    def addWatches(self):
+        """Watch the directories and their subfolders not watched yet."""
+        if self.fd is None:
+            return
+        for directory in self.directories:
+            folders = [directory] + glob.glob(os.path.join(directory, "*", ""))
+            for folder in map(os.path.normpath, folders):
+                if folder in self.watched or not os.path.isdir(folder):
+                    continue
+                if self.libc.inotify_add_watch(
+                        self.fd, os.fsencode(folder),
+                        IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) >= 0:
+                    self.watched.add(folder)
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Wait for changes in the directories.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum waiting time in seconds
+
+        Returns
+        -------
+        bool
+            True if files changed or if the watcher polls, False if the
+            timeout passed without changes
+
+        """
+        if self.fd is None:
+            time.sleep(timeout)
+            return True
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+
+        # only the fact that something changed is used, the events are
+        # discarded
+        while True:
+            try:
+                if not os.read(self.fd, 65536):
+                    break
+            except BlockingIOError:
+                break
+        self.addWatches()
+        return True
+
+    def close(self):
+        """Stop watching the directories."""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.watched = set()
+
+
+def initInotify() -> tuple:
+    """
+    Create an inotify instance with the C library.
+
+    Returns
+    -------
+    libc : ctypes.CDLL or None
+        C library, None if inotify is not available
+    fd : int or None
+        Non-blocking file descriptor of the inotify instance, None if inotify
+        is not available
+
+    """
+    if not sys.platform.startswith("linux"):
+        return None, None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (AttributeError, OSError):
+        return None, None
+    if fd < 0:
+        return None, None
+    return libc, fd
+
+
+class IngestionDaemon():
+    """
+    Incremental processing of new images of a dataset.
+
+    The daemon watches the folders of the hyperspectral, LWIR, and soil
+    moisture data. A new hyperspectral image is processed as soon as
+
+    - its header, image (.cue), and highres header have not changed for
+      `ingest_settle_time` seconds,
+    - the LWIR export within the time window exists or a later LWIR export
+      shows that there will be none, and
+    - the soil moisture data covers the end of the time window.
+
+    Images still waiting after `ingest_max_wait` seconds are processed with
+    the data which is available. The results are appended to the spectral
+    store `ingest_store`. The processed images are listed in the file
+    `ingested.txt` in the store, i.e. a restarted daemon continues where it
+    stopped. On the first start, all existing images are ingested.
+
+    Parameters
+    ----------
+    config_path : str
+        Path to config file
+    data_directory : str
+        Directory of the dataset folder.
+    use_inotify : bool, optional (default=True)
+        If false, the folders are polled, see :class:`DirectoryWatcher`.
+    verbose : int, optional (default=0)
+        Controls the verbosity.
+
+    Attributes
+    ----------
+    store : SpectralStore
+        Store of the processed spectra
+    ingested : set
+        Processed images (path relative to `data_hyp`)
+    pending : dict
+        Time of discovery (in seconds since the epoch) of every image which
+        is not processed yet
+    failed : set
+        Images which raised an error (retried after a restart)
+
+    """
+
+    STATE_FILE = "ingested.txt"
+
+    def __init__(self,
+                 config_path: str,
+                 data_directory: str,
+                 use_inotify: bool = True,
+                 verbose=0):
+        """Initialize IngestionDaemon instance."""
+        self.config = readConfig(config_path=config_path,
+                                 data_directory=data_directory)
+        self.params = getProcessingParameters(self.config, verbose=verbose)
+        self.verbose = verbose
+        self.store = SpectralStore(
+            self.config["ingest_store"],
+            band_chunk_size=self.config["store_band_chunk_size"])
+        self.watcher = DirectoryWatcher(
+            [self.config["data_hyp"], self.config["data_lwir"],
+             os.path.dirname(self.config["data_sm"]) or "."],
+            use_inotify=use_inotify)
+        self.header_cache = EnviHeaderCache()
+
+        self.ingested = set()
+        if os.path.isfile(self.store.getFilePath(self.STATE_FILE)):
+            with open(self.store.getFilePath(self.STATE_FILE)) as state_file:
+                self.ingested = set(state_file.read().split())
+        self.pending = {}
+        self.failed = set()
+
+        # soil moisture data is reloaded when the file changes
+        self.soilmoisture_data = None
+        self.soilmoisture_mtime = None
+
+    def __enter__(self):
+        """Enter context, return the daemon."""
+        return self
+
+    def __exit__(self, *args):
+        """Exit context, stop watching the folders."""
+        self.watcher.close()
+
+    def getImageName(self, hyp_hdr_path: str) -> str:
+        """Get the name of an image in the state file."""
+        return os.path.relpath(hyp_hdr_path, self.config["data_hyp"])
+
+    def getSoilMoistureData(self) -> dict:
+        """Get the soil moisture data, reloaded if a file has changed."""
+        # the registry is built again if the sensor file has changed
+        sensor_registry = getSoilMoistureSensorRegistry(
+            self.config["soilmoisture_sensors"])
+        mtime = os.path.getmtime(self.config["data_sm"])
+        if (mtime != self.soilmoisture_mtime or
+                sensor_registry is not self.params["sensor_registry"]):
+            self.params["sensor_registry"] = sensor_registry
+            self.soilmoisture_data = getSoilMoistureIndex(
+                self.config["data_sm"], sensor_registry)
+            self.soilmoisture_mtime = mtime
+        return self.soilmoisture_data
+
+    def scan(self, now: float = None) -> pd.DataFrame:
+        """
+        Find the new images which are ready to be processed.
+
+        Parameters
+        ----------
+        now : float or None, optional (default=None)
+            Current time in seconds since the epoch. None = `time.time()`.
+
+        Returns
+        -------
+        pd.DataFrame
+            Catalog of the images which are ready, see
+            :func:`hprocessing.ProcessFullDataset.getHyperspectralCatalog`
+
+        """
+        now = time.time() if now is None else now
+        settled = []
+        for hyp_hdr_path in glob.glob(self.config["data_hyp"]+"*/*[0-9].hdr"):
+            name = self.getImageName(hyp_hdr_path)
+            if name in self.ingested or name in self.failed:
+                continue
+            self.pending.setdefault(name, now)
+            if isSettled([hyp_hdr_path, hyp_hdr_path[:-3]+"cue",
+                          getHighresHeaderPath(hyp_hdr_path)],
+                         now - self.config["ingest_settle_time"]):
+                settled.append(hyp_hdr_path)
+        if not settled:
+            return getHyperspectralCatalog(self.config["data_hyp"], paths=[])
+
+        catalog = getHyperspectralCatalog(self.config["data_hyp"],
+                                          timezone=self.config["timezone"],
+                                          paths=settled)
+        half_window = pd.Timedelta(
+            minutes=self.config["time_window_width"] / 2).value
+        hyp_datetimes = catalog["datetime"].values.astype(
+            "datetime64[ns]").astype(np.int64)
+
+        # the LWIR export within the time window or a later one exists
+        lwir_catalog = getLwirCatalog(self.config["data_lwir"],
+                                      timezone=self.config["timezone"])
+        lwir_catalog = lwir_catalog[isSettled(
+            lwir_catalog["path"], now - self.config["ingest_settle_time"],
+            per_file=True)].reset_index(drop=True)
+        lwir_ready = np.zeros(len(hyp_datetimes), dtype=bool)
+        if lwir_catalog.shape[0] > 0:
+            _, time_delta = findNearestDates(lwir_catalog["datetime"],
+                                             catalog["datetime"])
+            lwir_ready = (
+                (np.abs(time_delta) <= self.config["time_window_width"] / 2) |
+                (lwir_catalog["datetime"].values.astype(
+                    "datetime64[ns]").astype(np.int64).max() >
+                 hyp_datetimes + half_window))
+
+        # the soil moisture data covers the time window
+        timestamps = self.getSoilMoistureData()["timestamp"]
+        sm_ready = np.zeros(len(hyp_datetimes), dtype=bool)
+        if len(timestamps) > 0:
+            sm_ready = timestamps.max() >= hyp_datetimes + half_window
+
+        expired = np.array([
+            now - self.pending[self.getImageName(hyp_hdr_path)] >=
+            self.config["ingest_max_wait"]
+            for hyp_hdr_path in catalog["path"]], dtype=bool)
+        return catalog[(lwir_ready & sm_ready) | expired].reset_index(
+            drop=True)
+
+    def processReady(self, catalog: pd.DataFrame) -> int:
+        """
+        Process images and append the results to the store.
+
+        Parameters
+        ----------
+        catalog : pd.DataFrame
+            Catalog of the images, e.g. from :meth:`scan`
+
+        Returns
+        -------
+        int
+            Number of processed images (including the ignored ones)
+
+        """
+        params = dict(self.params,
+                      soilmoisture_data=self.getSoilMoistureData())
+        hyp_tasks = {task[0]: task for task in getHyperspectralTasks(
+            self.config, catalog=catalog, verbose=self.verbose)}
+
+        n_processed = 0
+        for hyp_hdr_path in catalog["path"]:
+            name = self.getImageName(hyp_hdr_path)
+            self.pending.pop(name, None)
+            if hyp_hdr_path in hyp_tasks:
+                try:
+                    hyp_files = getHyperspectralFiles(
+                        hyp_hdr_path, load_image=True,
+                        header_cache=self.header_cache)
+                    datapoint, wavelengths = processImage(
+                        hyp_tasks[hyp_hdr_path], None, hyp_files, params)
+                except Exception:  # pylint: disable=broad-except
+                    print("Error while ingesting {0}:\n{1}".format(
+                        name, traceback.format_exc()), file=sys.stderr)
+                    self.failed.add(name)
+                    continue
+                if datapoint is not None:
+                    self.store.append(*splitSpectra(datapoint, wavelengths),
+                                      wavelengths=wavelengths)
+            self.markIngested(name)
+            n_processed += 1
+
+        if n_processed and self.config["spectralon_cache"]:
+            self.params["hyp_spectralon_cache"].save(
+                self.config["spectralon_cache"])
+        return n_processed
+
+    def markIngested(self, name: str):
+        """Add an image to the processed images and to the state file."""
+        self.ingested.add(name)
+        with open(self.store.getFilePath(self.STATE_FILE), "a") as state_file:
+            state_file.write(name + "\n")
+
+    def runOnce(self, now: float = None) -> int:
+        """
+        Scan the folders once and process the images which are ready.
+
+        Parameters
+        ----------
+        now : float or None, optional (default=None)
+            Current time, see :meth:`scan`
+
+        Returns
+        -------
+        int
+            Number of processed images
+
+        """
+        n_processed = self.processReady(self.scan(now=now))
+        if self.verbose and n_processed:
+            print("Ingested {0} image(s), {1} waiting.".format(
+                n_processed, len(self.pending)))
+        return n_processed
+
+    def run(self, max_iterations: int = None, stop_event=None) -> int:
+        """
+        Process new images until stopped.
+
+        Between two scans, the daemon waits for changes in the folders. With
+        pending images, it scans at least every `ingest_settle_time` seconds,
+        otherwise every `ingest_poll_interval` seconds.
+
+        Parameters
+        ----------
+        max_iterations : int or None, optional (default=None)
+            Maximum number of scans. None = no limit.
+        stop_event : threading.Event or None, optional (default=None)
+            The daemon stops after the current scan if the event is set.
+
+        Returns
+        -------
+        int
+            Number of processed images
+
+        """
+        n_processed, iteration = 0, 0
+        while True:
+            n_processed += self.runOnce()
+            iteration += 1
+            if ((max_iterations is not None and iteration >= max_iterations)
+                    or (stop_event is not None and stop_event.is_set())):
+                return n_processed
+            timeout = self.config["ingest_poll_interval"]
+            if self.pending:
+                timeout = min(timeout, self.config["ingest_settle_time"])
+            self.watcher.wait(timeout)
+
+
+def isSettled(filepaths, before: float, per_file: bool = False):
+    """
+    Check if files exist and have not been modified since a point in time.
+
+    Parameters
+    ----------
+    filepaths : list of str
+        Paths of the files
+    before : float
+        Point in time in seconds since the epoch
+    per_file : bool, optional (default=False)
+        If true, the result of every file is returned.
+
+    Returns
+    -------
+    bool or np.ndarray of bool
+        True if all files (or the respective file) are settled
+
+    """
+    settled = []
+    for filepath in filepaths:
+        try:
+            settled.append(os.path.getmtime(filepath) <= before)
+        except OSError:
+            settled.append(False)
+    if per_file:
+        return np.array(settled, dtype=bool)
+    return all(settled)
+
+
+def runIngestion(config_path: str,
+                 data_directory: str,
+                 max_iterations: int = None,
+                 use_inotify: bool = True,
+                 verbose=0) -> int:
+    """
+    Ingest new images of a dataset into a spectral store until stopped.
+
+    Parameters
+    ----------
+    config_path : str
+        Path to config file
+    data_directory : str
+        Directory of the dataset folder.
+    max_iterations : int or None, optional (default=None)
+        Maximum number of scans. None = until interrupted (e.g. Ctrl+C).
+    use_inotify : bool, optional (default=True)
+        If false, the folders are polled.
+    verbose : int, optional (default=0)
+        Controls the verbosity.
+
+    Returns
+    -------
+    int
+        Number of processed images
+
+    """
+    with IngestionDaemon(config_path, data_directory,
+                         use_inotify=use_inotify, verbose=verbose) as daemon:
+        if verbose:
+            print("Watching the dataset ({0}).".format(daemon.watcher.mode))
+        return daemon.run(max_iterations=max_iterations)
@@ -1,10 +1,24 @@
 """Functions to plot ENVI files."""
 
+import concurrent.futures
+import configparser
+import os
+
+import matplotlib
+import matplotlib.image
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.patches import Rectangle
 import numpy as np
 
-from .ProcessEnviFile import convertWavelength, getEdgesForGrid
+from .ProcessEnviFile import (convertWavelength, getEnviFile, getGridCells,
+                              getRealGridSize, readBand)
+
+__all__ = [
+    "addRectangles", "getQuickLookExecutor", "getQuickLookTasks", "isUpToDate",
+    "plotEnviImageWithMask", "plotEnviImageWithRectangles",
+    "renderContactSheet", "renderQuickLook", "renderQuickLooks",
+    "saveEnviImagePlots"]
 
 
 def plotEnviImageWithMask(image,
@@ -14,8 +28,9 @@ def plotEnviImageWithMask(image,
                           grid: tuple = (1, 1),
                           channel: int = 3,
                           title: str = "",
-                          imageshape: tuple = (50, 50),
-                          save_to_file: bool = False):
+                          imageshape: tuple = None,
+                          save_to_file: bool = False,
+                          filepath: str = None):
     """
     Plot Envi image with mask.
 
@@ -37,13 +52,14 @@ def plotEnviImageWithMask(image,
     title : str
         Plot title
     imageshape : tuple of (int, int), optional
-        Image shape
+        Not used anymore, the shape is taken from `image`.
     save_to_file : bool, optional
         Should plot be saved to file?
+    filepath : str or None, optional (default=None)
+        Path of the saved plot. If None, it is saved in the folder `plots/`.
 
     """
-    bwmap = np.array([[image[i, j, channel] for j in range(imageshape[0])]
-                      for i in range(imageshape[1])])
+    bwmap = readBand(image, channel).astype(float)
     if mask is not None:
         bwmap_masked = np.multiply(bwmap, mask)
     plt.clf()
@@ -56,33 +72,10 @@ def plotEnviImageWithMask(image,
     print("Image at wavelength = "+str(wavelengths[channel])+"nm")
 
     # plot rectangles
-    currentAxis = plt.gca()
-    for i, r in enumerate(rectangles):
-        # IMPORTANT: (x,y) != (row, column)
-        upperleft = (r[2], r[0])  # lowerleft = envi upperleft
-        width = r[3] - r[2]
-        height = r[1] - r[0]
-        currentAxis.add_patch(Rectangle(xy=upperleft, width=width,
-                                        height=height, facecolor="white",
-                                        alpha=0.5))
-
-        if i == 0:
-            continue    # spectralon
-
-        # plot fields (grid)
-        new_edges_list = getEdgesForGrid(r, grid)
-        for new_r in new_edges_list:
-            # IMPORTANT: (x,y) != (row, column)
-            upperleft = (new_r[2], new_r[0])  # lowerleft = envi upperleft
-            width = new_r[3] - new_r[2]
-            height = new_r[1] - new_r[0]
-            # colorSet1
-            currentAxis.add_patch(Rectangle(xy=upperleft, width=width,
-                                            height=height, facecolor="none",
-                                            edgecolor="white", alpha=0.5))
+    addRectangles(plt.gca(), rectangles, grid=grid)
 
     if save_to_file:
-        plt.savefig("plots/plot_envi_withrectangles_"+title+".pdf",
+        plt.savefig(filepath or "plots/plot_envi_withrectangles_"+title+".pdf",
                     bbox_inches='tight')
     else:
         plt.show()
@@ -93,10 +86,11 @@ def plotEnviImageWithRectangles(image,
                                 rectangles: list,
                                 channel: int = 137,
                                 title: str = "",
-                                imageshape: tuple = (50, 50),
+                                imageshape: tuple = None,
                                 includeColorbar: bool = True,
                                 fontsize: int = 10,
-                                save_to_file: bool = False):
+                                save_to_file: bool = False,
+                                filepath: str = None):
     """
     Plot Envi image with (multiple) rectangle(s).
 
@@ -117,17 +111,18 @@ def plotEnviImageWithRectangles(image,
     title : str
         Plot title
     imageshape : tuple of (int, int), optional
-        Image shape
+        Not used anymore, the shape is taken from `image`.
     includeColorbar : boolean, optional
         If true, the colorbar is included into the plot
     fontsize : int, optional
         Fontsize of labels in the plot
     save_to_file : bool, optional
         Should plot be saved to file?
+    filepath : str or None, optional (default=None)
+        Path of the saved plot. If None, it is saved in the folder `plots/`.
 
     """
-    bwmap = [[image[i, j, channel] for j in range(imageshape[0])]
-             for i in range(imageshape[1])]
+    bwmap = readBand(image, channel)
     plt.clf()
 
     # fig, ax = plt.subplots(figsize=(6,5),dpi=200)
@@ -150,17 +145,408 @@ def plotEnviImageWithRectangles(image,
     # plt.title("Image at wavelength = "+str(wavelengths[channel])+"nm")
     print("Image at wavelength = {0} nm"
           .format(convertWavelength(wavelengths[channel])))
-    currentAxis = plt.gca()
-    for r in rectangles:
-        # IMPORTANT: (x,y) != (row, column)
-        upperleft = (r[2], r[0])  # lowerleft = envi upperleft
-        width = r[3] - r[2]
-        height = r[1] - r[0]
-        currentAxis.add_patch(Rectangle(xy=upperleft, width=width,
-                                        height=height, facecolor="white",
-                                        alpha=0.5))
+    addRectangles(plt.gca(), rectangles)
     if save_to_file:
-        plt.savefig("plots/plot_envi_withrectangles_"+title+".pdf",
+        plt.savefig(filepath or "plots/plot_envi_withrectangles_"+title+".pdf",
                     bbox_inches='tight')
     else:
         plt.show()
+
+
+def addRectangles(ax,
+                  rectangles: list,
+                  grid: tuple = None,
+                  remainder: str = "drop"):
+    """
+    Add rectangles and their grid elements to a plot.
+
+    Parameters
+    ----------
+    ax : matplotlib axes
+        Axes of the plot
+    rectangles : list of lists
+        Edges (row_start, row_end, col_start, col_end) of the rectangles. The
+        first rectangle is the spectralon.
+    grid : tuple (int, int) or None, optional (default=None)
+        Size of the grid (rows, columns) plotted in all rectangles except the
+        spectralon. If None, no grid is plotted.
+    remainder : str, optional (default="drop")
+        Handling of the pixels that do not fit into the grid, see
+        :func:`hprocessing.ProcessEnviFile.getGridCells`
+
+    """
+    for i, r in enumerate(rectangles):
+        # IMPORTANT: (x,y) != (row, column)
+        upperleft = (r[2], r[0])  # lowerleft = envi upperleft
+        width = r[3] - r[2]
+        height = r[1] - r[0]
+        ax.add_patch(Rectangle(xy=upperleft, width=width, height=height,
+                               facecolor="white", alpha=0.5))
+
+        if i == 0 or grid is None:
+            continue    # spectralon
+
+        # plot fields (grid)
+        cell_edges, _ = getGridCells(r, getRealGridSize(r, grid),
+                                     remainder=remainder)
+        for new_r in cell_edges:
+            # IMPORTANT: (x,y) != (row, column)
+            upperleft = (new_r[2], new_r[0])  # lowerleft = envi upperleft
+            width = new_r[3] - new_r[2]
+            height = new_r[1] - new_r[0]
+            # colorSet1
+            ax.add_patch(Rectangle(xy=upperleft, width=width, height=height,
+                                   facecolor="none", edgecolor="white",
+                                   alpha=0.5))
+
+
+def saveEnviImagePlots(images: list,
+                       wavelengths: list,
+                       rectangles_list: list = None,
+                       channels: tuple = (137,),
+                       output_directory: str = "plots/",
+                       titles: list = None,
+                       masks: list = None,
+                       grid: tuple = None,
+                       file_format: str = "png") -> list:
+    """
+    Plot many images and bands to files without showing them.
+
+    One figure is reused for all plots. Every band is read as one array, see
+    :func:`hprocessing.ProcessEnviFile.readBand`.
+
+    Parameters
+    ----------
+    images : list of bsq-files or str
+        Envi images or paths to their header files
+    wavelengths : list of int
+        List of measured wavelength bands
+    rectangles_list : list of lists or None, optional (default=None)
+        Rectangles (see :func:`addRectangles`) per image
+    channels : tuple of int, optional (default=(137,))
+        Bands/channels to plot of every image
+    output_directory : str, optional (default="plots/")
+        Folder of the plots. It is created if it does not exist.
+    titles : list of str or None, optional (default=None)
+        Title per image used in the filenames. If None, the names of the
+        header files or the image numbers are used.
+    masks : list or None, optional (default=None)
+        Mask per image, see :func:`plotEnviImageWithMask`
+    grid : tuple (int, int) or None, optional (default=None)
+        Size of the grid plotted in the rectangles
+    file_format : str, optional (default="png")
+        Format of the plots, e.g. png or pdf
+
+    Returns
+    -------
+    filepaths : list of str
+        Paths of the saved plots
+
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    fig = plt.figure()
+    filepaths = []
+    for i, image in enumerate(images):
+        title = str(i)
+        if isinstance(image, str):
+            title = os.path.splitext(os.path.basename(image))[0]
+            image = getEnviFile(image)[1]
+        if titles is not None:
+            title = titles[i]
+
+        for channel in channels:
+            bwmap = readBand(image, channel).astype(float)
+            fig.clf()
+            ax = fig.add_subplot(1, 1, 1)
+            ax.imshow(bwmap, cmap="viridis")
+            if masks is not None and masks[i] is not None:
+                ax.imshow(np.multiply(bwmap, masks[i]), cmap="viridis",
+                          alpha=0.5)
+            ax.set_xlabel("Sensor columns")
+            ax.set_ylabel("Sensor rows")
+            ax.set_title("{0} at wavelength = {1} nm".format(
+                title, convertWavelength(wavelengths[channel])))
+            if rectangles_list is not None:
+                addRectangles(ax, rectangles_list[i], grid=grid)
+
+            filepaths.append(os.path.join(
+                output_directory, "plot_envi_{0}_band{1}.{2}".format(
+                    title, channel, file_format)))
+            fig.savefig(filepaths[-1], bbox_inches="tight")
+    plt.close(fig)
+    return filepaths
+
+
+def renderQuickLooks(config_path: str,
+                     data_directory: str,
+                     output_directory: str = None,
+                     channel: int = None,
+                     n_jobs: int = None,
+                     verbose=0) -> list:
+    """
+    Render mask and rectangle overlays of all images of a dataset for QA.
+
+    One PNG per image and one contact sheet per measurement are saved in
+    `output_directory`/measurement/, the file names contain the channel
+    (e.g. Auto017_ch90.png and contact_sheet_ch90.png). Overlays which are
+    newer than the image, the config, the positions, and the masks are not
+    rendered again. The plots are rendered in a process pool with the
+    non-interactive Agg backend.
+
+    Parameters
+    ----------
+    config_path : str
+        Path to config file
+    data_directory : str
+        Directory of the dataset folder.
+    output_directory : str or None, optional (default=None)
+        Folder of the plots. If None, the config option `qa_output` is used.
+    channel : int or None, optional (default=None)
+        Band/channel to plot. If None, the config option `qa_channel` is used.
+    n_jobs : int or None, optional (default=None)
+        Number of processes. If None, the config option `qa_jobs` is used.
+        If zero, the number of CPUs is used. If one, the plots are rendered in
+        this process.
+    verbose : int, optional (default=0)
+        Controls the verbosity.
+
+    Returns
+    -------
+    filepaths : list of str
+        Paths of the overlays and contact sheets, including the ones which
+        were up to date
+
+    """
+    from .ProcessFullDataset import readConfig
+
+    config = readConfig(config_path=config_path,
+                        data_directory=data_directory)
+    if output_directory is None:
+        output_directory = config["qa_output"]
+    if channel is None:
+        channel = config["qa_channel"]
+    if n_jobs is None:
+        n_jobs = config["qa_jobs"]
+
+    # the overlays depend on the config, positions, and masks
+    config_parser = configparser.ConfigParser(allow_no_value=True)
+    config_parser.read(config_path)
+    config_paths = [config_path] + [
+        data_directory + config_parser["Paths"][var]
+        for var in ["positions_hyp", "masks_hyp"]]
+
+    tasks = getQuickLookTasks(config, output_directory, channel=channel,
+                              input_paths=config_paths)
+    contact_sheets = {}
+    for task in tasks:
+        contact_sheets.setdefault(os.path.dirname(task["output_path"]),
+                                  []).append(task["output_path"])
+
+    filepaths = []
+    with getQuickLookExecutor(n_jobs) as executor:
+        for filepath in executor.map(renderQuickLook, tasks):
+            filepaths.append(filepath)
+        for filepath in executor.map(
+                renderContactSheet, list(contact_sheets.values()),
+                [os.path.join(directory,
+                              "contact_sheet_ch{0}.png".format(channel))
+                 for directory in contact_sheets]):
+            filepaths.append(filepath)
+    if verbose:
+        print("Rendered quick looks of {0} images.".format(len(tasks)))
+    return filepaths
+
+
+def getQuickLookExecutor(n_jobs: int):
+    """
+    Get executor for the quick looks.
+
+    Parameters
+    ----------
+    n_jobs : int
+        Number of processes. If zero, the number of CPUs is used. If one, the
+        tasks are executed in this process.
+
+    Returns
+    -------
+    concurrent.futures.Executor
+        Process pool or executor in this process
+
+    """
+    if n_jobs == 1:
+        return _SequentialExecutor()
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=n_jobs or None, initializer=matplotlib.use,
+        initargs=("Agg",))
+
+
+class _SequentialExecutor():
+    """Executor which runs the tasks in this process."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    @staticmethod
+    def map(function, *iterables):
+        return map(function, *iterables)
+
+
+def getQuickLookTasks(config: dict,
+                      output_directory: str,
+                      channel: int = 90,
+                      input_paths: list = None) -> list:
+    """
+    Get one quick-look task per image of a dataset.
+
+    Parameters
+    ----------
+    config : dict
+        Configuration of the processing, see
+        :func:`hprocessing.ProcessFullDataset.readConfig`
+    output_directory : str
+        Folder of the plots
+    channel : int, optional (default=90)
+        Band/channel to plot
+    input_paths : list of str or None, optional (default=None)
+        Further files on which all overlays depend, e.g. the config file
+
+    Returns
+    -------
+    tasks : list of dict
+        Tasks for :func:`renderQuickLook`
+
+    """
+    from .ProcessFullDataset import (MeasurementGeometry,
+                                     getHyperspectralCatalog)
+
+    geometry = MeasurementGeometry(config["positions_hyp"],
+                                   masks=config["masks_hyp"])
+    prefixes = ["spec"] + sorted(set(geometry.prefixes) - {"spec"})
+    catalog = getHyperspectralCatalog(data_hyp=config["data_hyp"],
+                                      timezone=config["timezone"])
+
+    tasks = []
+    for hyp_hdr_path, meas_name in zip(catalog["path"],
+                                       catalog["measurement"]):
+        index_of_meas = geometry.index.get(meas_name)
+        if index_of_meas is None:
+            continue
+        # rectangles which are not defined for the measurement are skipped
+        defined_prefixes = geometry.getDefinedPrefixes(index_of_meas)
+        edges = geometry.getEdges(index_of_meas, prefixes=[
+            prefix for prefix in prefixes
+            if prefix == "spec" or prefix in defined_prefixes])
+
+        filename = os.path.splitext(os.path.basename(hyp_hdr_path))[0]
+        tasks.append({
+            "hyp_hdr_path": hyp_hdr_path,
+            "output_path": os.path.join(
+                output_directory, meas_name,
+                "{0}_ch{1}.png".format(filename, channel)),
+            "input_paths": [hyp_hdr_path, hyp_hdr_path[:-3] + "cue"] + list(
+                input_paths or []),
+            "rectangles": list(edges.values()),
+            "mask": geometry.getMask(meas_name,
+                                     imageshape=config["imageshape"]),
+            "grid": config["grid"],
+            "grid_remainder": config["grid_remainder"],
+            "channel": channel,
+            "title": "{0} - {1}".format(meas_name, filename)})
+    return tasks
+
+
+def renderQuickLook(task: dict) -> str:
+    """
+    Render the mask and rectangle overlay of one image to a PNG file.
+
+    Parameters
+    ----------
+    task : dict
+        Task from :func:`getQuickLookTasks`
+
+    Returns
+    -------
+    str
+        Path of the overlay
+
+    """
+    if isUpToDate(task["output_path"], task["input_paths"]):
+        return task["output_path"]
+
+    bwmap = readBand(getEnviFile(task["hyp_hdr_path"])[1],
+                     task["channel"]).astype(float)
+    fig = Figure()
+    ax = fig.add_subplot(1, 1, 1)
+    ax.imshow(bwmap, cmap="viridis")
+    if task["mask"] is not None:
+        ax.imshow(np.multiply(bwmap, task["mask"]), cmap="viridis", alpha=0.5)
+    addRectangles(ax, task["rectangles"], grid=task["grid"],
+                  remainder=task["grid_remainder"])
+    ax.set_xlabel("Sensor columns")
+    ax.set_ylabel("Sensor rows")
+    ax.set_title(task["title"])
+
+    os.makedirs(os.path.dirname(task["output_path"]), exist_ok=True)
+    fig.savefig(task["output_path"], bbox_inches="tight")
+    return task["output_path"]
+
+
+def renderContactSheet(filepaths: list, output_path: str) -> str:
+    """
+    Render several PNG files side by side into one contact sheet.
+
+    Parameters
+    ----------
+    filepaths : list of str
+        Paths of the PNG files
+    output_path : str
+        Path of the contact sheet. It is not rendered again if it is newer
+        than all PNG files.
+
+    Returns
+    -------
+    str
+        Path of the contact sheet
+
+    """
+    if isUpToDate(output_path, filepaths):
+        return output_path
+
+    n_cols = int(np.ceil(np.sqrt(len(filepaths))))
+    n_rows = int(np.ceil(len(filepaths) / n_cols))
+    fig = Figure(figsize=(3 * n_cols, 3 * n_rows))
+    for i, filepath in enumerate(filepaths):
+        ax = fig.add_subplot(n_rows, n_cols, i + 1)
+        ax.imshow(matplotlib.image.imread(filepath))
+        ax.set_axis_off()
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    fig.savefig(output_path, bbox_inches="tight")
+    return output_path
+
+
+def isUpToDate(output_path: str, input_paths: list) -> bool:
+    """
+    Check if an output file is newer than all its input files.
+
+    Parameters
+    ----------
+    output_path : str
+        Path of the output file
+    input_paths : list of str
+        Paths of the input files
+
+    Returns
+    -------
+    bool
+        True if the output exists and is not older than all input files
+
+    """
+    if not os.path.isfile(output_path):
+        return False
+    output_time = os.path.getmtime(output_path)
+    return all(os.path.getmtime(path) <= output_time for path in input_paths
+               if os.path.isfile(path))
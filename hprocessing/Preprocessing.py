@@ -0,0 +1,211 @@
+"""
+Batched preprocessing of calibrated spectra.
+
+All functions operate on arrays with one spectrum per row, i.e. with the
+shape (cells, bands), e.g. all grid elements of an image at once.
+
+scipy is only imported if the Savitzky-Golay filter is used.
+
+"""
+
+import numpy as np
+
+__all__ = [
+    "PREPROCESSING_STEPS", "getContinuum", "getContinuumRemovedSpectra",
+    "getDerivativeSpectra", "getSavgolSpectra", "preprocessSpectra"]
+
+# possible steps of preprocessSpectra
+PREPROCESSING_STEPS = ("savgol", "derivative", "continuum")
+
+
+def preprocessSpectra(spectra: np.ndarray,
+                      wavelengths: list,
+                      steps: tuple,
+                      savgol_window: int = 11,
+                      savgol_polyorder: int = 2) -> np.ndarray:
+    """
+    Apply preprocessing steps to spectra one after the other.
+
+    Parameters
+    ----------
+    spectra : np.ndarray
+        Spectra with shape (cells, bands)
+    wavelengths : list
+        Wavelengths of the bands in ascending order
+    steps : tuple of str
+        Steps in the order of application. Possible values: savgol
+        (Savitzky-Golay smoothing), derivative (first derivative), and
+        continuum (continuum removal).
+    savgol_window : int, optional (default=11)
+        Window length of the Savitzky-Golay filter in bands
+    savgol_polyorder : int, optional (default=2)
+        Order of the polynomials of the Savitzky-Golay filter
+
+    Returns
+    -------
+    np.ndarray
+        Preprocessed spectra with the shape of `spectra`
+
+    Raises
+    ------
+    ValueError
+        Raised if a step is unknown.
+
+    """
+    unknown = [step for step in steps if step not in PREPROCESSING_STEPS]
+    if unknown:
+        raise ValueError("Unknown preprocessing step(s) {0}, possible "
+                         "steps: {1}.".format(unknown, PREPROCESSING_STEPS))
+
+    for step in steps:
+        if step == "savgol":
+            spectra = getSavgolSpectra(spectra, window=savgol_window,
+                                       polyorder=savgol_polyorder)
+        elif step == "derivative":
+            spectra = getDerivativeSpectra(spectra, wavelengths)
+        else:
+            spectra = getContinuumRemovedSpectra(spectra, wavelengths)
+    return spectra
+
+
+def getSavgolSpectra(spectra: np.ndarray,
+                     window: int = 11,
+                     polyorder: int = 2) -> np.ndarray:
+    """
+    Smooth spectra with a Savitzky-Golay filter.
+
+    Parameters
+    ----------
+    spectra : np.ndarray
+        Spectra with shape (cells, bands)
+    window : int, optional (default=11)
+        Window length in bands. It is reduced to the largest odd number of
+        bands if the spectra are shorter.
+    polyorder : int, optional (default=2)
+        Order of the polynomials, smaller than `window`
+
+    Returns
+    -------
+    np.ndarray
+        Smoothed spectra
+
+    """
+    from scipy.signal import savgol_filter
+
+    spectra = np.asarray(spectra)
+    window = min(window, spectra.shape[1] - (1 - spectra.shape[1] % 2))
+    return savgol_filter(spectra, window_length=window, polyorder=polyorder,
+                         axis=1)
+
+
+def getDerivativeSpectra(spectra: np.ndarray, wavelengths: list) -> np.ndarray:
+    """
+    Get first derivative of spectra with respect to the wavelength.
+
+    Central differences are used inside and one-sided differences at the
+    borders. The wavelengths do not need to be equally spaced, e.g. after
+    removing bad bands.
+
+    Parameters
+    ----------
+    spectra : np.ndarray
+        Spectra with shape (cells, bands)
+    wavelengths : list
+        Wavelengths of the bands in ascending order
+
+    Returns
+    -------
+    np.ndarray
+        Derivatives (per unit of the wavelength)
+
+    """
+    return np.gradient(np.asarray(spectra),
+                       np.asarray(wavelengths, dtype=float), axis=1)
+
+
+def getContinuum(spectra: np.ndarray, wavelengths: list) -> np.ndarray:
+    """
+    Get continuum (upper convex hull) of spectra.
+
+    The hull is found with the monotone chain algorithm for all spectra at
+    once: the loop runs over the bands, every step is vectorized over the
+    spectra.
+
+    Parameters
+    ----------
+    spectra : np.ndarray
+        Spectra with shape (cells, bands)
+    wavelengths : list
+        Wavelengths of the bands in ascending order
+
+    Returns
+    -------
+    np.ndarray
+        Continuum of every spectrum, NaN for spectra with NaN
+
+    """
+    spectra = np.asarray(spectra, dtype=float)
+    x = np.asarray(wavelengths, dtype=float)
+    n_spectra, n_bands = spectra.shape
+    rows = np.arange(n_spectra)
+
+    # stack of the hull bands of every spectrum
+    stack = np.zeros((n_spectra, n_bands), dtype=int)
+    size = np.ones(n_spectra, dtype=int)
+    for band in range(1, n_bands):
+        # remove the last hull band as long as it is not above the line from
+        # the band before it to the current band
+        active = rows[size >= 2]
+        while len(active) > 0:
+            first = stack[active, size[active]-2]
+            last = stack[active, size[active]-1]
+            below = ((x[last] - x[first]) *
+                     (spectra[active, band] - spectra[active, first]) -
+                     (spectra[active, last] - spectra[active, first]) *
+                     (x[band] - x[first])) >= 0
+            active = active[below]
+            size[active] -= 1
+            active = active[size[active] >= 2]
+        stack[rows, size] = band
+        size += 1
+
+    # linear interpolation between the neighboring hull bands
+    on_hull = np.zeros((n_spectra, n_bands), dtype=bool)
+    on_hull[np.repeat(rows, size), stack[np.arange(n_bands) < size[:, None]]
+            ] = True
+    bands = np.broadcast_to(np.arange(n_bands), (n_spectra, n_bands))
+    left = np.maximum.accumulate(np.where(on_hull, bands, 0), axis=1)
+    right = np.minimum.accumulate(
+        np.where(on_hull, bands, n_bands - 1)[:, ::-1], axis=1)[:, ::-1]
+    y_left = np.take_along_axis(spectra, left, axis=1)
+    y_right = np.take_along_axis(spectra, right, axis=1)
+    width = x[right] - x[left]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        continuum = np.where(width > 0, y_left + (y_right - y_left) *
+                             (x - x[left]) / width, y_left)
+
+    continuum[np.isnan(spectra).any(axis=1)] = np.nan
+    return continuum
+
+
+def getContinuumRemovedSpectra(spectra: np.ndarray,
+                               wavelengths: list) -> np.ndarray:
+    """
+    Remove the continuum of spectra.
+
+    Parameters
+    ----------
+    spectra : np.ndarray
+        Spectra with shape (cells, bands)
+    wavelengths : list
+        Wavelengths of the bands in ascending order
+
+    Returns
+    -------
+    np.ndarray
+        Spectra divided by their continuum (see :func:`getContinuum`), one
+        on the hull and below one in absorption features
+
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.asarray(spectra) / getContinuum(spectra, wavelengths)
@@ -8,11 +8,24 @@ authors (see `spectralpython/spectral/issues/103
 """
 
 import itertools
+import re
+import warnings
 
 import numpy as np
 import pandas as pd
 import spectral as spy
 
+__all__ = [
+    "ProcessEnviFile", "EnviHeaderCache", "convertWavelength", "formatTime",
+    "getBlockStatistics", "getBlocksFromBounds", "getCalibratedSpectrum",
+    "getDatetimesFromDescriptions", "getEdgesForGrid", "getEnviFile",
+    "getEnviHeader", "getGridBlocks", "getGridBounds", "getGridCells",
+    "getGridElements", "getIntegralImage", "getIntegralImageStatistics",
+    "getMappedGridBounds", "getRealGridSize", "getWindowStatistics",
+    "isEmptyImage", "parseEnviHeader", "parseEnviListField", "readBand",
+    "readEnviDescription", "readEnviHeader", "removeBadBands",
+    "validateWavelengths"]
+
 
 class ProcessEnviFile():
     """
@@ -35,6 +48,11 @@ class ProcessEnviFile():
         Dictionary with information of the positions config file
     index_of_meas : int
         Index of dataset in positions CSV file
+    edges : dict or None, optional (default=None)
+        Already compiled edges [row_start, row_end, col_start, col_end] of
+        the rectangles of this image (e.g. spec, zone1), e.g. from
+        :meth:`hprocessing.ProcessFullDataset.MeasurementGeometry.getEdges`.
+        If None, the edges are read from `positions`.
     mask : numpy array, optional (default=None)
         Zero = pixel to be masked, One = good pixel
     grid : tuple (int, int), optional (default=(1, 1))
@@ -45,6 +63,25 @@ class ProcessEnviFile():
         mean, max, max10 (= maximum of the top 10 pixels), std.
     spectralon_factor : float, optional (default=0.95)
         Factor of how much solar radiation the spectralon reflects.
+    use_integral_image : bool, optional (default=False)
+        If true, the modes mean and std are calculated from an integral image
+        (summed-area table) of the cube, see :func:`getIntegralImage`. This
+        is faster if many (overlapping) rectangles of the same image are
+        evaluated.
+    dtype : str or np.dtype, optional (default="float64")
+        Working data type of the statistics, the calibration, and the
+        resulting DataFrames. With "float32", the memory use and the output
+        size are about halved. The results differ from the float64 results by
+        the float32 rounding, i.e. within a relative tolerance of 1e-5.
+    grid_remainder : str, optional (default="drop")
+        Handling of the pixels that do not fit into the grid. Possible values:
+        drop (legacy, the remaining pixels are not used) and distribute (the
+        remaining pixels are distributed over the grid elements), see
+        :func:`getGridCells`.
+    spectralon : np.ndarray or None, optional (default=None)
+        Already calculated spectrum of the spectralon (good bands), e.g. from
+        :class:`hprocessing.ProcessFullDataset.SpectralonCache`. If None, it
+        is calculated on first use, see :meth:`getSpectralon`.
 
     """
 
@@ -55,21 +92,31 @@ class ProcessEnviFile():
                  zone_list: list,
                  positions: dict,
                  index_of_meas: int,
+                 edges: dict = None,
                  mask=None,
                  grid: tuple = (1, 1),
                  stat_mode: str = "median",
-                 spectralon_factor: float = 0.95):
+                 spectralon_factor: float = 0.95,
+                 use_integral_image: bool = False,
+                 dtype="float64",
+                 grid_remainder: str = "drop",
+                 spectralon=None):
         """Initialize ProcessEnviFile object."""
         self.image = image
         self.wavelengths_original = wavelengths
         self.bbl_original = bbl
         self.zone_list = zone_list
         self.positions = positions
+        self.edges = edges
         self.mask = mask
         self.grid = grid
         self.index_of_meas = index_of_meas
         self.stat_mode = stat_mode
         self.spectralon_factor = spectralon_factor
+        self.use_integral_image = use_integral_image
+        self.dtype = np.dtype(dtype)
+        self.grid_remainder = grid_remainder
+        self.spectralon = spectralon
 
         self.wavelengths_original, self.bbl_original = validateWavelengths(
             wavelengths=self.wavelengths_original, bbl=self.bbl_original)
@@ -78,6 +125,8 @@ class ProcessEnviFile():
             self.bbl_original)
 
         self.grid_elements = None
+        self.integral_image = None
+        self.integral_image_mask = None
 
     def getMultipleSpectra(self):
         """
@@ -100,9 +149,8 @@ class ProcessEnviFile():
 
         """
         # get spectrum of the spectralon (= white reference)
-        spec_edges = self.getEdgesFromPrefix(prefix="spec")
-        df_spectralon = self.getMeanSpectrumFromRectangle(
-            edges=spec_edges, mode="max10")
+        df_spectralon = pd.DataFrame(data=[self.getSpectralon()],
+                                     columns=self.wavelengths)
 
         # loop over all zones and get spectra
         zone_spectra_cali = []
@@ -137,6 +185,8 @@ class ProcessEnviFile():
             Edges of the resulting rectangle
 
         """
+        if self.edges is not None:
+            return self.edges[prefix]
         edges = [self.positions[prefix+"_row_start"][self.index_of_meas],
                  self.positions[prefix+"_row_end"][self.index_of_meas],
                  self.positions[prefix+"_col_start"][self.index_of_meas],
@@ -167,32 +217,9 @@ class ProcessEnviFile():
         - implement statsmodels.robust.scale.Huber as robust mean
 
         """
-        spectrum_mean = []
-        for i in range(len(self.wavelengths_original)):
-            roi = []
-            for row in range(edges[0], edges[1]):
-                for col in range(edges[2], edges[3]):
-                    if self.mask is not None:
-                        if self.mask[row, col] == 1:
-                            continue
-                    roi.append(self.image[row, col, i])
-
-            if mode == "median":
-                spectrum_mean.append(np.median(roi))
-            elif mode == "mean":
-                spectrum_mean.append(np.mean(roi))
-            elif mode == "max":
-                spectrum_mean.append(np.max(roi))
-            elif mode == "max10":
-                spectrum_mean.append(np.mean(np.sort(roi)[-10:]))
-            elif mode == "std":
-                spectrum_mean.append(np.std(roi))
-
-        wavelengths, spectrum_mean = removeBadBands(
-            spectrum=spectrum_mean, wavelengths=self.wavelengths_original,
-            bbl=self.bbl_original)
-
-        df_spectrum = pd.DataFrame(data=[spectrum_mean], columns=wavelengths)
+        df_spectrum = pd.DataFrame(
+            data=self.getGridSpectra(edges, grid_real=(1, 1), mode=mode),
+            columns=self.wavelengths)
 
         return df_spectrum
 
@@ -211,22 +238,7 @@ class ProcessEnviFile():
             Number of grid rows and columns
 
         """
-        if not self.grid:
-            grid_n_rows = (edges[1] - edges[0])
-            grid_n_columns = (edges[3] - edges[2])
-
-        else:
-            if self.grid[0] == 0:
-                grid_n_rows = (edges[1] - edges[0])
-            else:
-                grid_n_rows = self.grid[0]
-
-            if self.grid[1] == 0:
-                grid_n_columns = (edges[3] - edges[2])
-            else:
-                grid_n_columns = self.grid[1]
-
-        return (grid_n_rows, grid_n_columns)
+        return getRealGridSize(edges, self.grid)
 
     def getMeanSpectraFromSquareGrid(self, edges, mode: str = "median"):
         """
@@ -247,19 +259,182 @@ class ProcessEnviFile():
 
         """
         grid_real = self.getRealGridSize(edges)
-        self.grid_elements = getGridElements(grid_real)
-        new_edges_list = getEdgesForGrid(edges, grid_real=grid_real)
+        _, self.grid_elements = getGridCells(edges, grid_real,
+                                             remainder=self.grid_remainder)
 
-        spectra_list = []
-        for new_edges in new_edges_list:
-            spectra_list.append(self.getMeanSpectrumFromRectangle(
-                edges=new_edges, mode=mode))
-        df = pd.concat(spectra_list, ignore_index=True)
-        df["GridElement_Row"] = [el[0] for el in self.grid_elements]
-        df["GridElement_Column"] = [el[1] for el in self.grid_elements]
+        df = pd.DataFrame(
+            data=self.getGridSpectra(edges, grid_real=grid_real, mode=mode),
+            columns=self.wavelengths)
+        df["GridElement_Row"] = self.grid_elements[:, 0]
+        df["GridElement_Column"] = self.grid_elements[:, 1]
 
         return df
 
+    def getGridSpectra(self, edges: list, grid_real, mode: str = "median"):
+        """
+        Get spectra of all grid elements inside a rectangle.
+
+        Parameters
+        ----------
+        edges : list of 4 int
+            Edges of the square (row_start, row_end, col_start, col_end)
+        grid_real : (int, int)
+            Number of grid rows and columns
+        mode : str
+            Mode for calculating the "mean spectrum". Possible values: median,
+            mean, max, max10 (= maximum of the top 10 pixels), std.
+
+        Returns
+        -------
+        np.ndarray
+            Spectra of the good bands with shape (grid elements, bands)
+
+        """
+        if self.use_integral_image and mode in ["mean", "std"]:
+            # the integral image itself is always float64 for accuracy
+            return getIntegralImageStatistics(
+                self.getIntegralImage(),
+                edges=getGridCells(edges, grid_real=grid_real,
+                                   remainder=self.grid_remainder)[0],
+                mode=mode).astype(self.dtype)
+
+        spectra = getBlockStatistics(
+            getGridBlocks(self.image, edges=edges, grid_real=grid_real,
+                          mask=self.getPixelMask(), dtype=self.dtype,
+                          remainder=self.grid_remainder),
+            mode=mode)
+        return spectra.reshape(-1, spectra.shape[-1])[:, self.getGoodBands()]
+
+    def getDenseReflectanceMap(self,
+                               window: tuple = (3, 3),
+                               stride: tuple = (1, 1),
+                               zone: str = None,
+                               mode: str = None) -> np.ndarray:
+        """
+        Get calibrated sliding-window statistics as dense reflectance map.
+
+        Parameters
+        ----------
+        window : tuple (int, int), optional (default=(3, 3))
+            Size of the window (rows, columns)
+        stride : tuple (int, int), optional (default=(1, 1))
+            Step between two windows (rows, columns)
+        zone : str or None, optional (default=None)
+            Name of the zone in the positions, e.g. "zone1". If None, the
+            whole image is used.
+        mode : str or None, optional (default=None)
+            Mode for calculating the "mean spectrum". If None, `stat_mode` is
+            used.
+
+        Returns
+        -------
+        np.ndarray
+            Reflectance map of the good bands with shape (window rows,
+            window columns, bands). Window (i, j) starts at pixel
+            (i*stride[0], j*stride[1]) of the image or the zone.
+
+        """
+        if mode is None:
+            mode = self.stat_mode
+
+        if zone is None:
+            edges = [0, self.image.shape[0], 0, self.image.shape[1]]
+        else:
+            edges = self.getEdgesFromPrefix(prefix=zone)
+        row_start, row_end, col_start, col_end = [int(e) for e in edges]
+
+        if self.use_integral_image and mode in ["mean", "std"]:
+            rows = np.arange(row_start, row_end - window[0] + 1, stride[0])
+            cols = np.arange(col_start, col_end - window[1] + 1, stride[1])
+            rows, cols = np.meshgrid(rows, cols, indexing="ij")
+            window_edges = np.stack([rows, rows + window[0],
+                                     cols, cols + window[1]], axis=-1)
+            spectra = getIntegralImageStatistics(
+                self.getIntegralImage(),
+                edges=window_edges.reshape(-1, 4),
+                mode=mode).astype(self.dtype)
+            spectra = spectra.reshape(rows.shape + (-1,))
+        else:
+            mask = self.getPixelMask()
+            if mask is not None:
+                mask = mask[row_start:row_end, col_start:col_end]
+            spectra = getWindowStatistics(
+                self.image[row_start:row_end, col_start:col_end, :],
+                window=window, stride=stride, mode=mode, mask=mask,
+                dtype=self.dtype)[:, :, self.getGoodBands()]
+
+        # no squeezing as in getCalibratedSpectrum to keep the map shape
+        return spectra / self.getSpectralon() * self.spectralon_factor
+
+    def getSpectralon(self) -> np.ndarray:
+        """
+        Get spectrum of the spectralon (white reference).
+
+        The spectrum is the maximum of the top 10 pixels (max10) of the spec
+        rectangle. It is calculated on the first call if not given.
+
+        Returns
+        -------
+        np.ndarray
+            Spectrum of the good bands
+
+        """
+        if self.spectralon is None:
+            self.spectralon = self.getGridSpectra(
+                self.getEdgesFromPrefix(prefix="spec"), grid_real=(1, 1),
+                mode="max10")[0]
+        return self.spectralon
+
+    def getIntegralImage(self) -> dict:
+        """
+        Get integral image of the good bands of the image.
+
+        The integral image is calculated on the first call and recalculated
+        only if the mask changes.
+
+        Returns
+        -------
+        dict
+            Integral image, see :func:`getIntegralImage`
+
+        """
+        if self.integral_image is None or self.integral_image_mask is not \
+                self.mask:
+            self.integral_image = getIntegralImage(
+                np.asarray(self.image[:, :])[:, :, self.getGoodBands()],
+                mask=self.getPixelMask())
+            self.integral_image_mask = self.mask
+        return self.integral_image
+
+    def getPixelMask(self):
+        """
+        Get mask of the pixels which are used for the statistics.
+
+        As in the pixel-wise implementation of this class, pixels with the
+        value one in `mask` are skipped.
+
+        Returns
+        -------
+        np.ndarray of bool or None
+            True = pixel is used, None if no mask is set
+
+        """
+        if self.mask is None:
+            return None
+        return np.asarray(self.mask) != 1
+
+    def getGoodBands(self):
+        """
+        Get boolean array of the bands marked as good in the bbl list.
+
+        Returns
+        -------
+        np.ndarray of bool
+            True for every good band of `wavelengths_original`
+
+        """
+        return np.array([int(b) == 1 for b in self.bbl_original], dtype=bool)
+
     def getCalibratedSpectra(self,
                              spectra: pd.DataFrame,
                              spectralon: pd.DataFrame) -> pd.DataFrame:
@@ -281,18 +456,52 @@ class ProcessEnviFile():
         """
         new_spectra = spectra.copy(deep=True)
 
-        def getCalibratedSpectrumSimple(x):
-            return getCalibratedSpectrum(
-                soil=x,
-                spectralon=spectralon[self.wavelengths],
-                spectralon_factor=self.spectralon_factor)
-
-        new_spectra[self.wavelengths] = spectra[self.wavelengths].apply(
-            getCalibratedSpectrumSimple, axis=1, raw=True)
+        soil = spectra[self.wavelengths].values
+        new_spectra[self.wavelengths] = getCalibratedSpectrum(
+            soil=soil,
+            spectralon=spectralon[self.wavelengths].values,
+            spectralon_factor=self.spectralon_factor,
+            dtype=self.dtype).reshape(soil.shape)
         return new_spectra
 
 
-def getEdgesForGrid(edges: list, grid_real):
+def getRealGridSize(edges: list, grid: tuple):
+    """
+    Calculate grid size.
+
+    Parameters
+    ----------
+    edges : list of 4 int
+        Edges of the square (row_start, row_end, col_start, col_end)
+    grid : tuple (int, int) or None
+        Size of the grid (rows, columns). If row/column zero, every pixel
+        is one row/column.
+
+    Returns
+    -------
+    (int, int)
+        Number of grid rows and columns
+
+    """
+    if not grid:
+        grid_n_rows = (edges[1] - edges[0])
+        grid_n_columns = (edges[3] - edges[2])
+
+    else:
+        if grid[0] == 0:
+            grid_n_rows = (edges[1] - edges[0])
+        else:
+            grid_n_rows = grid[0]
+
+        if grid[1] == 0:
+            grid_n_columns = (edges[3] - edges[2])
+        else:
+            grid_n_columns = grid[1]
+
+    return (grid_n_rows, grid_n_columns)
+
+
+def getEdgesForGrid(edges: list, grid_real, remainder: str = "drop"):
     """
     Calculate the grid geometry (edges).
 
@@ -302,6 +511,8 @@ def getEdgesForGrid(edges: list, grid_real):
         Edges of the square (row_start, row_end, col_start, col_end)
     grid_real : (int, int)
         Number of grid rows and columns
+    remainder : str, optional (default="drop")
+        Handling of the remaining pixels, see :func:`getGridCells`
 
     Returns
     -------
@@ -309,28 +520,466 @@ def getEdgesForGrid(edges: list, grid_real):
         New edges of the grid inside the rectangle.
 
     """
-    # calculating the height
-    height = int((edges[1] - edges[0]) / grid_real[0])
+    return getGridCells(edges, grid_real, remainder=remainder)[0].tolist()
+
+
+def getGridCells(edges: list, grid_real, remainder: str = "drop") -> tuple:
+    """
+    Calculate the edges and indices of all grid elements as arrays.
+
+    Parameters
+    ----------
+    edges : list of 4 int
+        Edges of the square (row_start, row_end, col_start, col_end)
+    grid_real : (int, int)
+        Number of grid rows and columns
+    remainder : str, optional (default="drop")
+        Handling of the pixels that do not fit into the grid. Possible values:
+        drop (all grid elements have the same size, the remaining pixels at
+        the end of the rows/columns are not used) and distribute (exactly
+        `grid_real` elements which cover all pixels, their sizes differ by up
+        to one pixel).
+
+    Returns
+    -------
+    cell_edges : np.ndarray of int
+        Edges (row_start, row_end, col_start, col_end) of the grid elements
+        with shape (grid elements, 4)
+    grid_index : np.ndarray of int
+        Grid row and column of the grid elements with shape
+        (grid elements, 2)
+
+    """
+    row_starts, row_ends = getGridBounds(edges[0], edges[1], grid_real[0],
+                                         remainder=remainder)
+    col_starts, col_ends = getGridBounds(edges[2], edges[3], grid_real[1],
+                                         remainder=remainder)
+
+    rows, cols = np.meshgrid(np.arange(len(row_starts)),
+                             np.arange(len(col_starts)), indexing="ij")
+    rows, cols = rows.ravel(), cols.ravel()
+    cell_edges = np.stack([row_starts[rows], row_ends[rows],
+                           col_starts[cols], col_ends[cols]], axis=1)
+    return cell_edges, np.stack([rows, cols], axis=1)
+
+
+def getGridBounds(start: int, end: int, n: int, remainder: str = "drop"):
+    """
+    Split a range of pixels into grid rows or columns.
+
+    Parameters
+    ----------
+    start, end : int
+        First and last (exclusive) pixel
+    n : int
+        Number of grid rows or columns
+    remainder : str, optional (default="drop")
+        Handling of the remaining pixels, see :func:`getGridCells`
+
+    Returns
+    -------
+    starts, ends : np.ndarray of int
+        First and last (exclusive) pixels of the grid rows or columns
+
+    Raises
+    ------
+    ValueError
+        Raised if `remainder` is unknown.
+
+    """
+    start, end, n = int(start), int(end), int(n)
+    if remainder == "drop":
+        # legacy geometry: integer size, as many elements as fit
+        size = int((end - start) / n)
+        starts = start + size*np.arange(int((end - start) / size))
+        return starts, starts + size
+    if remainder == "distribute":
+        bounds = start + (np.arange(n+1) * (end - start)) // n
+        return bounds[:-1], bounds[1:]
+    raise ValueError("Unknown remainder '{}'.".format(remainder))
+
+
+def getMappedGridBounds(start: int,
+                        end: int,
+                        n: int,
+                        target_start: int,
+                        target_end: int,
+                        remainder: str = "drop"):
+    """
+    Split a range of pixels into grid rows or columns of another image.
 
-    # calculating the width
-    width = int((edges[3] - edges[2]) / grid_real[1])
+    The range is split as in :func:`getGridBounds`. The bounds of the grid
+    rows or columns are then mapped proportionally to the target range,
+    e.g. from a zone in the hyperspectral image to the same zone in the
+    LWIR image. There is always the same number of grid rows or columns in
+    both images. If the target range is smaller than the number of grid
+    rows or columns, a target pixel is used by several of them.
 
-    # calculating starting points of the new rows and columns
-    new_row_starts = [int(edges[0] + height*i)
-                      for i in range(int((edges[1] - edges[0]) / height))]
-    new_col_starts = [int(edges[2] + width*i)
-                      for i in range(int((edges[3] - edges[2]) / width))]
+    Parameters
+    ----------
+    start, end : int
+        First and last (exclusive) pixel
+    n : int
+        Number of grid rows or columns
+    target_start, target_end : int
+        First and last (exclusive) pixel in the target image
+    remainder : str, optional (default="drop")
+        Handling of the remaining pixels, see :func:`getGridCells`
 
-    # calculating all edges of the grid
-    new_edges = []
-    for row_s in new_row_starts:
-        for col_s in new_col_starts:
-            new_edges.append([row_s, row_s+height, col_s, col_s+width])
+    Returns
+    -------
+    starts, ends : np.ndarray of int
+        First and last (exclusive) target pixels of the grid rows or columns
 
-    return new_edges
+    """
+    starts, ends = getGridBounds(start, end, n, remainder=remainder)
+    start, end = int(start), int(end)
+    target_start, target_end = int(target_start), int(target_end)
+    target_size = target_end - target_start
+    starts = target_start + (starts - start) * target_size // (end - start)
+    ends = target_start + (ends - start) * target_size // (end - start)
+
+    # every grid row or column covers at least one target pixel
+    starts = np.minimum(starts, target_end - 1)
+    ends = np.maximum(ends, starts + 1)
+    return starts, ends
+
+
+def getGridBlocks(data,
+                  edges: list,
+                  grid_real,
+                  mask=None,
+                  dtype=float,
+                  remainder: str = "drop") -> np.ndarray:
+    """
+    Get the pixels of all grid elements inside a rectangle as one array.
 
+    The grid geometry is the same as in :func:`getGridCells`. The
+    rectangle is read once and reshaped, i.e. there is no loop over the grid
+    elements. Together with :func:`getBlockStatistics`, this is the block
+    reduction used for the hyperspectral and the LWIR data.
 
-def getEnviFile(filepath):
+    Parameters
+    ----------
+    data : array-like
+        Data with shape (rows, columns, ...), e.g. a hyperspectral image
+        (rows, columns, bands) or LWIR frames (rows, columns, frames)
+    edges : list of 4 int
+        Edges of the square (row_start, row_end, col_start, col_end)
+    grid_real : (int, int)
+        Number of grid rows and columns
+    mask : 2D array of bool or None, optional (default=None)
+        Mask in the shape of `data` (rows, columns). False = pixel is not
+        used. Masked pixels are set to NaN.
+    dtype : np.dtype, optional (default=float)
+        Floating point data type of the blocks
+    remainder : str, optional (default="drop")
+        Handling of the remaining pixels, see :func:`getGridCells`. With
+        distribute, smaller grid elements are padded with NaN.
+
+    Returns
+    -------
+    blocks : np.ndarray of float
+        Pixels of the grid elements with shape
+        (grid rows, grid columns, pixels per element, ...)
+
+    """
+    row_starts, row_ends = getGridBounds(edges[0], edges[1], grid_real[0],
+                                         remainder=remainder)
+    col_starts, col_ends = getGridBounds(edges[2], edges[3], grid_real[1],
+                                         remainder=remainder)
+    return getBlocksFromBounds(data, (row_starts, row_ends),
+                               (col_starts, col_ends), mask=mask, dtype=dtype)
+
+
+def getBlocksFromBounds(data,
+                        row_bounds,
+                        col_bounds,
+                        mask=None,
+                        dtype=float) -> np.ndarray:
+    """
+    Get the pixels of grid elements with given bounds as one array.
+
+    Parameters
+    ----------
+    data : array-like
+        Data with shape (rows, columns, ...)
+    row_bounds, col_bounds : (np.ndarray, np.ndarray)
+        First and last (exclusive) pixels of the grid rows and columns, see
+        :func:`getGridBounds`. The grid elements may overlap.
+    mask : 2D array of bool or None, optional (default=None)
+        Mask in the shape of `data` (rows, columns). False = pixel is not
+        used. Masked pixels are set to NaN.
+    dtype : np.dtype, optional (default=float)
+        Floating point data type of the blocks
+
+    Returns
+    -------
+    blocks : np.ndarray of float
+        Pixels of the grid elements with shape
+        (grid rows, grid columns, pixels per element, ...). Smaller grid
+        elements are padded with NaN.
+
+    """
+    row_starts, row_ends = row_bounds
+    col_starts, col_ends = col_bounds
+    n_rows, n_cols = len(row_starts), len(col_starts)
+    height = int(np.max(row_ends - row_starts))
+    width = int(np.max(col_ends - col_starts))
+    row_slice = slice(row_starts[0], row_ends[-1])
+    col_slice = slice(col_starts[0], col_ends[-1])
+
+    roi = np.asarray(data[row_slice, col_slice], dtype=dtype)
+    valid = None
+    if mask is not None:
+        valid = np.asarray(mask, dtype=bool)[row_slice, col_slice]
+
+    if (n_rows*height == roi.shape[0] and n_cols*width == roi.shape[1] and
+            np.array_equal(row_starts[1:], row_ends[:-1]) and
+            np.array_equal(col_starts[1:], col_ends[:-1])):
+        # all grid elements have the same size: reshape without a copy
+        blocks = roi.reshape((n_rows, height, n_cols, width) + roi.shape[2:])
+        blocks = np.swapaxes(blocks, 1, 2)
+        if valid is not None:
+            valid = np.swapaxes(
+                valid.reshape(n_rows, height, n_cols, width), 1, 2)
+    else:
+        # pad the smaller grid elements to the size of the largest ones
+        rows = row_starts[:, None] - row_starts[0] + np.arange(height)
+        cols = col_starts[:, None] - col_starts[0] + np.arange(width)
+        row_inside = rows < (row_ends - row_starts[0])[:, None]
+        col_inside = cols < (col_ends - col_starts[0])[:, None]
+        inside = row_inside[:, None, :, None] & col_inside[None, :, None, :]
+        rows = np.minimum(rows, roi.shape[0] - 1)[:, None, :, None]
+        cols = np.minimum(cols, roi.shape[1] - 1)[None, :, None, :]
+        blocks = roi[rows, cols]
+        valid = inside if valid is None else inside & valid[rows, cols]
+
+    blocks = blocks.reshape((n_rows, n_cols, height*width) + roi.shape[2:])
+    if valid is not None:
+        # do not write NaN into the data, e.g. a read-only shared cube
+        if np.may_share_memory(blocks, roi):
+            blocks = blocks.copy()
+        blocks[~valid.reshape(n_rows, n_cols, height*width)] = np.nan
+
+    return blocks
+
+
+def getBlockStatistics(blocks: np.ndarray,
+                       mode: str = "median",
+                       axis=2,
+                       ignore_nan: bool = True) -> np.ndarray:
+    """
+    Reduce the pixels of grid elements to one statistic per element.
+
+    Parameters
+    ----------
+    blocks : np.ndarray
+        Pixels of the grid elements as from :func:`getGridBlocks` with shape
+        (grid rows, grid columns, pixels per element, ...)
+    mode : str
+        Mode for calculating the "mean spectrum". Possible values: median,
+        mean, max, max10 (= maximum of the top 10 pixels), std.
+    axis : int or tuple of int, optional (default=2)
+        Axis (or axes) of the pixels
+    ignore_nan : bool, optional (default=True)
+        If true, NaN pixels (e.g. masked) are ignored. Otherwise, the faster
+        functions without NaN handling are used.
+
+    Returns
+    -------
+    np.ndarray
+        Statistic with shape (grid rows, grid columns, ...)
+
+    Raises
+    ------
+    ValueError
+        Raised if `mode` is unknown.
+
+    """
+    functions = {"median": (np.median, np.nanmedian),
+                 "mean": (np.mean, np.nanmean),
+                 "max": (np.max, np.nanmax),
+                 "max10": (np.mean, np.nanmean),
+                 "std": (np.std, np.nanstd)}
+    if mode not in functions:
+        raise ValueError("Unknown mode {0}.".format(mode))
+    function = functions[mode][int(ignore_nan)]
+
+    with warnings.catch_warnings():
+        # all-NaN elements (fully masked) result in NaN
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        if mode != "max10":
+            return function(blocks, axis=axis)
+
+        # merge multiple pixel axes into the last axis
+        if isinstance(axis, tuple):
+            blocks = np.moveaxis(blocks, axis, range(-len(axis), 0))
+            blocks = blocks.reshape(blocks.shape[:-len(axis)] + (-1,))
+            axis = -1
+
+        # descending order, NaNs are sorted to the end
+        blocks = -np.sort(-blocks, axis=axis)
+        return function(np.take(blocks, np.arange(min(10, blocks.shape[
+            axis])), axis=axis), axis=axis)
+
+
+def getWindowStatistics(data,
+                        window: tuple = (3, 3),
+                        stride: tuple = (1, 1),
+                        mode: str = "median",
+                        mask=None,
+                        dtype=float) -> np.ndarray:
+    """
+    Get statistics of a sliding window over an image.
+
+    The windows are strided views of the image, i.e. the pixels are not
+    copied per window.
+
+    Parameters
+    ----------
+    data : array-like
+        Image with shape (rows, columns, bands)
+    window : tuple (int, int), optional (default=(3, 3))
+        Size of the window (rows, columns)
+    stride : tuple (int, int), optional (default=(1, 1))
+        Step between two windows (rows, columns)
+    mode : str, optional (default="median")
+        Mode for calculating the "mean spectrum". Possible values: median,
+        mean, max, max10 (= maximum of the top 10 pixels), std.
+    mask : 2D array of bool or None, optional (default=None)
+        Mask in the shape (rows, columns). False = pixel is not used.
+    dtype : np.dtype, optional (default=float)
+        Floating point data type of the statistic
+
+    Returns
+    -------
+    np.ndarray
+        Statistic with shape (window rows, window columns, bands). Window
+        (i, j) starts at pixel (i*stride[0], j*stride[1]).
+
+    """
+    data = np.asarray(data, dtype=dtype)
+    if mask is not None:
+        data = np.where(np.asarray(mask, dtype=bool)[:, :, np.newaxis],
+                        data, np.array(np.nan, dtype=dtype))
+
+    if data.shape[0] < window[0] or data.shape[1] < window[1]:
+        raise ValueError("Window {0} is larger than the image {1}.".format(
+            window, data.shape[:2]))
+
+    # shape (window rows, window columns, bands, window[0], window[1])
+    row_stride, col_stride, band_stride = data.strides
+    windows = np.lib.stride_tricks.as_strided(
+        data,
+        shape=((data.shape[0] - window[0]) // stride[0] + 1,
+               (data.shape[1] - window[1]) // stride[1] + 1,
+               data.shape[2], window[0], window[1]),
+        strides=(row_stride*stride[0], col_stride*stride[1], band_stride,
+                 row_stride, col_stride),
+        writeable=False)
+
+    return getBlockStatistics(windows, mode=mode, axis=(3, 4),
+                              ignore_nan=mask is not None)
+
+
+def getIntegralImage(data, mask=None) -> dict:
+    """
+    Get integral image (summed-area table) of an image.
+
+    With the integral image, the mean and standard deviation of any
+    rectangle can be calculated with four lookups per band, see
+    :func:`getIntegralImageStatistics`. The values are shifted by the mean of
+    every band for numerical stability. Compared to the direct calculation,
+    the mean is exact up to about 1e-10 and the standard deviation up to
+    about 1e-3 sensor counts (worst case for single-pixel rectangles).
+
+    Parameters
+    ----------
+    data : array-like
+        Image with shape (rows, columns, bands)
+    mask : 2D array of bool or None, optional (default=None)
+        Mask in the shape (rows, columns). False = pixel is not used.
+
+    Returns
+    -------
+    integral_image : dict
+        Dictionary with the keys "sum" and "sum_sq" (cumulative sums of the
+        shifted values and their squares with shape (rows+1, columns+1,
+        bands)), "count" (cumulative number of used pixels with shape
+        (rows+1, columns+1)), and "shift" (mean of every band)
+
+    """
+    data = np.asarray(data, dtype=float)
+    if mask is None:
+        mask = np.ones(data.shape[:2], dtype=bool)
+    mask = np.asarray(mask, dtype=bool)
+
+    shift = np.zeros(data.shape[2])
+    if mask.any():
+        shift = data[mask].mean(axis=0)
+    centered = np.where(mask[:, :, np.newaxis], data - shift, 0.)
+
+    integral_image = {"shift": shift}
+    for key, values in [("sum", centered), ("sum_sq", centered**2),
+                        ("count", mask.astype(float))]:
+        table = np.zeros((data.shape[0]+1, data.shape[1]+1) +
+                         values.shape[2:])
+        table[1:, 1:] = values.cumsum(axis=0).cumsum(axis=1)
+        integral_image[key] = table
+    return integral_image
+
+
+def getIntegralImageStatistics(integral_image: dict,
+                               edges,
+                               mode: str = "mean") -> np.ndarray:
+    """
+    Get mean or standard deviation of rectangles from an integral image.
+
+    Parameters
+    ----------
+    integral_image : dict
+        Integral image, see :func:`getIntegralImage`
+    edges : array-like of int
+        Edges (row_start, row_end, col_start, col_end) of the rectangles with
+        shape (rectangles, 4)
+    mode : str, optional (default="mean")
+        Possible values: mean, std.
+
+    Returns
+    -------
+    np.ndarray
+        Statistic with shape (rectangles, bands). NaN for rectangles without
+        used pixels.
+
+    Raises
+    ------
+    ValueError
+        Raised if `mode` is neither mean nor std.
+
+    """
+    if mode not in ["mean", "std"]:
+        raise ValueError("Mode {0} is not possible with an integral "
+                         "image.".format(mode))
+    row_start, row_end, col_start, col_end = np.asarray(
+        edges, dtype=int).reshape(-1, 4).T
+
+    def getRectangleSums(table):
+        return (table[row_end, col_end] - table[row_start, col_end] -
+                table[row_end, col_start] + table[row_start, col_start])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        count = getRectangleSums(integral_image["count"])[:, np.newaxis]
+        count = np.where(count > 0, count, np.nan)
+        mean_shifted = getRectangleSums(integral_image["sum"]) / count
+        if mode == "mean":
+            return mean_shifted + integral_image["shift"]
+        variance = (getRectangleSums(integral_image["sum_sq"]) / count -
+                    mean_shifted**2)
+    return np.sqrt(np.maximum(variance, 0.))
+
+
+def getEnviFile(filepath, header_cache=None):
     """
     Read from envi file.
 
@@ -344,6 +993,8 @@ def getEnviFile(filepath):
     ----------
     filepath : str
         Path to header file
+    header_cache : EnviHeaderCache or None, optional (default=None)
+        Cache for the list fields of the header, see :func:`getEnviHeader`.
 
     Returns
     -------
@@ -358,15 +1009,72 @@ def getEnviFile(filepath):
         See here: http://www.spectralpython.net/fileio.html
 
     """
-    spy.settings.envi_support_nonlowercase_params = True
+    if not spy.settings.envi_support_nonlowercase_params:
+        spy.settings.envi_support_nonlowercase_params = True
 
-    header = getEnviHeader(filepath)
+    header = getEnviHeader(filepath, header_cache=header_cache)
     image = spy.io.envi.open(filepath, filepath[:-3]+"cue")
 
     return header, image
 
 
-def getEnviHeader(filepath):
+def isEmptyImage(image, bands: tuple = (5,), pixel_step: int = 1) -> bool:
+    """
+    Check if a hyperspectral image is empty (e.g. failed acquisition).
+
+    Only a sample of the image is read: the given bands and every
+    `pixel_step`-th row and column. For ENVI files, the sample is read from
+    the memory-mapped file.
+
+    Parameters
+    ----------
+    image : spectral image or array-like
+        Image with shape (rows, columns, bands)
+    bands : tuple of int, optional (default=(5,))
+        Bands of the sample
+    pixel_step : int, optional (default=1)
+        Step between the rows and columns of the sample. With a step larger
+        than one, an image is also regarded as empty if only pixels outside
+        the sample are not zero.
+
+    Returns
+    -------
+    bool
+        True if all values of the sample are zero
+
+    """
+    return not any(np.any(readBand(image, band)[::pixel_step, ::pixel_step])
+                   for band in bands)
+
+
+def readBand(image, band: int) -> np.ndarray:
+    """
+    Read one band of a hyperspectral image as array.
+
+    For ENVI files, the band is a view of the memory-mapped file, i.e. the
+    values are read on access only. Otherwise, it is read as one block.
+
+    Parameters
+    ----------
+    image : spectral image or array-like
+        Image with shape (rows, columns, bands)
+    band : int
+        Index of the band
+
+    Returns
+    -------
+    np.ndarray
+        Band with shape (rows, columns)
+
+    """
+    if getattr(image, "using_memmap", False):
+        return image.open_memmap(interleave="bip")[:, :, band]
+    if hasattr(image, "read_band"):
+        return image.read_band(band)
+    return np.asarray(image)[:, :, band]
+
+
+def getEnviHeader(filepath, header_cache=None):
     """
     Read envi header file.
 
@@ -374,6 +1082,10 @@ def getEnviHeader(filepath):
     ----------
     filepath : str
         Path to header file
+    header_cache : EnviHeaderCache or None, optional (default=None)
+        If None, the header is read with the `spectral` package. Otherwise,
+        the header is read with :func:`parseEnviHeader` and the list fields
+        are shared via the cache.
 
     Returns
     -------
@@ -384,10 +1096,137 @@ def getEnviHeader(filepath):
         wavelength, wavelength units.
 
     """
+    if header_cache is not None:
+        return parseEnviHeader(filepath, header_cache=header_cache)
     header = spy.io.envi.read_envi_header(filepath)
     return header
 
 
+class EnviHeaderCache():
+    """
+    Cache for the list fields (e.g. wavelength, bbl) of ENVI headers.
+
+    Within a measurement, the list fields of all headers are identical. The
+    cache parses each distinct list field only once and returns the same
+    read-only numpy array for all headers containing it.
+
+    """
+
+    def __init__(self):
+        """Initialize EnviHeaderCache instance."""
+        self.fields_by_text = {}
+        self.fields_by_values = {}
+
+    def __len__(self):
+        """Get number of distinct list fields in the cache."""
+        return len(self.fields_by_values)
+
+    def getListField(self, value: str) -> np.ndarray:
+        """
+        Get parsed list field.
+
+        Parameters
+        ----------
+        value : str
+            Raw value of the field in the header including the braces
+
+        Returns
+        -------
+        np.ndarray of str
+            Read-only array of the list entries
+
+        """
+        field = self.fields_by_text.get(value)
+        if field is None:
+            field = parseEnviListField(value)
+            field = self.fields_by_values.setdefault(tuple(field), field)
+            self.fields_by_text[value] = field
+        return field
+
+
+def parseEnviHeader(filepath, header_cache=None) -> dict:
+    """
+    Read envi header file without the `spectral` package.
+
+    The result has the same keys as :func:`getEnviHeader`, but list fields
+    are returned as read-only numpy arrays of str instead of lists.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to header file
+    header_cache : EnviHeaderCache or None, optional (default=None)
+        Cache to share identical list fields between headers
+
+    Returns
+    -------
+    header : dict
+        Header fields. The keys keep their capitalization.
+
+    Raises
+    ------
+    IOError
+        Raised if the file is not a valid ENVI header.
+
+    """
+    with open(filepath, "r") as f:
+        if not f.readline().strip().startswith("ENVI"):
+            raise IOError("{0} is not an ENVI header.".format(filepath))
+        lines = f.read().splitlines()
+
+    header = {}
+    line_iter = iter(lines)
+    for line in line_iter:
+        if line.startswith(";") or "=" not in line:
+            continue
+        key, _, value = line.partition("=")
+        key = key.strip()
+        value = value.strip()
+
+        if not value.startswith("{"):
+            header[key] = value
+            continue
+
+        # collect multi-line values in braces
+        while not value.endswith("}"):
+            try:
+                line = next(line_iter)
+            except StopIteration:
+                raise IOError("Field {0} in {1} is not closed.".format(
+                    key, filepath))
+            if not line.startswith(";"):
+                value += "\n" + line.strip()
+
+        if key == "description":
+            header[key] = value.strip("{}").strip()
+        elif header_cache is not None:
+            header[key] = header_cache.getListField(value)
+        else:
+            header[key] = parseEnviListField(value)
+
+    return header
+
+
+def parseEnviListField(value: str) -> np.ndarray:
+    """
+    Parse list field of an ENVI header, e.g. "{0 ,450 ,454}".
+
+    Parameters
+    ----------
+    value : str
+        Raw value of the field in the header including the braces
+
+    Returns
+    -------
+    np.ndarray of str
+        Read-only array of the list entries
+
+    """
+    field = np.array([v.strip() for v in value[1:-1].split(",")])
+    field.flags.writeable = False
+    return field
+
+
 def readEnviHeader(header):
     """
     Read out the header of the ENVI file.
@@ -425,7 +1264,7 @@ def readEnviHeader(header):
 
 def formatTime(time, ampm):
     """
-    Format time from 6:02PM to 18:02 (or 10:02PM to 22:02).
+    Format time from 6:02PM to 18:02 (or 10:02PM to 22:02, 12:02AM to 0:02).
 
     Parameters
     ----------
@@ -441,14 +1280,82 @@ def formatTime(time, ampm):
 
     """
     hour, minute, second = time.split(":")
-    if ampm[0] == "P" and int(hour) < 12:
-        newtime = str((int(hour) + 12) % 24) + ":" + minute + ":" + second
-    else:
-        newtime = time
+    # 12:02AM is 0:02 and 12:02PM is 12:02
+    hour = int(hour) % 12 + (12 if ampm[0] == "P" else 0)
+    newtime = str(hour) + ":" + minute + ":" + second
     return newtime
 
 
-def getCalibratedSpectrum(soil, spectralon, spectralon_factor: float = 0.95):
+def readEnviDescription(filepath) -> str:
+    """
+    Read only the description field of an envi header file.
+
+    The header is read line by line until the description is complete, so the
+    long list fields (e.g. wavelength, bbl) are not read.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to header file
+
+    Returns
+    -------
+    str
+        Description as in :func:`getEnviHeader`, empty if not available
+
+    """
+    with open(filepath, "r") as f:
+        for line in f:
+            key, _, value = line.partition("=")
+            if key.strip() != "description":
+                continue
+            value = value.strip()
+            while not value.endswith("}"):
+                line = f.readline()
+                if not line:
+                    break
+                if not line.startswith(";"):
+                    value += "\n" + line.strip()
+            return value.strip("{}").strip()
+    return ""
+
+
+def getDatetimesFromDescriptions(descriptions,
+                                 timezone: str = "+02:00") -> pd.Series:
+    """
+    Get datetimes from the descriptions of multiple envi headers.
+
+    All descriptions are parsed in one vectorized step. The description
+    contains e.g. "Date: 05/17/2017," and "Time: 6:02:24.34 P,".
+
+    Parameters
+    ----------
+    descriptions : list of str
+        Descriptions of the envi headers, see :func:`readEnviDescription`
+    timezone : str, optional (default="+02:00")
+        Timezone of the camera clock, either as UTC offset (e.g. "+02:00") or
+        as name (e.g. "Europe/Berlin").
+
+    Returns
+    -------
+    pd.Series
+        Datetimes in UTC. Descriptions which cannot be parsed result in NaT.
+
+    """
+    parts = pd.Series(descriptions, dtype=str).str.extract(
+        r"Date:\s*(?P<date>[\d/]+).*?"
+        r"Time:\s*(?P<time>\d+:\d+:\d+)[\d.]*\s*(?P<ampm>[AP])",
+        flags=re.DOTALL)
+    datetimes = pd.to_datetime(
+        parts["date"] + " " + parts["time"] + " " + parts["ampm"] + "M",
+        format="%m/%d/%Y %I:%M:%S %p", errors="coerce")
+    return datetimes.dt.tz_localize(timezone).dt.tz_convert("UTC")
+
+
+def getCalibratedSpectrum(soil,
+                          spectralon,
+                          spectralon_factor: float = 0.95,
+                          dtype=float):
     """
     Calibrate hyperspectral spectrum from soil via spectralon.
 
@@ -463,6 +1370,8 @@ def getCalibratedSpectrum(soil, spectralon, spectralon_factor: float = 0.95):
         Spectrum of the spectralon.
     spectralon_factor : float
         Factor of how much solar radiation the spectralon reflects.
+    dtype : np.dtype, optional (default=float)
+        Floating point data type of the calculation
 
     Returns
     -------
@@ -470,8 +1379,8 @@ def getCalibratedSpectrum(soil, spectralon, spectralon_factor: float = 0.95):
         List of reflectance values for each band of the soil image.
 
     """
-    return np.divide(np.squeeze(soil).astype(float),
-                     np.squeeze(spectralon).astype(float)) * spectralon_factor
+    return np.divide(np.squeeze(soil).astype(dtype),
+                     np.squeeze(spectralon).astype(dtype)) * spectralon_factor
 
 
 def validateWavelengths(wavelengths: list, bbl: list):
@@ -8,20 +8,56 @@ installation of the package into the `hprocessing/` folder:
     wget -P hprocessing/ https://raw.githubusercontent.com/felixriese/thermal
         -image-processing/master/tiprocessing/IRUtils.py
 
+IRUtils.py, tqdm, and the submodules Preprocessing and SpectralStore are
+only imported when they are used.
+
 """
 
+import collections
+import concurrent.futures
 import configparser
+import functools
 import glob
 import itertools
 import os
+import queue
+import threading
 
 import numpy as np
 import pandas as pd
-from tqdm import tqdm
 
-from .ProcessEnviFile import (ProcessEnviFile, getEnviFile, getEnviHeader,
+from .ProcessEnviFile import (EnviHeaderCache, ProcessEnviFile,
+                              getBlockStatistics, getDatetimesFromDescriptions,
+                              getBlocksFromBounds, getEnviFile, getEnviHeader,
+                              getGridBlocks, getGridBounds,
+                              getMappedGridBounds, getRealGridSize,
+                              isEmptyImage, readEnviDescription,
                               readEnviHeader)
-from .IRUtils import getIRDataFromMultipleZones
+
+__all__ = [
+    "ProcessFullDataset", "ZONE_DICT", "EnviPrefetcher", "MeasurementGeometry",
+    "SoilMoistureSensorRegistry", "SpectralonCache", "fillSpectralonCache",
+    "filterEmptyImages", "findNearestDate", "findNearestDates",
+    "getAllSoilMoistureSensors", "getFirstIndex", "getHighresHeaderPath",
+    "getHyperspectralCatalog", "getHyperspectralFiles",
+    "getHyperspectralTasks", "getIgnoreRules", "getLineFromPoints",
+    "getLwirCatalog", "getLwirDataBatch", "getLwirFrames",
+    "getLwirGridStatistics", "getLwirMeasurementIndex", "getLwirZoneEdges",
+    "getLwirZoneStatistics", "getMask", "getMaskFromParameters",
+    "getMaskParameters", "getOutputPath", "getProcessingParameters",
+    "getSoilMoistureIndex", "getSoilMoistureSensorRegistry",
+    "getSpectralonCache", "getSpectralonEntry", "getSpectralonKey",
+    "getUppermostSoilMoistureSensors", "getWoodenBarMask", "initSharedWorker",
+    "isOccludedSpectralon", "loadSoilMoistureSensorRegistry",
+    "processHydReSGeoDataset", "processImage", "processImages",
+    "processImagesShared", "processSharedImage", "putSpectralonEntry",
+    "readConfig", "readLongFormat", "saveLongFormat", "saveOutput",
+    "splitSpectra"]
+
+# improvised solution to translate between zone1-8 to A1-D2
+ZONE_DICT = {
+    "A1": "zone1", "A2": "zone2", "B1": "zone3", "B2": "zone4",
+    "C1": "zone5", "C2": "zone6", "D1": "zone7", "D2": "zone8"}
 
 
 class ProcessFullDataset():
@@ -63,6 +99,76 @@ class ProcessFullDataset():
         pixels), std.
     hyp_spectralon_factor : float, optional (default=0.95)
         Factor of how much solar radiation the spectralon reflects.
+    hyp_spectralon_cache : SpectralonCache or None, optional (default=None)
+        Cache of the spectralon spectra. If given, the spectrum of this image
+        is taken from the cache or added to it. If None, it is calculated.
+        An image added here is only compared with the images already in the
+        cache, see :func:`fillSpectralonCache` to add all images first.
+    hyp_spectralon_reuse : str, optional (default="none")
+        Handling of an occluded spectralon (requires `hyp_spectralon_cache`):
+        none (use it anyway), nearest (spectrum of the nearest image), or
+        interpolate (spectra of the images before and after), see
+        :meth:`SpectralonCache.getReference`.
+    hyp_spectralon_window : float, optional (default=30)
+        Width of the time window (in minutes) of the images whose spectralon
+        can be reused.
+    hyp_spectralon_min_ratio : float, optional (default=0.5)
+        Minimum ratio of the spectralon to the ones of other images, below
+        the spectralon is occluded, see :func:`isOccludedSpectralon`.
+    hyp_preprocessing : tuple of str, optional (default=())
+        Preprocessing steps of the calibrated spectra, e.g. ("savgol",
+        "derivative"), see :func:`hprocessing.Preprocessing.preprocessSpectra`.
+        Empty = no preprocessing.
+    hyp_savgol_window : int, optional (default=11)
+        Window length (in bands) of the Savitzky-Golay filter
+    hyp_savgol_polyorder : int, optional (default=2)
+        Order of the polynomials of the Savitzky-Golay filter
+    hyp_integral_image : bool, optional (default=False)
+        If true, the hyperspectral modes mean and std are calculated from an
+        integral image, see :class:`hprocessing.ProcessEnviFile.ProcessEnviFile`.
+    hyp_dtype : str, optional (default="float64")
+        Working data type of the hyperspectral statistics and spectra, e.g.
+        "float32", see :class:`hprocessing.ProcessEnviFile.ProcessEnviFile`.
+    grid_remainder : str, optional (default="drop")
+        Handling of the pixels that do not fit into the grid (drop or
+        distribute), see :func:`hprocessing.ProcessEnviFile.getGridCells`.
+        Used for the hyperspectral and the grid-wise LWIR data.
+    timezone : str, optional (default="+02:00")
+        Timezone of the hyperspectral and LWIR camera clocks, either as UTC
+        offset (e.g. "+02:00") or as name (e.g. "Europe/Berlin").
+    hyp_datetime : pd.Timestamp or None, optional (default=None)
+        Already parsed datetime (UTC) of the image, e.g. from
+        :func:`getHyperspectralCatalog`. If None, it is read from the header.
+    lwir_data : pd.DataFrame or None, optional (default=None)
+        Already extracted LWIR data of this image with the columns zone, mean,
+        med, and std, e.g. from :func:`getLwirDataBatch`. If None, the LWIR
+        data is read in :meth:`getLwirData`.
+    lwir_grid : bool, optional (default=False)
+        If true, the LWIR data is extracted for every grid element of the
+        hyperspectral zones (see :meth:`getLwirGridData`). Otherwise, it is
+        extracted zone-wise.
+    hyp_files : tuple or None, optional (default=None)
+        Already read (header, image, highres header) of `hyp_hdr_path`, e.g.
+        from :class:`EnviPrefetcher`. If None, the files are read on first
+        access of `hdr`, `envi_img`, or `hdr_highres`.
+    header_cache : EnviHeaderCache or None, optional (default=None)
+        Cache for the list fields of the headers, see
+        :func:`hprocessing.ProcessEnviFile.getEnviHeader`.
+    empty_check_bands : tuple of int, optional (default=(5,))
+        Bands of the sample to check if the image is empty, see
+        :func:`hprocessing.ProcessEnviFile.isEmptyImage`.
+    empty_check_step : int, optional (default=1)
+        Step between the rows and columns of the sample to check if the
+        image is empty.
+    sensor_registry : SoilMoistureSensorRegistry or None, optional
+        Registry of the soil moisture sensors. If None, the sensors of the
+        HydReSGeo dataset are used, see :func:`getSoilMoistureSensorRegistry`.
+    geometry : MeasurementGeometry or None, optional (default=None)
+        Compiled `positions_hyp` and `masks` of all measurements. If None, it
+        is compiled on first access.
+    soilmoisture_data : dict or None, optional (default=None)
+        Already read soil moisture data, see :func:`getSoilMoistureIndex`.
+        If None, it is read from `soilmoisture_path`.
     verbose : int, optional (default=0)
         Controls the verbosity.
 
@@ -88,6 +194,27 @@ class ProcessFullDataset():
                  time_window_width: int = 6,
                  hyp_stat_mode: str = "median",
                  hyp_spectralon_factor: float = 0.95,
+                 hyp_spectralon_cache=None,
+                 hyp_spectralon_reuse: str = "none",
+                 hyp_spectralon_window: float = 30,
+                 hyp_spectralon_min_ratio: float = 0.5,
+                 hyp_preprocessing: tuple = (),
+                 hyp_savgol_window: int = 11,
+                 hyp_savgol_polyorder: int = 2,
+                 hyp_integral_image: bool = False,
+                 hyp_dtype: str = "float64",
+                 grid_remainder: str = "drop",
+                 timezone: str = "+02:00",
+                 hyp_datetime: pd.Timestamp = None,
+                 lwir_data: pd.DataFrame = None,
+                 lwir_grid: bool = False,
+                 hyp_files: tuple = None,
+                 header_cache: EnviHeaderCache = None,
+                 empty_check_bands: tuple = (5,),
+                 empty_check_step: int = 1,
+                 sensor_registry=None,
+                 geometry=None,
+                 soilmoisture_data: dict = None,
                  verbose=0):
         """Initialize ProcessDataset instance."""
         self.hyp_hdr_path = hyp_hdr_path
@@ -103,32 +230,133 @@ class ProcessFullDataset():
         self.time_window_width = time_window_width
         self.hyp_stat_mode = hyp_stat_mode
         self.hyp_spectralon_factor = hyp_spectralon_factor
+        self.hyp_spectralon_cache = hyp_spectralon_cache
+        self.hyp_spectralon_reuse = hyp_spectralon_reuse
+        self.hyp_spectralon_window = hyp_spectralon_window
+        self.hyp_spectralon_min_ratio = hyp_spectralon_min_ratio
+        self.hyp_preprocessing = hyp_preprocessing
+        self.hyp_savgol_window = hyp_savgol_window
+        self.hyp_savgol_polyorder = hyp_savgol_polyorder
+        self.hyp_integral_image = hyp_integral_image
+        self.hyp_dtype = hyp_dtype
+        self.grid_remainder = grid_remainder
+        self.timezone = timezone
+        self.lwir_data = lwir_data
+        self.lwir_grid = lwir_grid
+        self.empty_check_bands = empty_check_bands
+        self.empty_check_step = empty_check_step
+        self.sensor_registry = sensor_registry
+        self._geometry = geometry
+        self.soilmoisture_data = soilmoisture_data
+        if sensor_registry is None:
+            self.sensor_registry = getSoilMoistureSensorRegistry()
         self.verbose = verbose
 
-        # get Envi files
-        self.envi_hdr_highres_path = self.hyp_hdr_path[:-4] + "_highres.hdr"
-        self.hdr, self.envi_img = getEnviFile(self.hyp_hdr_path)
-        self.hdr_highres = getEnviHeader(self.envi_hdr_highres_path)
-        self.date, self.time = readEnviHeader(self.hdr_highres)
+        self.header_cache = header_cache
 
-        # set datetime TODO: remove hard-coded timezone
-        self.datetime = pd.to_datetime(self.date+" "+self.time+"+02:00",
-                                       utc=True)
+        # the ENVI files, the datetime, and the measurement index are loaded
+        # on first access only
+        self.envi_hdr_highres_path = getHighresHeaderPath(self.hyp_hdr_path)
+        self._hyp_files = hyp_files
+        self._hdr_highres = None
+        if hyp_files is not None:
+            self._hdr_highres = hyp_files[2]
+        self._datetime = None
+        if not pd.isnull(hyp_datetime):
+            self._datetime = hyp_datetime
+        self._index_of_meas = None
 
-        # read out header file
-        self.wavelengths = self.hdr_highres["Wavelength"]
-        self.bbl = self.hdr_highres["bbl"]
+        self.mask = None
+        self.hyp_wavelengths = None
+
+        self.zone_dict = ZONE_DICT
+
+    @property
+    def hdr(self):
+        """Header of the low resolution image (loaded on first access)."""
+        return self.getHyperspectralFiles()[0]
+
+    @property
+    def envi_img(self):
+        """Hyperspectral image (loaded on first access)."""
+        return self.getHyperspectralFiles()[1]
+
+    @property
+    def hdr_highres(self):
+        """Header of the high resolution image (loaded on first access)."""
+        if self._hdr_highres is None:
+            self._hdr_highres = getEnviHeader(
+                self.envi_hdr_highres_path, header_cache=self.header_cache)
+        return self._hdr_highres
+
+    @property
+    def wavelengths(self) -> list:
+        """Wavelengths of the high resolution header."""
+        return self.hdr_highres["Wavelength"]
+
+    @property
+    def bbl(self) -> list:
+        """Bad band list of the high resolution header."""
+        return self.hdr_highres["bbl"]
+
+    @property
+    def datetime(self) -> pd.Timestamp:
+        """Datetime (UTC) of the image (read on first access)."""
+        if self._datetime is None:
+            date, time = readEnviHeader(self.hdr_highres)
+            self._datetime = pd.Timestamp(date+" "+time).tz_localize(
+                self.timezone).tz_convert("UTC")
+        return self._datetime
+
+    @datetime.setter
+    def datetime(self, value: pd.Timestamp):
+        self._datetime = value
+
+    @property
+    def date(self) -> str:
+        """Local date of the image formatted as yyyymmdd."""
+        return self.datetime.tz_convert(self.timezone).strftime("%Y%m%d")
+
+    @property
+    def time(self) -> str:
+        """Local time of the image formatted as hh:mm:ss."""
+        return self.datetime.tz_convert(self.timezone).strftime("%H:%M:%S")
+
+    @property
+    def geometry(self):
+        """Compiled positions and masks (compiled on first access)."""
+        if self._geometry is None:
+            self._geometry = MeasurementGeometry(self.positions_hyp,
+                                                 masks=self.masks)
+        return self._geometry
+
+    @property
+    def index_of_meas(self) -> int:
+        """Index of the measurement in the positions CSV file."""
+        if self._index_of_meas is None:
+            self._index_of_meas = self.geometry.getIndexOfMeasurement(
+                self.meas_name)
+        return self._index_of_meas
+
+    def getHyperspectralFiles(self) -> tuple:
+        """
+        Get header, image, and high resolution header of the image.
 
-        # get measurement index
-        self.index_of_meas = int(np.argwhere(
-            positions_hyp["measurement"].values == meas_name))
+        The files are read on the first call, see
+        :func:`getHyperspectralFiles`.
 
-        self.mask = None
+        Returns
+        -------
+        tuple
+            Header, image, and high resolution header
 
-        # improvised solution to translate between zone1-8 to A1-D2
-        self.zone_dict = {
-            "A1": "zone1", "A2": "zone2", "B1": "zone3", "B2": "zone4",
-            "C1": "zone5", "C2": "zone6", "D1": "zone7", "D2": "zone8"}
+        """
+        if self._hyp_files is None:
+            self._hyp_files = getHyperspectralFiles(
+                self.hyp_hdr_path, header_cache=self.header_cache)
+            if self._hdr_highres is None:
+                self._hdr_highres = self._hyp_files[2]
+        return self._hyp_files
 
     def process(self) -> pd.DataFrame:
         """
@@ -140,52 +368,142 @@ class ProcessFullDataset():
             Dataframe with hyperspectral, LWIR, and soil moisture data for
             one image.
 
+        """
+        # random check if hyperspectral image is empty
+        if isEmptyImage(self.envi_img, bands=self.empty_check_bands,
+                        pixel_step=self.empty_check_step):
+            if self.verbose:
+                print("Error: The hyperspectral image is empty.")
+            return None
+
+        envi_processor = self.getEnviProcessor()
+        envi_processor.spectralon = self.getSpectralon(envi_processor)
+        df_hyp = envi_processor.getMultipleSpectra()
+        self.hyp_wavelengths = envi_processor.wavelengths
+
+        # preprocess the spectra of all zones at once
+        if self.hyp_preprocessing:
+            from .Preprocessing import preprocessSpectra
+
+            df_hyp[self.hyp_wavelengths] = preprocessSpectra(
+                df_hyp[self.hyp_wavelengths].values,
+                wavelengths=self.hyp_wavelengths,
+                steps=self.hyp_preprocessing,
+                savgol_window=self.hyp_savgol_window,
+                savgol_polyorder=self.hyp_savgol_polyorder)
+
+        # add datetime as column
+        df_hyp["datetime"] = self.datetime
+
+        # add soil moisture data
+        df_hyd = self.getSoilMoistureData()
+        df_hyd = df_hyd.drop(labels=["zone"], axis=1)
+
+        # add IR data
+        if self.lwir_grid:
+            df_lwir = self.getLwirGridData()
+            if df_lwir.shape[0] != df_hyp.shape[0]:
+                raise ValueError(("{0} LWIR grid elements do not match {1} "
+                                  "hyperspectral grid elements.").format(
+                                      df_lwir.shape[0], df_hyp.shape[0]))
+            df_lwir = df_lwir.drop(labels=["zone", "GridElement_Row",
+                                           "GridElement_Column"], axis=1)
+        else:
+            df_lwir = self.getLwirData()
+            df_lwir = df_lwir.drop(labels=["zone"], axis=1)
+
+        return pd.concat([df_hyp, df_hyd, df_lwir], axis=1)
+
+    def getEnviProcessor(self) -> ProcessEnviFile:
+        """
+        Get the processor of the hyperspectral image with the mask.
+
+        Returns
+        -------
+        ProcessEnviFile
+            Processor of the spectralon and the zones in `zone_list`
+
         """
         # set mask
         if self.masks is not None:
-            mask_index = self.masks.index[
-                self.masks["measurement"] == self.meas_name].tolist()[0]
-            if self.index_of_meas != mask_index:
+            if (self.geometry.mask_index.get(self.meas_name) !=
+                    self.index_of_meas):
                 raise IOError(("positions.csv and mask.csv don't have the"
                                "same sequence of dates."))
 
-            self.mask = getMask(
-                masks=self.masks,
-                index_of_meas=self.index_of_meas,
-                imageshape=self.imageshape)
-
-        # random check if hyperspectral image is empty
-        if np.sum(self.envi_img[:, :, 5]) == 0:
-            if self.verbose:
-                print("Error: The hyperspectral image is empty.")
-            return None
+            self.mask = self.geometry.getMask(self.meas_name,
+                                              imageshape=self.imageshape)
 
-        # process
-        envi_processor = ProcessEnviFile(
+        return ProcessEnviFile(
             image=self.envi_img,
             wavelengths=self.wavelengths,
             bbl=self.bbl,
             zone_list=self.zone_list,
             positions=self.positions_hyp,
             index_of_meas=self.index_of_meas,
+            edges=self.geometry.getEdges(self.index_of_meas,
+                                         prefixes=["spec"] + self.zone_list),
             mask=self.mask,
             grid=self.grid,
             stat_mode=self.hyp_stat_mode,
-            spectralon_factor=self.hyp_spectralon_factor)
-        df_hyp = envi_processor.getMultipleSpectra()
+            spectralon_factor=self.hyp_spectralon_factor,
+            use_integral_image=self.hyp_integral_image,
+            dtype=self.hyp_dtype,
+            grid_remainder=self.grid_remainder)
 
-        # add datetime as column
-        df_hyp["datetime"] = self.datetime
+    def getSpectralon(self, envi_processor: ProcessEnviFile) -> np.ndarray:
+        """
+        Get spectrum of the spectralon via the spectralon cache.
 
-        # add soil moisture data
-        df_hyd = self.getSoilMoistureData()
-        df_hyd = df_hyd.drop(labels=["zone"], axis=1)
+        Parameters
+        ----------
+        envi_processor : ProcessEnviFile
+            Processor of the image, calculates the spectrum if it is not in
+            the cache
 
-        # add IR data
-        df_lwir = self.getLwirData()
-        df_lwir = df_lwir.drop(labels=["zone"], axis=1)
+        Returns
+        -------
+        np.ndarray
+            Spectrum of the spectralon (good bands). For an occluded
+            spectralon, the spectrum of other images if available. If the
+            image is not in the cache yet, only the images already in the
+            cache are used, see :func:`fillSpectralonCache`.
 
-        return pd.concat([df_hyp, df_hyd, df_lwir], axis=1)
+        """
+        cache = self.hyp_spectralon_cache
+        if cache is None:
+            return envi_processor.getSpectralon()
+
+        key = getSpectralonKey(self.hyp_hdr_path, self.meas_name)
+        edges = envi_processor.getEdgesFromPrefix(prefix="spec")
+        spectrum = cache.get(key, edges=edges)
+        if spectrum is None:
+            spectrum = envi_processor.getSpectralon()
+            occluded = False
+            if self.hyp_spectralon_reuse != "none":
+                occluded = isOccludedSpectralon(
+                    spectrum, cache.getReference(
+                        self.datetime, self.hyp_spectralon_window,
+                        mode=self.hyp_spectralon_reuse, exclude={key}),
+                    min_ratio=self.hyp_spectralon_min_ratio)
+            cache.put(key, self.datetime, spectrum, edges,
+                      wavelengths=envi_processor.wavelengths,
+                      occluded=occluded)
+
+        if self.hyp_spectralon_reuse == "none" or key not in cache.occluded:
+            return spectrum
+        reference = cache.getReference(
+            self.datetime, self.hyp_spectralon_window,
+            mode=self.hyp_spectralon_reuse, exclude={key})
+        if reference is None:
+            if self.verbose:
+                print("Warning: The spectralon is occluded and no other "
+                      "spectralon is in the time window.")
+            return spectrum
+        if self.verbose:
+            print("The spectralon is occluded, spectralon of other images "
+                  "is used.")
+        return reference
 
     def getSoilMoistureData(self):
         """
@@ -202,44 +520,45 @@ class ProcessFullDataset():
 
         Todo
         ----
-        - Move the CSV file read out into process-function outside this file
         - Add an optional time shift correction between soil moisture data and
           the hyperspectral data.
 
         """
-        soilmoisture_sensors = getUppermostSoilMoistureSensors()
-
-        # read out soil moisture data
-        df_sm = pd.read_csv(self.soilmoisture_path)
-        df_sm["timestamp"] = pd.to_datetime(df_sm["timestamp"], utc=True)
-
-        sm_dict = {"zone": [], "volSM_vol%": [], "T_C": []}
-        for i, sensor in enumerate(soilmoisture_sensors["number"]):
-
-            # only consider sensors in zone_list
-            zone = soilmoisture_sensors["zone"].iloc[i]
-            if self.zone_dict[zone] not in self.zone_list:
-                continue
-
-            # find nearest date
-            nearest_date, time_delta = findNearestDate(
-                df_sm[df_sm["sensorID"] == "T"+str(sensor)].timestamp,
-                self.datetime)
-
-            if time_delta > self.time_window_width / 2:
-                if self.verbose:
-                    print("Warning: Could not find a soil moisture measurement"
-                          "for sensor {0}".format(sensor))
-                continue
-
-            nearest_row = df_sm[(df_sm["sensorID"] == "T"+str(sensor)) &
-                                (df_sm["timestamp"] == nearest_date)]
-
-            sm_dict["zone"].append(self.zone_dict[zone])
-            sm_dict["volSM_vol%"].append(nearest_row["volSM_vol%"].values[0])
-            sm_dict["T_C"].append(nearest_row["T_C"].values[0])
-
-        return pd.DataFrame(sm_dict)
+        registry = self.sensor_registry
+
+        # only consider the uppermost sensors in zone_list
+        sensors = registry.uppermost[np.isin(
+            registry.zone_name[registry.uppermost], self.zone_list)]
+
+        # soil moisture data of these sensors
+        data = self.soilmoisture_data
+        if data is None:
+            data = getSoilMoistureIndex(self.soilmoisture_path, registry)
+        selected = np.isin(data["sensor"], sensors)
+        df_sm = pd.DataFrame({
+            "sensor": data["sensor"][selected],
+            "time_delta": np.abs(data["timestamp"][selected] -
+                                 self.datetime.value),
+            "volSM_vol%": data["volSM_vol%"][selected],
+            "T_C": data["T_C"][selected]})
+
+        # find nearest date of every sensor within the time window
+        nearest = df_sm.loc[df_sm.groupby("sensor")["time_delta"].idxmin()]
+        nearest = nearest[nearest["time_delta"] <= pd.Timedelta(
+            minutes=self.time_window_width / 2).value]
+        nearest = nearest.set_index("sensor").reindex(
+            sensors[np.isin(sensors, nearest["sensor"])])
+
+        if self.verbose:
+            for sensor in registry.number[np.setdiff1d(sensors,
+                                                       nearest.index)]:
+                print("Warning: Could not find a soil moisture measurement"
+                      "for sensor {0}".format(sensor))
+
+        return pd.DataFrame({
+            "zone": registry.zone_name[nearest.index.values],
+            "volSM_vol%": nearest["volSM_vol%"].values,
+            "T_C": nearest["T_C"].values})
 
     def getLwirData(self):
         """
@@ -260,37 +579,30 @@ class ProcessFullDataset():
         pd.DataFrame
             IR data of the current datapoint (matched to date and time)
 
-        Todo
-        -----
-        - Implement grid-wise LWIR data extraction. (For now, only zone-wise
-          data extraction is implemented.)
-
         """
-        # find LWIR file within the correct time window
-        lwir_datetime_list = []
-        for csvfile in glob.glob(self.lwir_path+"/ir_export_*.csv"):
-            csvfile_list = csvfile.split("/")[-1].split("_")
-            lwir_datetime = pd.to_datetime(
-                csvfile_list[2]+" "+csvfile_list[5][:-4].replace("-", ":") +
-                "+02:00", utc=True)
-            lwir_datetime_list.append(lwir_datetime)
-        nearest_date, time_delta = findNearestDate(
-            lwir_datetime_list, self.datetime)
+        empty_lwir_data = pd.DataFrame({"zone": [np.nan], "mean": [np.nan],
+                                        "med": [np.nan], "std": [np.nan]})
+
+        # use already extracted LWIR data
+        if self.lwir_data is not None:
+            df_lwir = self.lwir_data[self.lwir_data["zone"].isin(
+                self.zone_list)]
+            if df_lwir.shape[0] == 0:
+                if self.verbose:
+                    print("Warning: Did not find LWIR data.")
+                return empty_lwir_data
+            return df_lwir[["zone", "mean", "med", "std"]].reset_index(
+                drop=True)
 
-        # check if the nearest datetime is close enough
-        if time_delta > self.time_window_width / 2:
+        # find LWIR file within the correct time window
+        csvfile, _ = self.getNearestLwirFile()
+        if csvfile is None:
             if self.verbose:
                 print("Warning: Did not find LWIR data.")
-            return pd.DataFrame({"zone": [np.nan], "mean": [np.nan],
-                                 "med": [np.nan], "std": [np.nan]})
-
-        # load LWIR CSV file
-        csvfile = glob.glob(self.lwir_path+"ir_export_" +
-                            nearest_date.strftime("%Y%m%d")+"_*" +
-                            nearest_date.tz_convert("Europe/Berlin").strftime(
-                                "%H-%M-%S")+".csv")[0]
+            return empty_lwir_data
 
         # get data from different zones
+        from .IRUtils import getIRDataFromMultipleZones
         df_lwir_original = getIRDataFromMultipleZones(
             csvpath=csvfile,
             positions=self.positions_lwir.to_dict('list'),
@@ -311,6 +623,357 @@ class ProcessFullDataset():
 
         return pd.DataFrame(lwir_dict)
 
+    def getLwirGridData(self):
+        """
+        Get grid-wise LWIR data from one of the CSV export files.
+
+        The grid elements of every zone in the hyperspectral image are mapped
+        proportionally to the respective zone in the LWIR image, see
+        :func:`getLwirGridStatistics`. Grid element (i, j) of the LWIR zone
+        then corresponds to grid element (i, j) of the hyperspectral zone,
+        also if the zones differ in size. The positions row of the LWIR image
+        is the one where the measurement equals the date of the LWIR image.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per zone and grid element with the columns zone,
+            GridElement_Row, GridElement_Column, mean, med, and std. If no
+            LWIR data is found, the statistics are NaN.
+
+        """
+        csvfile, lwir_datetime = self.getNearestLwirFile()
+        meas_index = np.nan
+        if csvfile is not None:
+            meas_index = getLwirMeasurementIndex(
+                self.positions_lwir, [lwir_datetime], self.timezone)[0]
+        if np.isnan(meas_index):
+            if self.verbose:
+                print("Warning: Did not find LWIR data.")
+        else:
+            frames = getLwirFrames([csvfile])
+
+        df_list = []
+        zone_edges = self.geometry.getEdges(self.index_of_meas,
+                                            prefixes=self.zone_list)
+        for zone in self.zone_list:
+            hyp_edges = zone_edges[zone]
+            grid_real = getRealGridSize(hyp_edges, self.grid)
+
+            if np.isnan(meas_index):
+                n_rows = len(getGridBounds(*hyp_edges[:2], grid_real[0],
+                                           remainder=self.grid_remainder)[0])
+                n_cols = len(getGridBounds(*hyp_edges[2:], grid_real[1],
+                                           remainder=self.grid_remainder)[0])
+                stats = np.full((n_rows, n_cols, 1, 3), np.nan)
+            else:
+                edges = getLwirZoneEdges(self.positions_lwir, int(meas_index),
+                                         [zone])[0]
+                stats = getLwirGridStatistics(
+                    frames, edges, grid_real, remainder=self.grid_remainder,
+                    hyp_edges=hyp_edges)
+
+            grid_rows, grid_cols = np.indices(stats.shape[:2])
+            df_list.append(pd.DataFrame({
+                "zone": zone,
+                "GridElement_Row": grid_rows.ravel(),
+                "GridElement_Column": grid_cols.ravel(),
+                "mean": stats[:, :, 0, 0].ravel(),
+                "med": stats[:, :, 0, 1].ravel(),
+                "std": stats[:, :, 0, 2].ravel()}))
+
+        return pd.concat(df_list, ignore_index=True)
+
+    def getNearestLwirFile(self):
+        """
+        Find the LWIR export file within the time window of the image.
+
+        Returns
+        -------
+        csvfile : str or None
+            Path to the nearest LWIR file, None if not within the time window
+        nearest_date : pd.Timestamp or None
+            Datetime of the nearest LWIR file
+
+        """
+        lwir_catalog = getLwirCatalog(self.lwir_path, timezone=self.timezone)
+        if lwir_catalog.shape[0] == 0:
+            return None, None
+        nearest_date, time_delta = findNearestDate(
+            lwir_catalog["datetime"], self.datetime)
+
+        # check if the nearest datetime is close enough
+        if abs(time_delta) > self.time_window_width / 2:
+            return None, None
+
+        csvfile = lwir_catalog["path"][
+            lwir_catalog["datetime"] == nearest_date].iloc[0]
+        return csvfile, nearest_date
+
+
+class EnviPrefetcher():
+    """
+    Read hyperspectral ENVI files in a background thread.
+
+    While the current image is processed, the next `prefetch_depth` images
+    (cube and both headers) are already read from disk. This hides the
+    latency of slow (e.g. network) filesystems. The queue between the reading
+    thread and the consumer is bounded, i.e. at most `prefetch_depth` + 2
+    cubes are held in memory at the same time.
+
+    Parameters
+    ----------
+    hyp_hdr_paths : list of str
+        Paths to the envi header files (low resolution) in processing order
+    prefetch_depth : int, optional (default=2)
+        Number of images to read ahead. If zero, the files are read
+        sequentially without a background thread.
+    load_image : bool, optional (default=True)
+        If true, the cube is loaded into memory. Otherwise, only the spectral
+        file object is opened and the pixels are read on access.
+    header_cache : EnviHeaderCache or None, optional (default=None)
+        Cache for the list fields of the headers, see
+        :func:`hprocessing.ProcessEnviFile.getEnviHeader`.
+
+    Yields
+    ------
+    tuple
+        (header, image, highres header) for every path in `hyp_hdr_paths`
+
+    """
+
+    _END = object()
+
+    def __init__(self,
+                 hyp_hdr_paths: list,
+                 prefetch_depth: int = 2,
+                 load_image: bool = True,
+                 header_cache: EnviHeaderCache = None):
+        """Initialize EnviPrefetcher instance."""
+        self.hyp_hdr_paths = list(hyp_hdr_paths)
+        self.prefetch_depth = prefetch_depth
+        self.load_image = load_image
+        self.header_cache = header_cache
+
+    def __len__(self):
+        """Get number of images."""
+        return len(self.hyp_hdr_paths)
+
+    def __iter__(self):
+        """Iterate over the read files in the order of `hyp_hdr_paths`."""
+        if self.prefetch_depth < 1:
+            for hyp_hdr_path in self.hyp_hdr_paths:
+                yield getHyperspectralFiles(hyp_hdr_path, self.load_image,
+                                            self.header_cache)
+            return
+
+        file_queue = queue.Queue(maxsize=self.prefetch_depth)
+        stop_event = threading.Event()
+        thread = threading.Thread(target=self._readFiles,
+                                  args=(file_queue, stop_event),
+                                  daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = file_queue.get()
+                if item is self._END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # stop the thread also if the consumer stops early
+            stop_event.set()
+            thread.join()
+
+    def _readFiles(self, file_queue, stop_event):
+        """Read all files and put them into the queue (thread target)."""
+        try:
+            for hyp_hdr_path in self.hyp_hdr_paths:
+                if stop_event.is_set():
+                    return
+                if not self._put(file_queue, stop_event, getHyperspectralFiles(
+                        hyp_hdr_path, self.load_image, self.header_cache)):
+                    return
+        except Exception as e:  # pylint: disable=broad-except
+            self._put(file_queue, stop_event, e)
+            return
+        self._put(file_queue, stop_event, self._END)
+
+    @staticmethod
+    def _put(file_queue, stop_event, item) -> bool:
+        """Put item into queue unless the consumer has stopped."""
+        while not stop_event.is_set():
+            try:
+                file_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+def getHighresHeaderPath(hyp_hdr_path: str) -> str:
+    """
+    Get path of the high resolution header of a hyperspectral image.
+
+    Parameters
+    ----------
+    hyp_hdr_path : str
+        Path to envi header file (low resolution)
+
+    Returns
+    -------
+    str
+        Path to envi header file (high resolution)
+
+    """
+    return hyp_hdr_path[:-4] + "_highres.hdr"
+
+
+def getHyperspectralFiles(hyp_hdr_path: str,
+                          load_image: bool = False,
+                          header_cache: EnviHeaderCache = None):
+    """
+    Read the image and both headers of a hyperspectral image.
+
+    Parameters
+    ----------
+    hyp_hdr_path : str
+        Path to envi header file (low resolution)
+    load_image : bool, optional (default=False)
+        If true, the cube is loaded into memory.
+    header_cache : EnviHeaderCache or None, optional (default=None)
+        Cache for the list fields of the headers, see
+        :func:`hprocessing.ProcessEnviFile.getEnviHeader`.
+
+    Returns
+    -------
+    hdr : spectral header
+        Header of the low resolution file
+    envi_img : spectral image or ImageArray
+        Image file of the hyperspectral image
+    hdr_highres : spectral header
+        Header of the high resolution file
+
+    """
+    hdr, envi_img = getEnviFile(hyp_hdr_path, header_cache=header_cache)
+    if load_image:
+        envi_img = envi_img.load()
+    hdr_highres = getEnviHeader(getHighresHeaderPath(hyp_hdr_path),
+                                header_cache=header_cache)
+    return hdr, envi_img, hdr_highres
+
+
+def getHyperspectralCatalog(data_hyp: str,
+                            timezone: str = "+02:00",
+                            paths: list = None) -> pd.DataFrame:
+    """
+    Get catalog of all hyperspectral images in a dataset.
+
+    Only the descriptions of the highres headers are read. All datetimes are
+    parsed in one vectorized step.
+
+    Parameters
+    ----------
+    data_hyp : str
+        Directory of the hyperspectral data with one subfolder per measurement
+    timezone : str, optional (default="+02:00")
+        Timezone of the camera clock, either as UTC offset (e.g. "+02:00") or
+        as name (e.g. "Europe/Berlin").
+    paths : list of str or None, optional (default=None)
+        Envi header files (low resolution) of the images to include. If None,
+        all images in `data_hyp` are included.
+
+    Returns
+    -------
+    catalog : pd.DataFrame
+        One row per image with the columns path (envi header file, low
+        resolution), measurement, filenumber, and datetime (UTC)
+
+    """
+    if paths is None:
+        paths = glob.glob(data_hyp+"*/*[0-9].hdr")
+    catalog = pd.DataFrame({"path": sorted(paths)}, dtype=object)
+    path_parts = catalog["path"].str.split("/")
+    catalog["measurement"] = path_parts.str[-2].str.replace("_hyp", "")
+    catalog["filenumber"] = path_parts.str[-1].str[4:7].astype(int)
+    catalog["datetime"] = getDatetimesFromDescriptions(
+        [readEnviDescription(getHighresHeaderPath(hyp_hdr_path))
+         for hyp_hdr_path in catalog["path"]],
+        timezone=timezone)
+    return catalog
+
+
+def filterEmptyImages(catalog: pd.DataFrame,
+                      bands: tuple = (5,),
+                      pixel_step: int = 1) -> pd.DataFrame:
+    """
+    Remove empty hyperspectral images (e.g. failed acquisitions) from catalog.
+
+    Only a sample of every image is read from the memory-mapped file, see
+    :func:`hprocessing.ProcessEnviFile.isEmptyImage`.
+
+    Parameters
+    ----------
+    catalog : pd.DataFrame
+        Catalog of the images with the column path, see
+        :func:`getHyperspectralCatalog`
+    bands : tuple of int, optional (default=(5,))
+        Bands of the sample
+    pixel_step : int, optional (default=1)
+        Step between the rows and columns of the sample
+
+    Returns
+    -------
+    pd.DataFrame
+        Catalog without the empty images
+
+    """
+    header_cache = EnviHeaderCache()
+    is_empty = [isEmptyImage(getEnviFile(hyp_hdr_path, header_cache)[1],
+                             bands=bands, pixel_step=pixel_step)
+                for hyp_hdr_path in catalog["path"]]
+    return catalog[~np.array(is_empty, dtype=bool)].reset_index(drop=True)
+
+
+def getIgnoreRules(ignore_hyp_measurements: pd.DataFrame,
+                   ignore_hyp_datapoints: pd.DataFrame,
+                   ignore_hyp_fields: pd.DataFrame) -> dict:
+    """
+    Compile the ignore-CSV files into hash-based lookups.
+
+    Parameters
+    ----------
+    ignore_hyp_measurements : pd.DataFrame
+        Measurements to be ignored
+    ignore_hyp_datapoints : pd.DataFrame
+        Images to be ignored with the columns measurement and filenumber
+    ignore_hyp_fields : pd.DataFrame
+        Zones of images to be ignored with the columns measurement,
+        filenumber, and zone (number of the zone)
+
+    Returns
+    -------
+    ignore_rules : dict
+        Dictionary with the keys "measurements" (set of measurements),
+        "datapoints" (set of (measurement, filenumber)), and "fields" (dict
+        from (measurement, filenumber) to a set of zones, e.g. "zone3")
+
+    """
+    ignore_rules = {
+        "measurements": set(np.ravel(ignore_hyp_measurements.values)),
+        "datapoints": set(zip(ignore_hyp_datapoints["measurement"],
+                              ignore_hyp_datapoints["filenumber"])),
+        "fields": {}}
+
+    for meas_name, file_number, zone in zip(ignore_hyp_fields["measurement"],
+                                            ignore_hyp_fields["filenumber"],
+                                            ignore_hyp_fields["zone"]):
+        ignore_rules["fields"].setdefault(
+            (meas_name, file_number), set()).add("zone"+str(zone))
+
+    return ignore_rules
+
 
 def getMask(masks, index_of_meas, imageshape=(50, 50)):
     """
@@ -331,29 +994,68 @@ def getMask(masks, index_of_meas, imageshape=(50, 50)):
         Mask in imageshape with 1 (= true value) and 0 (= mask)
 
     """
-    mask = np.ones(imageshape, dtype=int)
+    borders, bars = getMaskParameters(masks.loc[[index_of_meas]])
+    return getMaskFromParameters(borders[0], bars[0], imageshape=imageshape)
+
+
+def getMaskParameters(masks: pd.DataFrame) -> tuple:
+    """
+    Get the borders and wooden bars of all masks as arrays.
+
+    Parameters
+    ----------
+    masks : pd.DataFrame
+        Masks for hyperspectral images as in the mask.csv file
+
+    Returns
+    -------
+    borders : np.ndarray of int
+        Start row, end row, start column, and end column with shape
+        (masks, 4)
+    bars : np.ndarray of float
+        Points (p1_x, p1_y, p2_x, p2_y) and height of the four wooden bars
+        with shape (masks, 4, 5)
+
+    """
+    borders = masks[["start_row", "end_row", "start_col", "end_col"]].values
+    bars = masks[["bar{0}_{1}".format(i, key) for i in range(1, 5)
+                  for key in ["p1_x", "p1_y", "p2_x", "p2_y", "height"]]]
+    return (borders.astype(int),
+            bars.values.astype(float).reshape(-1, 4, 5))
+
+
+def getMaskFromParameters(borders, bars, imageshape=(50, 50)):
+    """
+    Get the mask of one image from its borders and wooden bars.
+
+    Parameters
+    ----------
+    borders : array-like of 4 int
+        Start row, end row, start column, and end column
+    bars : array-like with shape (4, 5)
+        Points (p1_x, p1_y, p2_x, p2_y) and height of the wooden bars
+    imageshape : tuple, optional (default= (50, 50))
+        Height and width of the image
+
+    Returns
+    -------
+    mask : 2D numpy array
+        Mask in imageshape with 1 (= true value) and 0 (= mask)
 
-    # define borders
-    start_row = int(masks["start_row"][index_of_meas])
-    end_row = int(masks["end_row"][index_of_meas])
-    start_col = int(masks["start_col"][index_of_meas])
-    end_col = int(masks["end_col"][index_of_meas])
+    """
+    mask = np.ones(imageshape, dtype=int)
 
     # mask around borders
+    start_row, end_row, start_col, end_col = [int(b) for b in borders]
     mask[:start_row] = 0
     mask[end_row:] = 0
     mask[:, :start_col] = 0
     mask[:, end_col:] = 0
 
     # bar masks
-    for i in range(1, 5):
-        wooden_bar = getWoodenBarMask(
-            [masks["bar"+str(i)+"_p1_x"][index_of_meas],
-             masks["bar"+str(i)+"_p1_y"][index_of_meas]],
-            [masks["bar"+str(i)+"_p2_x"][index_of_meas],
-             masks["bar"+str(i)+"_p2_y"][index_of_meas]],
-            height=masks["bar"+str(i)+"_height"][index_of_meas],
-            imageshape=imageshape)
+    for p1_x, p1_y, p2_x, p2_y, height in bars:
+        wooden_bar = getWoodenBarMask([p1_x, p1_y], [p2_x, p2_y],
+                                      height=height, imageshape=imageshape)
         mask[[x[0] for x in wooden_bar], [x[1] for x in wooden_bar]] = 0
 
     return mask
@@ -395,78 +1097,1245 @@ def getWoodenBarMask(point1, point2, height, imageshape=(50, 50)):
     return wooden_bar
 
 
-def getAllSoilMoistureSensors():
+class MeasurementGeometry():
     """
-    Get information about the soil moisture sensors.
+    Positions and masks of all measurements compiled into lookup tables.
 
-    The sensor data is taken from the HydReSGeo dataset. For other datasets,
-    the dictionary `sensors` has to be modified.
+    The tables are compiled once per run. The geometry of an image is then
+    found by direct indexing instead of scanning the measurement column and
+    looking up the columns of every rectangle.
 
-    Returns
-    -------
-    sensors : dict
-        Sensor information consisting of number, field, depth, and name.
+    Parameters
+    ----------
+    positions : pd.DataFrame
+        Positions of the rectangles with the column measurement and the
+        columns <prefix>_row_start, <prefix>_row_end, <prefix>_col_start, and
+        <prefix>_col_end for every rectangle (e.g. spec, zone1)
+    masks : pd.DataFrame or None, optional (default=None)
+        Masks for hyperspectral images as in the mask.csv file
+
+    Attributes
+    ----------
+    index : dict
+        Row in `positions` of every measurement. For duplicate measurements,
+        the first row is used.
+    prefixes : list of str
+        Names of the rectangles in the order of the columns
+    prefix_index : dict
+        Position of every prefix in `prefixes`
+    edges : np.ndarray of float
+        Edges (row_start, row_end, col_start, col_end) with shape
+        (measurements, prefixes, 4). Undefined edges are NaN.
+    mask_index : dict
+        Row in `masks` of every measurement
+    mask_borders, mask_bars : np.ndarray
+        Borders and wooden bars of the masks, see :func:`getMaskParameters`
 
     """
-    sensors = {
-        "number": [36554, 36555, 36556, 36547, 36557, 36558,
-                   36559, 36553, 36549, 36550, 36551, 36552,
-                   36560, 36562, 36563, 36564, 36565, 36561],
-        "zone": ["A1", "A1", "A1", "A2", "B1", "B1", "B1", "B2", "C1",
-                 "C1", "C1", "C1", "C2", "D1", "D1", "D1", "D1", "D2"],
-        "depth": [2.5, 5.0, 10.0, 5.0, 2.5, 5.0, 10.0, 5.0, 2.5,
-                  5.0, 10.0, 20.0, 5.0, 2.5, 5.0, 10.0, 20.0, 5.0]}
-    sensors["name"] = ["SM_" + str(sensors["number"][i]) + "_" +
-                       str(sensors["zone"][i]) + "_" + str(sensors["depth"][i])
-                       for i in range(len(sensors["number"]))]
 
-    return sensors
+    def __init__(self, positions: pd.DataFrame, masks: pd.DataFrame = None):
+        """Initialize MeasurementGeometry instance."""
+        self.index = getFirstIndex(positions["measurement"].values)
+        self.prefixes = [column[:-len("_row_start")]
+                         for column in positions.columns
+                         if column.endswith("_row_start")]
+        self.prefix_index = {prefix: i
+                             for i, prefix in enumerate(self.prefixes)}
+
+        columns = [prefix + suffix for prefix in self.prefixes
+                   for suffix in ["_row_start", "_row_end",
+                                  "_col_start", "_col_end"]]
+        self.edges = positions[columns].values.astype(float).reshape(
+            positions.shape[0], len(self.prefixes), 4)
+
+        self.mask_index = {}
+        self.mask_borders = np.empty((0, 4), dtype=int)
+        self.mask_bars = np.empty((0, 4, 5))
+        if masks is not None:
+            self.mask_index = getFirstIndex(masks["measurement"].values)
+            self.mask_borders, self.mask_bars = getMaskParameters(masks)
+        self.mask_cache = {}
+
+    def getIndexOfMeasurement(self, meas_name: str) -> int:
+        """
+        Get the row of a measurement in the positions.
 
+        Parameters
+        ----------
+        meas_name : str
+            Name of the measurement
 
-def getUppermostSoilMoistureSensors():
-    """
-    Get information about the soil moisture sensors.
+        Returns
+        -------
+        int
+            Row of the measurement in the positions
 
-    Returns
-    -------
-    sensors : dict
-        Sensor information consisting of number, field, depth, and name.
+        Raises
+        ------
+        KeyError
+            Raised if the measurement is not in the positions.
 
-    """
-    sensors = pd.DataFrame(getAllSoilMoistureSensors())
-    df_temp_list = []
+        """
+        try:
+            return self.index[meas_name]
+        except KeyError:
+            raise KeyError("Measurement {0} not found in the "
+                           "positions.".format(meas_name)) from None
 
-    for zone in np.unique(sensors["zone"].values):
-        min_index = sensors[sensors["zone"] == zone]["depth"].values.argmin()
-        df_temp_list.append(sensors[sensors["zone"] == zone].iloc[min_index])
+    def getEdges(self, index_of_meas: int, prefixes: list = None) -> dict:
+        """
+        Get the edges of the rectangles of one measurement.
 
-    return pd.concat(df_temp_list, axis=1).T
+        Parameters
+        ----------
+        index_of_meas : int
+            Row of the measurement in the positions
+        prefixes : list of str or None, optional (default=None)
+            Names of the rectangles. None = all rectangles.
 
+        Returns
+        -------
+        dict
+            Edges [row_start, row_end, col_start, col_end] of every prefix
 
-def findNearestDate(date_list, date):
-    """
-    Find closest datapoint of each uppermost sensor in time window.
+        Raises
+        ------
+        ValueError
+            Raised if an edge of a rectangle is not defined for the
+            measurement.
 
-    Adapted from https://stackoverflow.com/a/32237949/3816498 .
+        """
+        if prefixes is None:
+            prefixes = self.prefixes
+        edges = self.edges[index_of_meas, [self.prefix_index[prefix]
+                                           for prefix in prefixes]]
+        undefined = [prefix for prefix, prefix_edges in zip(prefixes, edges)
+                     if np.isnan(prefix_edges).any()]
+        if undefined:
+            raise ValueError("Edges of {0} are not defined in row {1} of the "
+                             "positions.".format(undefined, index_of_meas))
+        return dict(zip(prefixes, edges.astype(int).tolist()))
+
+    def getDefinedPrefixes(self, index_of_meas: int) -> list:
+        """
+        Get the names of the rectangles with all edges defined.
 
-    Parameters
-    ----------
-    date_list : array-like
-        List of dates
-    date : datetime
-        The date, to which the nearest date in `items` should be found.
+        Parameters
+        ----------
+        index_of_meas : int
+            Row of the measurement in the positions
 
-    Returns
-    -------
-    nearest_date : datetime
-        Nearest date to `date` in `date_list`
+        Returns
+        -------
+        list of str
+            Names of the rectangles in the order of `prefixes`
+
+        """
+        defined = ~np.isnan(self.edges[index_of_meas]).any(axis=1)
+        return [prefix for prefix, is_defined in zip(self.prefixes, defined)
+                if is_defined]
+
+    def getMask(self, meas_name: str, imageshape=(50, 50)):
+        """
+        Get the mask of a measurement.
+
+        The mask is calculated once per measurement and image shape and is
+        read-only.
+
+        Parameters
+        ----------
+        meas_name : str
+            Name of the measurement
+        imageshape : tuple, optional (default= (50, 50))
+            Height and width of the image
+
+        Returns
+        -------
+        mask : 2D numpy array or None
+            Mask as from :func:`getMask`, None if the measurement has no mask
+
+        """
+        mask_index = self.mask_index.get(meas_name)
+        if mask_index is None:
+            return None
+        key = (mask_index, tuple(imageshape))
+        if key not in self.mask_cache:
+            mask = getMaskFromParameters(self.mask_borders[mask_index],
+                                         self.mask_bars[mask_index],
+                                         imageshape=imageshape)
+            mask.setflags(write=False)
+            self.mask_cache[key] = mask
+        return self.mask_cache[key]
+
+
+def getFirstIndex(values) -> dict:
+    """
+    Get the first position of every value.
+
+    Parameters
+    ----------
+    values : array-like
+        Values, e.g. measurement names
+
+    Returns
+    -------
+    dict
+        First position of every value
+
+    """
+    unique, first = np.unique(np.asarray(values), return_index=True)
+    return dict(zip(unique.tolist(), first.tolist()))
+
+
+class SpectralonCache():
+    """
+    Cache of the spectralon spectra (white references) of the images.
+
+    The spectralon spectrum of every image is calculated once and stored
+    with the datetime of the image and the edges of the spec rectangle.
+    Reprocessing the images, e.g. with other zones or grids, skips the
+    spectralon pass. Images with an occluded spectralon can use the spectrum
+    of the nearest image or the interpolation between the images before and
+    after within a time window, see :meth:`getReference`. The cache is saved
+    as one compact array in the long format, e.g. for QA plots, see
+    :meth:`save`.
+
+    Parameters
+    ----------
+    wavelengths : list or None, optional (default=None)
+        Wavelengths of the spectra (good bands). If None, they are set by
+        the first :meth:`put`.
+
+    Attributes
+    ----------
+    spectra : dict
+        Spectrum of every image
+    datetimes : dict
+        Datetime of every image (UTC, int64 in ns)
+    edges : dict
+        Edges (row_start, row_end, col_start, col_end) of the spec rectangle
+        of every image
+    occluded : set
+        Images with an occluded spectralon
+
+    """
+
+    def __init__(self, wavelengths: list = None):
+        """Initialize SpectralonCache instance."""
+        self.wavelengths = None
+        if wavelengths is not None:
+            self.wavelengths = np.asarray(wavelengths, dtype=str)
+        self.spectra = {}
+        self.datetimes = {}
+        self.edges = {}
+        self.occluded = set()
+
+    def __len__(self):
+        """Get number of images in the cache."""
+        return len(self.spectra)
+
+    def __contains__(self, key: str) -> bool:
+        """Check if the spectrum of an image is in the cache."""
+        return key in self.spectra
+
+    def put(self,
+            key: str,
+            datetime: pd.Timestamp,
+            spectrum,
+            edges: list,
+            wavelengths: list = None,
+            occluded: bool = False):
+        """
+        Add the spectralon spectrum of an image.
+
+        Parameters
+        ----------
+        key : str
+            Name of the image, e.g. "20170815_meas1/Auto017"
+        datetime : pd.Timestamp
+            Datetime of the image (UTC)
+        spectrum : array-like
+            Spectrum of the spectralon
+        edges : list of 4 int
+            Edges of the spec rectangle
+        wavelengths : list or None, optional (default=None)
+            Wavelengths of the spectrum. None = the ones of the cache.
+        occluded : bool, optional (default=False)
+            If true, the spectralon is occluded in the image.
+
+        Raises
+        ------
+        ValueError
+            Raised if the wavelengths differ from the ones of the cache.
+
+        """
+        if wavelengths is not None:
+            wavelengths = np.asarray(wavelengths, dtype=str)
+            if self.wavelengths is None:
+                self.wavelengths = wavelengths
+            elif not np.array_equal(self.wavelengths, wavelengths):
+                raise ValueError("Wavelengths differ from the ones in the "
+                                 "spectralon cache.")
+        self.spectra[key] = np.asarray(spectrum, dtype=float)
+        self.datetimes[key] = pd.Timestamp(datetime).value
+        self.edges[key] = tuple(int(edge) for edge in edges)
+        self.occluded.discard(key)
+        if occluded:
+            self.occluded.add(key)
+
+    def get(self, key: str, edges: list = None):
+        """
+        Get the spectralon spectrum of an image.
+
+        Parameters
+        ----------
+        key : str
+            Name of the image
+        edges : list of 4 int or None, optional (default=None)
+            Edges of the spec rectangle. If the cached spectrum belongs to
+            other edges, None is returned. None = no check.
+
+        Returns
+        -------
+        np.ndarray or None
+            Spectrum of the spectralon, None if not in the cache
+
+        """
+        if key not in self.spectra or (
+                edges is not None and
+                self.edges[key] != tuple(int(edge) for edge in edges)):
+            return None
+        return self.spectra[key]
+
+    def getEntry(self, key: str):
+        """
+        Get everything stored for an image, e.g. to merge caches.
+
+        Parameters
+        ----------
+        key : str
+            Name of the image
+
+        Returns
+        -------
+        dict or None
+            Arguments of :meth:`put` for the image, None if not in the cache
+
+        """
+        if key not in self.spectra:
+            return None
+        return {"key": key,
+                "datetime": pd.Timestamp(self.datetimes[key], tz="UTC"),
+                "spectrum": self.spectra[key],
+                "edges": self.edges[key],
+                "wavelengths": self.wavelengths,
+                "occluded": key in self.occluded}
+
+    def getReference(self,
+                     datetime: pd.Timestamp,
+                     time_window_width: float,
+                     mode: str = "nearest",
+                     exclude: set = None):
+        """
+        Get a spectralon spectrum from the images around a datetime.
+
+        Only images with a spectralon which is not occluded (and without
+        NaN) are used.
+
+        Parameters
+        ----------
+        datetime : pd.Timestamp
+            Datetime (UTC)
+        time_window_width : float
+            Width of the time window around `datetime` in minutes
+        mode : str, optional (default="nearest")
+            "nearest" (spectrum of the nearest image) or "interpolate"
+            (linear interpolation between the nearest images before and
+            after, the nearest image if only one side exists)
+        exclude : set or None, optional (default=None)
+            Images which are not used, e.g. the image itself
+
+        Returns
+        -------
+        np.ndarray or None
+            Spectrum of the spectralon, None if no image is in the time window
+
+        Raises
+        ------
+        ValueError
+            Raised if `mode` is unknown.
+
+        """
+        if mode not in ["nearest", "interpolate"]:
+            raise ValueError("Unknown mode {0}.".format(mode))
+        exclude = self.occluded | set(exclude or [])
+        keys = [key for key in self.spectra if key not in exclude and
+                np.isfinite(self.spectra[key]).all()]
+        if not keys:
+            return None
+
+        time_delta = (np.array([self.datetimes[key] for key in keys]) -
+                      pd.Timestamp(datetime).value) / 6e10
+        inside = np.abs(time_delta) <= time_window_width / 2
+        if not inside.any():
+            return None
+        candidates = np.flatnonzero(inside)
+        nearest = candidates[np.argmin(np.abs(time_delta[candidates]))]
+        if mode == "nearest":
+            return self.spectra[keys[nearest]]
+
+        before = candidates[time_delta[candidates] <= 0]
+        after = candidates[time_delta[candidates] >= 0]
+        if len(before) == 0 or len(after) == 0:
+            return self.spectra[keys[nearest]]
+        before = before[np.argmax(time_delta[before])]
+        after = after[np.argmin(time_delta[after])]
+        if time_delta[after] == time_delta[before]:
+            return self.spectra[keys[before]]
+        weight = -time_delta[before] / (time_delta[after] -
+                                         time_delta[before])
+        return ((1 - weight) * self.spectra[keys[before]] +
+                weight * self.spectra[keys[after]])
+
+    def markOccluded(self,
+                     keys: list,
+                     time_window_width: float,
+                     mode: str = "nearest",
+                     min_ratio: float = 0.5):
+        """
+        Check if the spectralon of images is occluded.
+
+        The images are checked in the order of their datetime. The reference
+        of an image is taken from all other images of the cache which are
+        not (yet) marked as occluded, i.e. also from the images after it.
+
+        Parameters
+        ----------
+        keys : list of str
+            Images to check
+        time_window_width : float
+            Width of the time window in minutes, see :meth:`getReference`
+        mode : str, optional (default="nearest")
+            Mode of the reference, see :meth:`getReference`
+        min_ratio : float, optional (default=0.5)
+            Minimum ratio to the reference, see :func:`isOccludedSpectralon`
+
+        """
+        for key in sorted(keys, key=lambda key: (self.datetimes[key], key)):
+            self.occluded.discard(key)
+            reference = self.getReference(
+                pd.Timestamp(self.datetimes[key]), time_window_width,
+                mode=mode, exclude={key})
+            if isOccludedSpectralon(self.spectra[key], reference,
+                                    min_ratio=min_ratio):
+                self.occluded.add(key)
+
+    def toArrays(self) -> tuple:
+        """
+        Get all spectra of the cache sorted by datetime.
+
+        Returns
+        -------
+        spectra : np.ndarray
+            Spectra with shape (images, wavelengths)
+        metadata : pd.DataFrame
+            Columns key, datetime (UTC), row_start, row_end, col_start,
+            col_end (of the spec rectangle), and occluded
+        wavelengths : np.ndarray of str
+            Wavelengths of the spectra
+
+        """
+        keys = sorted(self.spectra, key=lambda key: (self.datetimes[key],
+                                                     key))
+        wavelengths = self.wavelengths
+        if wavelengths is None:
+            wavelengths = np.empty(0, dtype=str)
+        spectra = np.empty((0, len(wavelengths)))
+        if keys:
+            spectra = np.stack([self.spectra[key] for key in keys])
+
+        metadata = pd.DataFrame({
+            "key": np.asarray(keys, dtype=str),
+            "datetime": pd.to_datetime(
+                np.array([self.datetimes[key] for key in keys],
+                         dtype=np.int64), utc=True)})
+        edges = np.array([self.edges[key] for key in keys],
+                         dtype=int).reshape(-1, 4)
+        for i, column in enumerate(["row_start", "row_end", "col_start",
+                                    "col_end"]):
+            metadata[column] = edges[:, i]
+        metadata["occluded"] = np.isin(keys, list(self.occluded))
+        return spectra, metadata, wavelengths
+
+    def save(self, filepath: str):
+        """
+        Save the cache as NPZ file in the long format.
+
+        Parameters
+        ----------
+        filepath : str
+            Path of the NPZ file, see :func:`saveLongFormat`
+
+        """
+        saveLongFormat(filepath, *self.toArrays())
+
+    @classmethod
+    def load(cls, filepath: str):
+        """
+        Load a cache from an NPZ file.
+
+        Parameters
+        ----------
+        filepath : str
+            Path of the NPZ file, see :meth:`save`
+
+        Returns
+        -------
+        SpectralonCache
+            Cache with the spectra of the file
+
+        """
+        spectra, metadata, wavelengths = readLongFormat(filepath)
+        cache = cls(wavelengths=wavelengths)
+        edges = metadata[["row_start", "row_end", "col_start",
+                          "col_end"]].values
+        for i, key in enumerate(metadata["key"]):
+            cache.put(key, metadata["datetime"][i], spectra[i], edges[i],
+                      occluded=bool(metadata["occluded"][i]))
+        return cache
+
+
+def getSpectralonKey(hyp_hdr_path: str, meas_name: str) -> str:
+    """
+    Get name of an image in the spectralon cache.
+
+    Parameters
+    ----------
+    hyp_hdr_path : str
+        Path to envi header file (low resolution)
+    meas_name : str
+        Name of the measurement, e.g. "20170815_meas1"
+
+    Returns
+    -------
+    str
+        Name of the image, e.g. "20170815_meas1/Auto017"
+
+    """
+    return "{0}/{1}".format(meas_name, os.path.splitext(
+        os.path.basename(hyp_hdr_path))[0])
+
+
+def isOccludedSpectralon(spectrum, reference=None,
+                         min_ratio: float = 0.5) -> bool:
+    """
+    Check if the spectralon is occluded in an image.
+
+    Parameters
+    ----------
+    spectrum : array-like
+        Spectrum of the spectralon in the image
+    reference : array-like or None, optional (default=None)
+        Spectrum of the spectralon in other images, e.g. from
+        :meth:`SpectralonCache.getReference`
+    min_ratio : float, optional (default=0.5)
+        Minimum median ratio of `spectrum` to `reference`
+
+    Returns
+    -------
+    bool
+        True if `spectrum` contains NaN (e.g. completely masked) or if its
+        median ratio to `reference` is below `min_ratio`
+
+    """
+    spectrum = np.asarray(spectrum, dtype=float)
+    if not np.isfinite(spectrum).all():
+        return True
+    if reference is None:
+        return False
+    return bool(np.median(spectrum / np.asarray(reference, dtype=float)) <
+                min_ratio)
+
+
+def getAllSoilMoistureSensors():
+    """
+    Get information about the soil moisture sensors.
+
+    The sensor data is taken from the HydReSGeo dataset. For other datasets,
+    the dictionary `sensors` has to be modified.
+
+    Returns
+    -------
+    sensors : dict
+        Sensor information consisting of number, field, depth, and name.
+
+    """
+    sensors = {
+        "number": [36554, 36555, 36556, 36547, 36557, 36558,
+                   36559, 36553, 36549, 36550, 36551, 36552,
+                   36560, 36562, 36563, 36564, 36565, 36561],
+        "zone": ["A1", "A1", "A1", "A2", "B1", "B1", "B1", "B2", "C1",
+                 "C1", "C1", "C1", "C2", "D1", "D1", "D1", "D1", "D2"],
+        "depth": [2.5, 5.0, 10.0, 5.0, 2.5, 5.0, 10.0, 5.0, 2.5,
+                  5.0, 10.0, 20.0, 5.0, 2.5, 5.0, 10.0, 20.0, 5.0]}
+    sensors["name"] = ["SM_" + str(sensors["number"][i]) + "_" +
+                       str(sensors["zone"][i]) + "_" + str(sensors["depth"][i])
+                       for i in range(len(sensors["number"]))]
+
+    return sensors
+
+
+def getUppermostSoilMoistureSensors():
+    """
+    Get information about the soil moisture sensors.
+
+    Returns
+    -------
+    sensors : dict
+        Sensor information consisting of number, field, depth, and name.
+
+    """
+    return getSoilMoistureSensorRegistry().getUppermostSensors()
+
+
+def getSoilMoistureSensorRegistry(filepath: str = None):
+    """
+    Get the registry of the soil moisture sensors.
+
+    The registry is built once per file and shared afterwards. If the file
+    is modified (e.g. while the ingestion daemon runs), it is built again.
+
+    Parameters
+    ----------
+    filepath : str or None, optional (default=None)
+        Path to a sensor file, see
+        :meth:`SoilMoistureSensorRegistry.fromFile`. If None, the sensors of
+        the HydReSGeo dataset are used, see :func:`getAllSoilMoistureSensors`.
+
+    Returns
+    -------
+    SoilMoistureSensorRegistry
+        Registry of the soil moisture sensors
+
+    """
+    if filepath is None:
+        return loadSoilMoistureSensorRegistry(None, None)
+    return loadSoilMoistureSensorRegistry(filepath,
+                                          os.stat(filepath).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=16)
+def loadSoilMoistureSensorRegistry(filepath, mtime):
+    """
+    Build the registry of the soil moisture sensors (cached per version).
+
+    Parameters
+    ----------
+    filepath : str or None
+        Path to a sensor file, see :func:`getSoilMoistureSensorRegistry`
+    mtime : int or None
+        Modification time of the file in ns, part of the cache key
+
+    Returns
+    -------
+    SoilMoistureSensorRegistry
+        Registry of the soil moisture sensors
+
+    """
+    if filepath is None:
+        return SoilMoistureSensorRegistry(getAllSoilMoistureSensors())
+    return SoilMoistureSensorRegistry.fromFile(filepath)
+
+
+class SoilMoistureSensorRegistry():
+    """
+    Immutable registry of the soil moisture sensors.
+
+    All attributes are read-only arrays with one entry per sensor, except
+    for `uppermost` and `lookup`. The registry can be shared between threads
+    and processes.
+
+    Parameters
+    ----------
+    sensors : dict or pd.DataFrame
+        Sensor information with the keys number, zone (A1-D2), and depth,
+        see :func:`getAllSoilMoistureSensors`
+
+    Attributes
+    ----------
+    number, zone, depth, name : np.ndarray
+        Sensor number, zone (A1-D2), depth, and name
+    zone_name : np.ndarray of str
+        Zone of the sensor as zone1-zone8
+    uppermost : np.ndarray of int
+        Indices of the uppermost sensor per zone, sorted by zone
+    lookup : np.ndarray of int
+        Index of the sensor for every number from the minimum sensor number
+        on, -1 for unknown sensor numbers
+
+    """
+
+    def __init__(self, sensors):
+        """Initialize SoilMoistureSensorRegistry instance."""
+        sensors = pd.DataFrame(sensors).reset_index(drop=True)
+        number = sensors["number"].values.astype(int)
+        zone = sensors["zone"].values.astype(str)
+        depth = sensors["depth"].values.astype(float)
+
+        # lookup array from sensor number to the index in the registry
+        lookup = np.full(number.max() - number.min() + 1, -1, dtype=int)
+        lookup[number - number.min()] = np.arange(len(number))
+
+        for key, values in [
+                ("number", number), ("zone", zone), ("depth", depth),
+                ("name", np.array(["SM_{0}_{1}_{2}".format(*sensor)
+                                   for sensor in zip(number, zone, depth)])),
+                ("zone_name", sensors["zone"].map(ZONE_DICT).fillna(
+                    sensors["zone"]).values.astype(str)),
+                ("uppermost", sensors.groupby("zone")["depth"].idxmin(
+                    ).values.astype(int)),
+                ("lookup", lookup)]:
+            values.setflags(write=False)
+            object.__setattr__(self, key, values)
+
+    def __setattr__(self, key, value):
+        """Prevent changes of the registry."""
+        raise AttributeError("SoilMoistureSensorRegistry is immutable.")
+
+    def __len__(self):
+        """Get number of sensors."""
+        return len(self.number)
+
+    @classmethod
+    def fromFile(cls, filepath: str):
+        """
+        Load registry from a whitespace-separated sensor file.
+
+        Parameters
+        ----------
+        filepath : str
+            Path to a file with the columns number, zone (A1-D2), and depth
+
+        Returns
+        -------
+        SoilMoistureSensorRegistry
+            Registry of the sensors in the file
+
+        """
+        return cls(pd.read_csv(filepath, sep=r"\s+"))
+
+    def getSensorIndex(self, sensor_ids) -> np.ndarray:
+        """
+        Get the indices of sensors in the registry.
+
+        Parameters
+        ----------
+        sensor_ids : array-like of str or int
+            Sensor IDs as in the soil moisture data (e.g. "T36554") or sensor
+            numbers
+
+        Returns
+        -------
+        np.ndarray of int
+            Index of every sensor, -1 for unknown sensors
+
+        """
+        numbers = pd.to_numeric(pd.Series(np.asarray(sensor_ids)).astype(
+            str).str.lstrip("T"), errors="coerce").values
+        index = numbers - self.number.min()
+        valid = (index >= 0) & (index < len(self.lookup))
+        result = np.full(len(index), -1, dtype=int)
+        result[valid] = self.lookup[index[valid].astype(int)]
+        return result
+
+    def getUppermostSensors(self) -> pd.DataFrame:
+        """
+        Get the uppermost sensor per zone.
+
+        Returns
+        -------
+        pd.DataFrame
+            Number, zone, depth, and name of the uppermost sensors, sorted by
+            zone
+
+        """
+        return pd.DataFrame({
+            "number": self.number, "zone": self.zone, "depth": self.depth,
+            "name": self.name}).iloc[self.uppermost]
+
+
+def getSoilMoistureIndex(soilmoisture_path: str,
+                         sensor_registry: SoilMoistureSensorRegistry) -> dict:
+    """
+    Read the soil moisture data as arrays for the matching with images.
+
+    Parameters
+    ----------
+    soilmoisture_path : str
+        Path to the soil moisture CSV file with the columns sensorID,
+        timestamp, volSM_vol%, and T_C
+    sensor_registry : SoilMoistureSensorRegistry
+        Registry of the soil moisture sensors
+
+    Returns
+    -------
+    dict
+        Arrays sensor (index in the registry), timestamp (UTC, int64 in ns),
+        volSM_vol%, and T_C. Only measurements of known sensors with a valid
+        timestamp are included.
+
+    """
+    df_sm = pd.read_csv(soilmoisture_path)
+    sensor = sensor_registry.getSensorIndex(df_sm["sensorID"])
+    timestamp = pd.to_datetime(df_sm["timestamp"], utc=True)
+    valid = (sensor >= 0) & timestamp.notna().values
+    return {
+        "sensor": sensor[valid],
+        "timestamp": timestamp[valid].values.astype(
+            "datetime64[ns]").astype(np.int64),
+        "volSM_vol%": df_sm["volSM_vol%"].values[valid].astype(float),
+        "T_C": df_sm["T_C"].values[valid].astype(float)}
+
+
+def findNearestDate(date_list, date):
+    """
+    Find closest datapoint of each uppermost sensor in time window.
+
+    Adapted from https://stackoverflow.com/a/32237949/3816498 .
+
+    Parameters
+    ----------
+    date_list : array-like
+        List of dates
+    date : datetime
+        The date, to which the nearest date in `items` should be found.
+
+    Returns
+    -------
+    nearest_date : datetime
+        Nearest date to `date` in `date_list`
     time_delta : int
         Time difference in minutes
 
     """
-    nearest_date = min(date_list, key=lambda x: abs(x - date))
-    time_delta = (nearest_date - date).total_seconds() / 60.
-    return nearest_date, time_delta
+    nearest_date = min(date_list, key=lambda x: abs(x - date))
+    time_delta = (nearest_date - date).total_seconds() / 60.
+    return nearest_date, time_delta
+
+
+def findNearestDates(date_list, dates):
+    """
+    Find the nearest date in a sorted list for multiple dates at once.
+
+    Vectorized version of :func:`findNearestDate` based on a binary search.
+
+    Parameters
+    ----------
+    date_list : array-like
+        List of dates, sorted in ascending order
+    dates : array-like
+        The dates, to which the nearest dates in `date_list` should be found.
+
+    Returns
+    -------
+    nearest_index : np.ndarray of int
+        Index of the nearest date in `date_list` for every date in `dates`.
+        If `date_list` is empty, the index is -1.
+    time_delta : np.ndarray of float
+        Time difference (nearest date - date) in minutes. NaN if the date is
+        NaT or if `date_list` is empty.
+
+    """
+    date_values = pd.to_datetime(pd.Series(date_list, dtype=object),
+                                 utc=True).values.astype(np.int64)
+    dates = pd.to_datetime(pd.Series(dates, dtype=object), utc=True)
+    values = dates.values.astype(np.int64)
+    invalid = dates.isnull().values
+
+    if len(date_values) == 0:
+        return (np.full(len(values), -1, dtype=int),
+                np.full(len(values), np.nan))
+
+    index = np.searchsorted(date_values, values)
+    left = np.clip(index - 1, 0, len(date_values) - 1)
+    right = np.clip(index, 0, len(date_values) - 1)
+    use_right = (np.abs(date_values[right] - values) <
+                 np.abs(date_values[left] - values))
+    nearest_index = np.where(use_right, right, left)
+
+    time_delta = (date_values[nearest_index] - values) / 6e10
+    time_delta[invalid] = np.nan
+    return nearest_index, time_delta
+
+
+def getLwirCatalog(lwir_path: str, timezone: str = "+02:00") -> pd.DataFrame:
+    """
+    Get catalog of all LWIR export files in a folder.
+
+    The datetimes are parsed from the file names, e.g.
+    "ir_export_20170815_P0000000_001_17-56-00.csv".
+
+    Parameters
+    ----------
+    lwir_path : str
+        Path to long-wave infrared (LWIR) data
+    timezone : str, optional (default="+02:00")
+        Timezone of the camera clock, either as UTC offset (e.g. "+02:00") or
+        as name (e.g. "Europe/Berlin").
+
+    Returns
+    -------
+    lwir_catalog : pd.DataFrame
+        One row per LWIR file with the columns path and datetime (UTC), sorted
+        by datetime
+
+    """
+    lwir_catalog = pd.DataFrame({"path": glob.glob(os.path.join(
+        lwir_path, "ir_export_*.csv"))}, dtype=object)
+    name_parts = lwir_catalog["path"].map(os.path.basename).str.split("_")
+    lwir_catalog["datetime"] = pd.to_datetime(
+        name_parts.str[2] + " " + name_parts.str[5].str[:-4],
+        format="%Y%m%d %H-%M-%S").dt.tz_localize(timezone).dt.tz_convert("UTC")
+    return lwir_catalog.sort_values("datetime", ignore_index=True)
+
+
+def getLwirFrames(csvpaths: list) -> np.ndarray:
+    """
+    Load multiple LWIR export files into one array.
+
+    Parameters
+    ----------
+    csvpaths : list of str
+        Paths to the LWIR CSV export files. All files need to have the same
+        image size.
+
+    Returns
+    -------
+    np.ndarray
+        LWIR frames with shape (frames, rows, columns)
+
+    """
+    return np.stack([pd.read_csv(csvpath, sep=";", header=None).values[:, 1:]
+                     for csvpath in csvpaths])
+
+
+def getLwirZoneEdges(positions_lwir: pd.DataFrame,
+                     index_of_meas: int,
+                     zone_list: list) -> np.ndarray:
+    """
+    Get edges of the zones in the LWIR image.
+
+    Parameters
+    ----------
+    positions_lwir : pd.DataFrame
+        Positions config file for the lwir camera
+    index_of_meas : int
+        Index of the measurement in `positions_lwir`
+    zone_list : list
+        List of measurement zones
+
+    Returns
+    -------
+    np.ndarray of int
+        Edges (row_start, row_end, col_start, col_end) with shape (zones, 4)
+
+    """
+    return np.array([[positions_lwir[zone+suffix][index_of_meas]
+                      for suffix in ["_row_start", "_row_end",
+                                     "_col_start", "_col_end"]]
+                     for zone in zone_list], dtype=int).reshape(-1, 4)
+
+
+def getLwirZoneStatistics(frames: np.ndarray, edges) -> np.ndarray:
+    """
+    Get mean, median, and standard deviation of zones in LWIR frames.
+
+    The statistics are calculated for all frames at once.
+
+    Parameters
+    ----------
+    frames : np.ndarray
+        LWIR frames with shape (frames, rows, columns)
+    edges : np.ndarray of int
+        Edges (row_start, row_end, col_start, col_end) with shape (zones, 4)
+
+    Returns
+    -------
+    stats : np.ndarray
+        Mean, median, and standard deviation with shape (frames, zones, 3)
+
+    """
+    stats = np.empty((frames.shape[0], len(edges), 3))
+    for i, zone_edges in enumerate(edges):
+        stats[:, i] = getLwirGridStatistics(
+            frames, zone_edges, grid_real=(1, 1))[0, 0]
+    return stats
+
+
+def getLwirGridStatistics(frames: np.ndarray,
+                          edges,
+                          grid_real,
+                          remainder: str = "drop",
+                          hyp_edges=None) -> np.ndarray:
+    """
+    Get mean, median, and standard deviation of grid elements in LWIR frames.
+
+    The same block reduction as for the hyperspectral images is used, see
+    :func:`hprocessing.ProcessEnviFile.getGridBlocks`. If the edges of the
+    zone in the hyperspectral image are given, its grid elements are mapped
+    proportionally to the LWIR zone (see
+    :func:`hprocessing.ProcessEnviFile.getMappedGridBounds`), i.e. there is
+    one LWIR grid element per hyperspectral grid element.
+
+    Parameters
+    ----------
+    frames : np.ndarray
+        LWIR frames with shape (frames, rows, columns)
+    edges : list of 4 int
+        Edges of the zone (row_start, row_end, col_start, col_end)
+    grid_real : (int, int)
+        Number of grid rows and columns
+    remainder : str, optional (default="drop")
+        Handling of the pixels that do not fit into the grid, see
+        :func:`hprocessing.ProcessEnviFile.getGridCells`
+    hyp_edges : list of 4 int or None, optional (default=None)
+        Edges of the zone in the hyperspectral image. If None, the LWIR zone
+        itself is divided into the grid.
+
+    Returns
+    -------
+    stats : np.ndarray
+        Mean, median, and standard deviation with shape
+        (grid rows, grid columns, frames, 3)
+
+    """
+    data = np.moveaxis(frames, 0, -1)
+    if hyp_edges is None:
+        blocks = getGridBlocks(data, edges=edges, grid_real=grid_real,
+                               remainder=remainder)
+    else:
+        blocks = getBlocksFromBounds(
+            data,
+            getMappedGridBounds(hyp_edges[0], hyp_edges[1], grid_real[0],
+                                edges[0], edges[1], remainder=remainder),
+            getMappedGridBounds(hyp_edges[2], hyp_edges[3], grid_real[1],
+                                edges[2], edges[3], remainder=remainder))
+    return np.stack([getBlockStatistics(blocks, mode=mode)
+                     for mode in ["mean", "median", "std"]], axis=-1)
+
+
+def getLwirMeasurementIndex(positions_lwir: pd.DataFrame,
+                            lwir_datetimes,
+                            timezone: str = "+02:00") -> np.ndarray:
+    """
+    Get the positions row of LWIR images.
+
+    The positions row of an image is the one where the measurement equals the
+    date of the image (yyyymmdd). Without measurement column, the first row
+    is used.
+
+    Parameters
+    ----------
+    positions_lwir : pd.DataFrame
+        Positions config file for the lwir camera
+    lwir_datetimes : array-like
+        Datetimes of the LWIR images
+    timezone : str, optional (default="+02:00")
+        Timezone of the LWIR camera clock
+
+    Returns
+    -------
+    np.ndarray of float
+        Index of the positions row, NaN if there is no row for the date
+
+    """
+    lwir_datetimes = pd.to_datetime(pd.Series(lwir_datetimes, dtype=object),
+                                    utc=True)
+    if "measurement" not in positions_lwir.columns:
+        return np.zeros(len(lwir_datetimes))
+    meas_index = dict(zip(positions_lwir["measurement"].astype(str),
+                          range(positions_lwir.shape[0])))
+    return lwir_datetimes.dt.tz_convert(timezone).dt.strftime(
+        "%Y%m%d").map(meas_index).values.astype(float)
+
+
+def getLwirDataBatch(hyp_datetimes,
+                     lwir_path: str,
+                     positions_lwir: pd.DataFrame,
+                     zone_list: list,
+                     time_window_width: int = 6,
+                     timezone: str = "+02:00",
+                     batch_size: int = 64) -> pd.DataFrame:
+    """
+    Get zone-wise LWIR data for multiple hyperspectral images at once.
+
+    Every image is matched to the nearest LWIR file within the time window.
+    The matched frames are loaded in batches of (frames, rows, columns) and
+    the zone statistics are calculated for the whole batch at once. The
+    positions row of a frame is the one where the measurement equals the
+    date of the frame (yyyymmdd). Without measurement column, the first row
+    is used.
+
+    Parameters
+    ----------
+    hyp_datetimes : array-like
+        Datetimes of the hyperspectral images
+    lwir_path : str
+        Path to long-wave infrared (LWIR) data
+    positions_lwir : pd.DataFrame
+        Positions config file for the lwir camera
+    zone_list : list
+        List of measurement zones
+    time_window_width : int, optional (default=6)
+        Time window width to match the hyperspectral image to the LWIR data.
+        The unit of the time window width is minutes.
+    timezone : str, optional (default="+02:00")
+        Timezone of the LWIR camera clock
+    batch_size : int, optional (default=64)
+        Maximum number of LWIR frames in memory at the same time
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per matched image and zone with the columns image (index in
+        `hyp_datetimes`), datetime, zone, mean, med, and std. Images without
+        LWIR data are not included.
+
+    """
+    lwir_catalog = getLwirCatalog(lwir_path, timezone=timezone)
+    hyp_datetimes = pd.to_datetime(pd.Series(hyp_datetimes, dtype=object),
+                                   utc=True)
+    nearest_index, time_delta = findNearestDates(lwir_catalog["datetime"],
+                                                 hyp_datetimes)
+
+    # get positions row of every LWIR frame
+    frame_meas_index = getLwirMeasurementIndex(
+        positions_lwir, lwir_catalog["datetime"], timezone=timezone)
+
+    # only consider images within the time window and with positions
+    image_index = np.flatnonzero(np.abs(time_delta) <= time_window_width / 2)
+    image_index = image_index[~np.isnan(
+        frame_meas_index[nearest_index[image_index]])]
+    frame_index = np.unique(nearest_index[image_index])
+
+    # calculate statistics in batches of frames with the same positions
+    frame_stats = np.empty((lwir_catalog.shape[0], len(zone_list), 3))
+    for meas_i in np.unique(frame_meas_index[frame_index]):
+        edges = getLwirZoneEdges(positions_lwir, int(meas_i), zone_list)
+        meas_frames = frame_index[frame_meas_index[frame_index] == meas_i]
+        for start in range(0, len(meas_frames), batch_size):
+            batch = meas_frames[start:start+batch_size]
+            frame_stats[batch] = getLwirZoneStatistics(
+                getLwirFrames(lwir_catalog["path"].values[batch]), edges)
+
+    # one row per image and zone
+    stats = frame_stats[nearest_index[image_index]].reshape(-1, 3)
+    return pd.DataFrame({
+        "image": np.repeat(image_index, len(zone_list)),
+        "datetime": hyp_datetimes.iloc[np.repeat(
+            image_index, len(zone_list))].reset_index(drop=True),
+        "zone": np.tile(zone_list, len(image_index)),
+        "mean": stats[:, 0],
+        "med": stats[:, 1],
+        "std": stats[:, 2]})
+
+
+def splitSpectra(data: pd.DataFrame, wavelengths: list) -> tuple:
+    """
+    Split output data into a spectra array and a metadata table.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Output data with one column per wavelength, e.g. from
+        :meth:`ProcessFullDataset.process`
+    wavelengths : list
+        Column names of the spectra
+
+    Returns
+    -------
+    spectra : np.ndarray
+        Spectra with shape (rows, wavelengths)
+    metadata : pd.DataFrame
+        All other columns of `data`
+
+    """
+    spectra = data[wavelengths].values
+    metadata = data.drop(labels=wavelengths, axis=1).reset_index(drop=True)
+    return spectra, metadata
+
+
+def saveLongFormat(filepath: str,
+                   spectra: np.ndarray,
+                   metadata: pd.DataFrame,
+                   wavelengths: list):
+    """
+    Save spectra and metadata together in one NPZ file.
+
+    The wavelengths are stored once, the metadata column-wise. Datetime
+    columns are stored in UTC, text columns as strings together with a mask
+    of the missing values. The file can be read without pickle, see
+    :func:`readLongFormat`.
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the NPZ file. The ending ".npz" is appended if missing.
+    spectra : np.ndarray
+        Spectra with shape (rows, wavelengths)
+    metadata : pd.DataFrame
+        Metadata with one row per spectrum
+    wavelengths : list
+        Wavelengths of the spectra
+
+    """
+    arrays = {"spectra": np.asarray(spectra),
+              "wavelengths": np.asarray(wavelengths, dtype=str),
+              "columns": np.asarray(metadata.columns, dtype=str)}
+    for i, column in enumerate(metadata.columns):
+        values = metadata[column]
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+        values = values.values
+        if values.dtype == object:
+            arrays["column_{0}_null".format(i)] = pd.isnull(values)
+            values = values.astype(str)
+        arrays["column_{0}".format(i)] = values
+    np.savez(filepath, **arrays)
+
+
+def readLongFormat(filepath: str) -> tuple:
+    """
+    Read spectra and metadata from an NPZ file.
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the NPZ file, see :func:`saveLongFormat`
+
+    Returns
+    -------
+    spectra : np.ndarray
+        Spectra with shape (rows, wavelengths)
+    metadata : pd.DataFrame
+        Metadata with one row per spectrum, datetimes in UTC
+    wavelengths : np.ndarray of str
+        Wavelengths of the spectra
+
+    """
+    with np.load(filepath, allow_pickle=False) as npz:
+        metadata = pd.DataFrame({
+            column: npz["column_{0}".format(i)]
+            for i, column in enumerate(npz["columns"])})
+        for i, column in enumerate(metadata.columns):
+            if pd.api.types.is_datetime64_dtype(metadata[column]):
+                metadata[column] = metadata[column].dt.tz_localize("UTC")
+
+            # text columns with missing values
+            if "column_{0}_null".format(i) in npz.files:
+                metadata[column] = metadata[column].astype(object).mask(
+                    npz["column_{0}_null".format(i)])
+        return npz["spectra"], metadata, npz["wavelengths"]
 
 
 def readConfig(config_path: str,
@@ -504,6 +2373,27 @@ def readConfig(config_path: str,
         config_dict[var] = (data_directory + config["Paths"][var])
     config_dict["data_output"] = config["Paths"]["data_output"]
 
+    # read out folder of the QA plots
+    config_dict["qa_output"] = config["Paths"].get("qa_output",
+                                                   fallback="plots/")
+
+    # read out folder of the work queue
+    config_dict["queue"] = config["Paths"].get("queue", fallback="queue/")
+
+    # read out spectral store of the incremental ingestion
+    config_dict["ingest_store"] = config["Paths"].get("ingest_store",
+                                                      fallback="store/")
+
+    # read out file of the spectralon cache (default: no cache file)
+    config_dict["spectralon_cache"] = config["Paths"].get("spectralon_cache",
+                                                          fallback=None)
+
+    # read out soil moisture sensors (default: sensors of HydReSGeo dataset)
+    config_dict["soilmoisture_sensors"] = None
+    if config["Paths"].get("soilmoisture_sensors"):
+        config_dict["soilmoisture_sensors"] = (
+            data_directory + config["Paths"]["soilmoisture_sensors"])
+
     # read out positions, ignore-csv-files, and masks
     for var in ["positions_hyp", "positions_lwir",
                 "ignore_hyp_measurements", "ignore_hyp_fields",
@@ -541,10 +2431,97 @@ def readConfig(config_path: str,
     config_dict["hyp_spectralon_factor"] = float(
         config["Process"]["hyp_spectralon_factor"])
 
+    # read out reuse of the spectralon of other images if it is occluded
+    config_dict["hyp_spectralon_reuse"] = config["Process"].get(
+        "hyp_spectralon_reuse", fallback="none")
+    config_dict["hyp_spectralon_window"] = config["Process"].getfloat(
+        "hyp_spectralon_window", fallback=30.)
+    config_dict["hyp_spectralon_min_ratio"] = config["Process"].getfloat(
+        "hyp_spectralon_min_ratio", fallback=0.5)
+
     # read out hyperspectral spectralon factor
     config_dict["hyp_stat_mode"] = str(
         config["Process"]["hyp_stat_mode"])
 
+    # read out preprocessing steps of the spectra (none = no preprocessing)
+    config_dict["hyp_preprocessing"] = tuple(
+        step.strip() for step in config["Process"].get(
+            "hyp_preprocessing", fallback="none").split(",")
+        if step.strip() not in ["", "none"])
+    config_dict["hyp_savgol_window"] = config["Process"].getint(
+        "hyp_savgol_window", fallback=11)
+    config_dict["hyp_savgol_polyorder"] = config["Process"].getint(
+        "hyp_savgol_polyorder", fallback=2)
+
+    # read out if integral images are used for the hyperspectral statistics
+    config_dict["hyp_integral_image"] = config["Process"].getboolean(
+        "hyp_integral_image", fallback=False)
+
+    # read out working data type of the hyperspectral statistics
+    config_dict["hyp_dtype"] = config["Process"].get(
+        "hyp_dtype", fallback="float64")
+
+    # read out handling of the pixels that do not fit into the grid
+    config_dict["grid_remainder"] = config["Process"].get(
+        "grid_remainder", fallback="drop")
+
+    # read out timezone of the camera clocks
+    config_dict["timezone"] = config["Process"].get(
+        "timezone", fallback="+02:00")
+
+    # read out if LWIR data is extracted grid-wise
+    config_dict["lwir_grid"] = config["Process"].getboolean(
+        "lwir_grid", fallback=False)
+
+    # read out batch size of the LWIR processing (0 = image by image)
+    config_dict["lwir_batch_size"] = config["Process"].getint(
+        "lwir_batch_size", fallback=0)
+
+    # read out format of the output file (csv, npz, or store)
+    config_dict["output_format"] = config["Process"].get(
+        "output_format", fallback="csv")
+
+    # read out number of bands per chunk of the spectral store
+    config_dict["store_band_chunk_size"] = config["Process"].getint(
+        "store_band_chunk_size", fallback=32)
+
+    # read out sample to check if hyperspectral images are empty
+    config_dict["hyp_empty_bands"] = tuple(
+        int(band) for band in config["Process"].get(
+            "hyp_empty_bands", fallback="5").split(","))
+    config_dict["hyp_empty_step"] = config["Process"].getint(
+        "hyp_empty_step", fallback=1)
+    config_dict["hyp_prefilter_empty"] = config["Process"].getboolean(
+        "hyp_prefilter_empty", fallback=False)
+
+    # read out band and number of processes of the QA plots
+    config_dict["qa_channel"] = config["Process"].getint("qa_channel",
+                                                         fallback=90)
+    config_dict["qa_jobs"] = config["Process"].getint("qa_jobs", fallback=0)
+
+    # read out number of processes for the hyperspectral images (1 = this
+    # process, 0 = number of CPUs, other than 1 requires Python 3.8)
+    config_dict["hyp_jobs"] = config["Process"].getint("hyp_jobs",
+                                                       fallback=1)
+
+    # read out timeout of claims (in seconds) and attempts of the work queue
+    config_dict["queue_claim_timeout"] = config["Process"].getfloat(
+        "queue_claim_timeout", fallback=3600.)
+    config_dict["queue_max_attempts"] = config["Process"].getint(
+        "queue_max_attempts", fallback=3)
+
+    # read out timing of the incremental ingestion (in seconds)
+    config_dict["ingest_poll_interval"] = config["Process"].getfloat(
+        "ingest_poll_interval", fallback=5.)
+    config_dict["ingest_settle_time"] = config["Process"].getfloat(
+        "ingest_settle_time", fallback=2.)
+    config_dict["ingest_max_wait"] = config["Process"].getfloat(
+        "ingest_max_wait", fallback=3600.)
+
+    # read out number of hyperspectral images to read ahead
+    config_dict["prefetch_depth"] = config["Process"].getint(
+        "prefetch_depth", fallback=0)
+
     return config_dict
 
 
@@ -589,13 +2566,92 @@ def processHydReSGeoDataset(config_path: str,
 
     Returns
     -------
-    pd.DataFrame
-        Output data of the processing
+    pd.DataFrame or tuple or SpectralStore
+        Output data of the processing. With the output format npz, the tuple
+        (spectra, metadata, wavelengths), see :func:`readLongFormat`. With
+        the output format store, the spectral store in the folder
+        `data_output`, see :class:`hprocessing.SpectralStore.SpectralStore`.
 
     """
+    from tqdm import tqdm
+
     # path to the output folder
     config = readConfig(config_path=config_path, data_directory=data_directory)
-    params = {
+    params = getProcessingParameters(config, verbose=verbose)
+    soilmoisture_data = getSoilMoistureIndex(config["data_sm"],
+                                             params["sensor_registry"])
+
+    if (not config["overwrite_csv_file"] and
+            os.path.exists(getOutputPath(config))):
+        print("Processing not executed, file already exists.")
+        print("To overwrite the existing file, change the config.")
+
+    # collect hyperspectral images which are not ignored
+    hyp_tasks = getHyperspectralTasks(config, verbose=verbose)
+
+    # with the spectralon reuse, the workers only read the spectralon cache,
+    # it is filled beforehand
+    header_cache = EnviHeaderCache()
+    if config["hyp_spectralon_reuse"] != "none":
+        fillSpectralonCache(hyp_tasks, params, header_cache=header_cache)
+
+    # extract LWIR data of all images in batches
+    lwir_data_list = [None] * len(hyp_tasks)
+    if config["lwir_batch_size"] > 0 and not config["lwir_grid"]:
+        lwir_batch = getLwirDataBatch(
+            hyp_datetimes=[task[3] for task in hyp_tasks],
+            lwir_path=config["data_lwir"],
+            positions_lwir=config["positions_lwir"],
+            zone_list=["zone"+str(i) for i in range(1, 9)],
+            time_window_width=config["time_window_width"],
+            timezone=config["timezone"],
+            batch_size=config["lwir_batch_size"])
+        lwir_data_list = [lwir_batch.iloc[:0]] * len(hyp_tasks)
+        for i, lwir_data in lwir_batch.groupby("image"):
+            lwir_data_list[i] = lwir_data
+
+    # loop through hyperspectral images, the next ones are read in background
+    prefetcher = EnviPrefetcher(
+        hyp_hdr_paths=[task[0] for task in hyp_tasks],
+        prefetch_depth=config["prefetch_depth"],
+        header_cache=header_cache)
+    if config["hyp_jobs"] == 1:
+        results = processImages(hyp_tasks, lwir_data_list, prefetcher,
+                                dict(params,
+                                     soilmoisture_data=soilmoisture_data))
+    else:
+        results = processImagesShared(hyp_tasks, lwir_data_list, prefetcher,
+                                      params, soilmoisture_data,
+                                      n_jobs=config["hyp_jobs"])
+    output = saveOutput(config, tqdm(results, total=len(hyp_tasks)))
+
+    if config["spectralon_cache"]:
+        params["hyp_spectralon_cache"].save(config["spectralon_cache"])
+    if verbose:
+        print("Successfully executed!")
+
+    return output
+
+
+def getProcessingParameters(config: dict, verbose=0) -> dict:
+    """
+    Get the parameters of :class:`ProcessFullDataset` from the config.
+
+    Parameters
+    ----------
+    config : dict
+        Config as from :func:`readConfig`
+    verbose : int, optional (default=0)
+        Controls the verbosity.
+
+    Returns
+    -------
+    dict
+        Parameters of :class:`ProcessFullDataset` which are the same for
+        all images
+
+    """
+    return {
         "positions_hyp": config["positions_hyp"],
         "positions_lwir": config["positions_lwir"],
         "lwir_path": config["data_lwir"],
@@ -604,68 +2660,535 @@ def processHydReSGeoDataset(config_path: str,
         "grid": config["grid"],
         "imageshape": config["imageshape"],
         "time_window_width": config["time_window_width"],
+        "hyp_stat_mode": config["hyp_stat_mode"],
+        "hyp_spectralon_factor": config["hyp_spectralon_factor"],
+        "hyp_spectralon_cache": getSpectralonCache(config),
+        "hyp_spectralon_reuse": config["hyp_spectralon_reuse"],
+        "hyp_spectralon_window": config["hyp_spectralon_window"],
+        "hyp_spectralon_min_ratio": config["hyp_spectralon_min_ratio"],
+        "hyp_preprocessing": config["hyp_preprocessing"],
+        "hyp_savgol_window": config["hyp_savgol_window"],
+        "hyp_savgol_polyorder": config["hyp_savgol_polyorder"],
+        "hyp_integral_image": config["hyp_integral_image"],
+        "hyp_dtype": config["hyp_dtype"],
+        "grid_remainder": config["grid_remainder"],
+        "timezone": config["timezone"],
+        "lwir_grid": config["lwir_grid"],
+        "empty_check_bands": config["hyp_empty_bands"],
+        "empty_check_step": config["hyp_empty_step"],
+        "sensor_registry": getSoilMoistureSensorRegistry(
+            config["soilmoisture_sensors"]),
+        "geometry": MeasurementGeometry(config["positions_hyp"],
+                                        masks=config["masks_hyp"]),
         "verbose": verbose
     }
 
-    output_list = []
 
-    if (not config["overwrite_csv_file"] and
-            os.path.isfile(config["data_output"])):
-        print("Processing not executed, file already exists.")
-        print("To overwrite the existing file, change the config.")
+def getSpectralonCache(config: dict):
+    """
+    Get the spectralon cache of the config.
+
+    Parameters
+    ----------
+    config : dict
+        Config as from :func:`readConfig`
+
+    Returns
+    -------
+    SpectralonCache or None
+        Cache loaded from the file `spectralon_cache` if it exists, an empty
+        cache if the file does not exist yet or if the spectralon of other
+        images is reused, otherwise None
+
+    """
+    if config["spectralon_cache"] and os.path.isfile(
+            config["spectralon_cache"]):
+        return SpectralonCache.load(config["spectralon_cache"])
+    if config["spectralon_cache"] or config["hyp_spectralon_reuse"] != "none":
+        return SpectralonCache()
+    return None
+
+
+def fillSpectralonCache(hyp_tasks: list,
+                        params: dict,
+                        header_cache: EnviHeaderCache = None) -> list:
+    """
+    Add the spectralon spectra of all images to the spectralon cache.
+
+    This first pass runs in the driver before the images are processed if
+    the spectralon of other images is reused. The occluded spectralons are
+    then detected with the spectra of all images (see
+    :meth:`SpectralonCache.markOccluded`) and the workers only read their
+    copies of the filled cache, i.e. the output does not depend on the
+    order in which the images are processed. The keys and edges are taken
+    from the tasks and the positions, only the images which are not in the
+    cache yet are read.
+
+    Parameters
+    ----------
+    hyp_tasks : list of tuple
+        (hyp_hdr_path, meas_name, file_number, hyp_datetime, zone_list) of
+        every image, see :func:`getHyperspectralTasks`
+    params : dict
+        Further parameters of :class:`ProcessFullDataset` with the cache
+        `hyp_spectralon_cache`
+    header_cache : EnviHeaderCache or None, optional (default=None)
+        Cache for the list fields of the headers, e.g. the one of the
+        :class:`EnviPrefetcher` of the processing
+
+    Returns
+    -------
+    list of str
+        Images which were added to the cache
+
+    """
+    cache = params["hyp_spectralon_cache"]
+    geometry = params.get("geometry")
+    if geometry is None:
+        geometry = MeasurementGeometry(params["positions_hyp"],
+                                       masks=params.get("masks"))
+    new_keys = []
+    for hyp_header, meas_name, _, hyp_datetime, zone_list in hyp_tasks:
+        key = getSpectralonKey(hyp_header, meas_name)
+        edges = geometry.getEdges(geometry.getIndexOfMeasurement(meas_name),
+                                  prefixes=["spec"])["spec"]
+        if cache.get(key, edges=edges) is not None:
+            continue
+
+        proc = ProcessFullDataset(
+            hyp_hdr_path=hyp_header,
+            meas_name=meas_name,
+            zone_list=zone_list,
+            hyp_datetime=hyp_datetime,
+            header_cache=header_cache,
+            **dict(params, geometry=geometry))
+        if isEmptyImage(proc.envi_img, bands=proc.empty_check_bands,
+                        pixel_step=proc.empty_check_step):
+            continue
+        envi_processor = proc.getEnviProcessor()
+        cache.put(key, proc.datetime, envi_processor.getSpectralon(), edges,
+                  wavelengths=envi_processor.wavelengths)
+        new_keys.append(key)
+
+    if params.get("hyp_spectralon_reuse", "none") != "none":
+        cache.markOccluded(
+            new_keys, params.get("hyp_spectralon_window", 30),
+            mode=params["hyp_spectralon_reuse"],
+            min_ratio=params.get("hyp_spectralon_min_ratio", 0.5))
+    return new_keys
+
+
+def getHyperspectralTasks(config: dict,
+                          catalog: pd.DataFrame = None,
+                          verbose=0) -> list:
+    """
+    Get the hyperspectral images to process without the ignored ones.
+
+    Parameters
+    ----------
+    config : dict
+        Config as from :func:`readConfig`
+    catalog : pd.DataFrame or None, optional (default=None)
+        Catalog of the images, see :func:`getHyperspectralCatalog`. If None,
+        all images in `data_hyp` are used.
+    verbose : int, optional (default=0)
+        Controls the verbosity.
+
+    Returns
+    -------
+    hyp_tasks : list of tuple
+        (hyp_hdr_path, meas_name, file_number, hyp_datetime, zone_list) of
+        every image
 
-    # loop through hyperspectral images
-    for _, hyp_header in enumerate(
-            tqdm(glob.glob(config["data_hyp"]+"*/*[0-9].hdr"))):
+    """
+    ignore_rules = getIgnoreRules(
+        ignore_hyp_measurements=config["ignore_hyp_measurements"],
+        ignore_hyp_datapoints=config["ignore_hyp_datapoints"],
+        ignore_hyp_fields=config["ignore_hyp_fields"])
+    if catalog is None:
+        catalog = getHyperspectralCatalog(data_hyp=config["data_hyp"],
+                                          timezone=config["timezone"])
+    hyp_tasks = []
+    for hyp_header, meas_name, file_number, hyp_datetime in zip(
+            catalog["path"], catalog["measurement"], catalog["filenumber"],
+            catalog["datetime"]):
 
-        meas_name = hyp_header.split("/")[-2].replace("_hyp", "")
-        file_number = int(hyp_header.split("/")[-1][4:7])
         zone_list = ["zone"+str(i) for i in range(1, 9)]
 
         # ignore measurements
-        if verbose:
-            print("-"*50)
-            print("Processing {0} - file {1}...".format(
-                meas_name, file_number))
-        if meas_name in config["ignore_hyp_measurements"].values:
+        if meas_name in ignore_rules["measurements"]:
             if verbose:
-                print("Ignoring measurement.")
+                print("Ignoring measurement {0}.".format(meas_name))
             continue
 
         # ignore datapoint
-        if meas_name in config["ignore_hyp_datapoints"]["measurement"].values:
-            if file_number in config["ignore_hyp_datapoints"][
-                    config["ignore_hyp_datapoints"]["measurement"] ==
-                    meas_name]["filenumber"].values:
-                if verbose:
-                    print("Ignoring file.")
-                continue
+        if (meas_name, file_number) in ignore_rules["datapoints"]:
+            if verbose:
+                print("Ignoring {0} - file {1}.".format(
+                    meas_name, file_number))
+            continue
 
         # ignore field
-        if meas_name in config["ignore_hyp_fields"]["measurement"].values:
-            if file_number in config["ignore_hyp_fields"][
-                    config["ignore_hyp_fields"]["measurement"] ==
-                    meas_name]["filenumber"].values:
-                zones_to_drop = config["ignore_hyp_fields"][
-                    (config["ignore_hyp_fields"]["measurement"] == meas_name) &
-                    (config["ignore_hyp_fields"]["filenumber"] == file_number)
-                    ]["zone"].values
-                for zone_to_drop in zones_to_drop:
-                    zone_list.remove("zone"+str(zone_to_drop))
-                if verbose:
-                    print("Removed {0} zone(s).".format(len(zones_to_drop)))
+        zones_to_drop = ignore_rules["fields"].get((meas_name, file_number))
+        if zones_to_drop:
+            zone_list = [zone for zone in zone_list
+                         if zone not in zones_to_drop]
+            if verbose:
+                print("Removed {0} zone(s) of {1} - file {2}.".format(
+                    len(zones_to_drop), meas_name, file_number))
+
+        hyp_tasks.append((hyp_header, meas_name, file_number, hyp_datetime,
+                          zone_list))
+
+    # only the images which are not ignored are read
+    if config["hyp_prefilter_empty"]:
+        n_images = len(hyp_tasks)
+        non_empty = set(filterEmptyImages(
+            pd.DataFrame({"path": [task[0] for task in hyp_tasks]}),
+            bands=config["hyp_empty_bands"],
+            pixel_step=config["hyp_empty_step"])["path"])
+        hyp_tasks = [task for task in hyp_tasks if task[0] in non_empty]
+        if verbose:
+            print("Removed {0} empty image(s).".format(
+                n_images - len(hyp_tasks)))
+    return hyp_tasks
 
-        proc = ProcessFullDataset(
-            hyp_hdr_path=hyp_header,
-            meas_name=meas_name,
-            zone_list=zone_list,
-            **params)
-        datapoint = proc.process()
-        if datapoint is not None:
-            output_list.append(datapoint)
-    output_df = pd.concat(output_list, axis=0, ignore_index=True)
-    output_df.to_csv(config["data_output"])
-    if verbose:
-        print("Successfully executed!")
 
-    return output_df
+def getOutputPath(config: dict) -> str:
+    """
+    Get path of the output file (or folder) of the config.
+
+    With the output format npz, the ending of `data_output` (e.g. ".csv") is
+    replaced by ".npz".
+
+    Parameters
+    ----------
+    config : dict
+        Config as from :func:`readConfig`
+
+    Returns
+    -------
+    str
+        Path of the output file, or of the folder of the spectral store
+
+    """
+    if config["output_format"] == "npz":
+        return os.path.splitext(config["data_output"])[0] + ".npz"
+    return config["data_output"]
+
+
+def saveOutput(config: dict, results):
+    """
+    Save the processed images in the output format of the config.
+
+    Parameters
+    ----------
+    config : dict
+        Config as from :func:`readConfig`
+    results : iterable of tuple
+        Output of :meth:`ProcessFullDataset.process` and the wavelengths of
+        the hyperspectral data for every image, e.g. from
+        :func:`processImages`
+
+    Returns
+    -------
+    pd.DataFrame or tuple or SpectralStore
+        Output data, see :func:`processHydReSGeoDataset`
+
+    """
+    output_list = []
+
+    # open spectral store
+    if config["output_format"] == "store":
+        from .SpectralStore import SpectralStore
+
+        store = SpectralStore(getOutputPath(config),
+                              band_chunk_size=config["store_band_chunk_size"])
+        if config["overwrite_csv_file"]:
+            store.clear()
+
+    for datapoint, hyp_wavelengths in results:
+        if datapoint is None:
+            continue
+        if config["output_format"] in ["npz", "store"]:
+            wavelengths = hyp_wavelengths
+            datapoint = splitSpectra(datapoint, wavelengths)
+        if config["output_format"] == "store":
+            store.append(*datapoint, wavelengths=wavelengths)
+            continue
+        output_list.append(datapoint)
+
+    if config["output_format"] == "store":
+        output = store
+    elif config["output_format"] == "npz":
+        output = (np.concatenate([spectra for spectra, _ in output_list]),
+                  pd.concat([metadata for _, metadata in output_list],
+                            axis=0, ignore_index=True),
+                  np.asarray(wavelengths, dtype=str))
+        saveLongFormat(getOutputPath(config), *output)
+    else:
+        output = pd.concat(output_list, axis=0, ignore_index=True)
+        output.to_csv(getOutputPath(config))
+    return output
+
+
+def processImages(hyp_tasks: list,
+                  lwir_data_list: list,
+                  hyp_files_list,
+                  params: dict):
+    """
+    Process hyperspectral images one after the other in this process.
+
+    Parameters
+    ----------
+    hyp_tasks : list of tuple
+        (hyp_hdr_path, meas_name, file_number, hyp_datetime, zone_list) of
+        every image
+    lwir_data_list : list
+        Already extracted LWIR data (or None) of every image
+    hyp_files_list : iterable of tuple
+        (header, image, highres header) of every image, e.g. an
+        :class:`EnviPrefetcher`
+    params : dict
+        Further parameters of :class:`ProcessFullDataset`
+
+    Yields
+    ------
+    tuple
+        Output of :meth:`ProcessFullDataset.process` and the wavelengths of
+        the hyperspectral data for every image
+
+    """
+    for task, lwir_data, hyp_files in zip(hyp_tasks, lwir_data_list,
+                                          hyp_files_list):
+        yield processImage(task, lwir_data, hyp_files, params)
+
+
+def processImage(task: tuple,
+                 lwir_data,
+                 hyp_files: tuple,
+                 params: dict) -> tuple:
+    """
+    Process one hyperspectral image.
+
+    Parameters
+    ----------
+    task : tuple
+        (hyp_hdr_path, meas_name, file_number, hyp_datetime, zone_list)
+    lwir_data : pd.DataFrame or None
+        Already extracted LWIR data of the image
+    hyp_files : tuple
+        (header, image, highres header) of the image
+    params : dict
+        Further parameters of :class:`ProcessFullDataset`
+
+    Returns
+    -------
+    tuple
+        Output of :meth:`ProcessFullDataset.process` and the wavelengths of
+        the hyperspectral data
+
+    """
+    hyp_header, meas_name, file_number, hyp_datetime, zone_list = task
+    if params.get("verbose"):
+        print("-"*50)
+        print("Processing {0} - file {1}...".format(meas_name, file_number))
+
+    proc = ProcessFullDataset(
+        hyp_hdr_path=hyp_header,
+        meas_name=meas_name,
+        zone_list=zone_list,
+        hyp_datetime=hyp_datetime,
+        lwir_data=lwir_data,
+        hyp_files=hyp_files,
+        **params)
+    return proc.process(), proc.hyp_wavelengths
+
+
+def processImagesShared(hyp_tasks: list,
+                        lwir_data_list: list,
+                        hyp_files_list,
+                        params: dict,
+                        soilmoisture_data: dict,
+                        n_jobs: int = 0):
+    """
+    Process hyperspectral images in worker processes via shared memory.
+
+    The soil moisture data is placed once in shared memory and the cube of
+    every image is placed in shared memory by this (driver) process. The
+    workers attach zero-copy views instead of reading or unpickling the
+    data, see :class:`hprocessing.SharedArrays.SharedArrayPool`. The segment
+    of a cube is removed as soon as its image is processed, all others at
+    the end. At most two images per worker are in flight. Shared memory
+    requires Python 3.8 or newer.
+
+    Parameters
+    ----------
+    hyp_tasks, lwir_data_list, hyp_files_list, params
+        See :func:`processImages`
+    soilmoisture_data : dict
+        Soil moisture data, see :func:`getSoilMoistureIndex`
+    n_jobs : int, optional (default=0)
+        Number of worker processes. If zero, the number of CPUs is used.
+
+    Yields
+    ------
+    tuple
+        Output of :meth:`ProcessFullDataset.process` and the wavelengths of
+        the hyperspectral data for every image in the order of `hyp_tasks`.
+        The spectralons calculated by the workers are added to the cache
+        `hyp_spectralon_cache` of `params`.
+
+    """
+    # multiprocessing.shared_memory requires Python 3.8
+    from .SharedArrays import SharedArrayPool
+
+    n_jobs = n_jobs or os.cpu_count()
+    with SharedArrayPool() as pool:
+        table_infos = pool.putDict(soilmoisture_data)
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=n_jobs, initializer=initSharedWorker,
+                initargs=(params, table_infos)) as executor:
+            pending = collections.deque()
+            for task, lwir_data, hyp_files in zip(hyp_tasks, lwir_data_list,
+                                                  hyp_files_list):
+                hdr, envi_img, hdr_highres = hyp_files
+                if not isinstance(envi_img, np.ndarray):
+                    envi_img = envi_img.load()
+                cube_info = pool.put(envi_img)
+                pending.append((executor.submit(
+                    processSharedImage, task, lwir_data, (hdr, hdr_highres),
+                    cube_info), cube_info))
+
+                while len(pending) >= 2*n_jobs:
+                    future, cube_info = pending.popleft()
+                    yield putSpectralonEntry(params, *future.result())
+                    pool.release(cube_info)
+
+            while pending:
+                future, cube_info = pending.popleft()
+                yield putSpectralonEntry(params, *future.result())
+                pool.release(cube_info)
+
+
+def putSpectralonEntry(params: dict, result: tuple, entry) -> tuple:
+    """
+    Add the spectralon of a worker to the spectralon cache of the driver.
+
+    Parameters
+    ----------
+    params : dict
+        Further parameters of :class:`ProcessFullDataset` with the cache
+        `hyp_spectralon_cache` (or None)
+    result : tuple
+        Result of the image, see :func:`processImage`
+    entry : dict or None
+        Spectralon of the image, see :meth:`SpectralonCache.getEntry`
+
+    Returns
+    -------
+    tuple
+        `result`
+
+    """
+    cache = params.get("hyp_spectralon_cache")
+    if cache is not None and entry is not None:
+        cache.put(**entry)
+    return result
+
+
+def getSpectralonEntry(params: dict, task: tuple):
+    """
+    Get the spectralon of an image from the spectralon cache of a worker.
+
+    Parameters
+    ----------
+    params : dict
+        Further parameters of :class:`ProcessFullDataset` with the cache
+        `hyp_spectralon_cache` (or None)
+    task : tuple
+        (hyp_hdr_path, meas_name, file_number, hyp_datetime, zone_list)
+
+    Returns
+    -------
+    dict or None
+        Spectralon of the image, see :meth:`SpectralonCache.getEntry`. None
+        without cache or for an empty image.
+
+    """
+    cache = params.get("hyp_spectralon_cache")
+    if cache is None:
+        return None
+    return cache.getEntry(getSpectralonKey(task[0], task[1]))
+
+
+# parameters and shared lookup tables of a worker process
+_WORKER_STATE = {}
+
+
+def initSharedWorker(params: dict, table_infos: dict):
+    """
+    Initialize a worker process of :func:`processImagesShared`.
+
+    Parameters
+    ----------
+    params : dict
+        Further parameters of :class:`ProcessFullDataset`
+    table_infos : dict
+        Shared soil moisture data, see
+        :meth:`hprocessing.SharedArrays.SharedArrayPool.putDict`
+
+    """
+    from .SharedArrays import attachSharedArrays
+
+    # the segments stay attached for the lifetime of the worker
+    tables, segments = attachSharedArrays(table_infos)
+    _WORKER_STATE.update(params=params, soilmoisture_data=tables,
+                         segments=segments)
+
+
+def processSharedImage(task: tuple,
+                       lwir_data,
+                       headers: tuple,
+                       cube_info) -> tuple:
+    """
+    Process one image whose cube is in shared memory (in a worker process).
+
+    Parameters
+    ----------
+    task : tuple
+        (hyp_hdr_path, meas_name, file_number, hyp_datetime, zone_list)
+    lwir_data : pd.DataFrame or None
+        Already extracted LWIR data of the image
+    headers : tuple
+        Header and highres header of the image
+    cube_info : SharedArrayInfo
+        Shared cube of the image
+
+    Returns
+    -------
+    result : tuple
+        Output of :meth:`ProcessFullDataset.process` and the wavelengths of
+        the hyperspectral data
+    entry : dict or None
+        Spectralon of the image in the cache of the worker, see
+        :meth:`SpectralonCache.getEntry`
+
+    """
+    from .SharedArrays import attachSharedArray
+
+    params = _WORKER_STATE["params"]
+    cube, segment = attachSharedArray(cube_info)
+    try:
+        result = processImage(
+            task, lwir_data, (headers[0], cube, headers[1]),
+            dict(params, soilmoisture_data=_WORKER_STATE["soilmoisture_data"]))
+        return result, getSpectralonEntry(params, task)
+    finally:
+        del cube
+        try:
+            segment.close()
+        except BufferError:
+            # the cube is still referenced (e.g. by a traceback), the
+            # segment is closed with the worker
+            pass
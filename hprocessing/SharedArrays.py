@@ -0,0 +1,171 @@
+"""Shared-memory transport of arrays to worker processes."""
+
+import collections
+from multiprocessing import shared_memory
+
+import numpy as np
+
+__all__ = [
+    "SharedArrayInfo", "SharedArrayPool", "attachSharedArray",
+    "attachSharedArrays"]
+
+
+# description of a shared array, small enough to be sent to the workers
+SharedArrayInfo = collections.namedtuple("SharedArrayInfo",
+                                         ["name", "shape", "dtype"])
+
+
+class SharedArrayPool():
+    """
+    Shared-memory segments of arrays owned by the driver process.
+
+    The driver copies arrays (e.g. hyperspectral cubes or read-only lookup
+    tables) into shared-memory segments and sends the small
+    :class:`SharedArrayInfo` descriptions to the worker processes. The
+    workers attach zero-copy views with :func:`attachSharedArray`. The pool
+    manages the lifetime of the segments: they are removed on
+    :meth:`release` or :meth:`close`, e.g. at the end of a `with` block.
+
+    Attributes
+    ----------
+    segments : dict
+        Shared-memory segment of every array name
+
+    """
+
+    def __init__(self):
+        """Initialize SharedArrayPool instance."""
+        self.segments = {}
+
+    def __len__(self):
+        """Get number of segments."""
+        return len(self.segments)
+
+    def __enter__(self):
+        """Enter context, return the pool."""
+        return self
+
+    def __exit__(self, *args):
+        """Exit context, remove all segments."""
+        self.close()
+
+    def put(self, array) -> SharedArrayInfo:
+        """
+        Copy an array into a new shared-memory segment.
+
+        Parameters
+        ----------
+        array : array-like
+            Numeric array
+
+        Returns
+        -------
+        SharedArrayInfo
+            Name of the segment, shape, and data type of the array
+
+        Raises
+        ------
+        ValueError
+            Raised if the array has the data type object.
+
+        """
+        array = np.asarray(array)
+        if array.dtype.hasobject:
+            raise ValueError("Arrays of objects cannot be shared.")
+
+        # segments cannot be empty
+        segment = shared_memory.SharedMemory(create=True,
+                                             size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype,
+                   buffer=segment.buf)[...] = array
+        self.segments[segment.name] = segment
+        return SharedArrayInfo(segment.name, array.shape, array.dtype.str)
+
+    def putDict(self, arrays: dict) -> dict:
+        """
+        Copy several arrays into shared-memory segments.
+
+        Parameters
+        ----------
+        arrays : dict
+            Numeric arrays
+
+        Returns
+        -------
+        dict
+            :class:`SharedArrayInfo` with the same keys as `arrays`
+
+        """
+        return {key: self.put(array) for key, array in arrays.items()}
+
+    def release(self, info: SharedArrayInfo):
+        """
+        Remove the segment of an array.
+
+        Views that are already attached stay valid until they are closed.
+
+        Parameters
+        ----------
+        info : SharedArrayInfo
+            Description of the array as returned by :meth:`put`
+
+        """
+        segment = self.segments.pop(info.name)
+        segment.close()
+        segment.unlink()
+
+    def close(self):
+        """Remove all segments of the pool."""
+        for name in list(self.segments):
+            self.release(SharedArrayInfo(name, None, None))
+
+
+def attachSharedArray(info: SharedArrayInfo) -> tuple:
+    """
+    Attach a read-only view of a shared array.
+
+    Parameters
+    ----------
+    info : SharedArrayInfo
+        Description of the array as returned by
+        :meth:`SharedArrayPool.put`
+
+    Returns
+    -------
+    array : np.ndarray
+        Read-only view of the shared array (no copy)
+    segment : shared_memory.SharedMemory
+        Segment of the array. It must be closed after the last use of
+        `array`.
+
+    """
+    segment = shared_memory.SharedMemory(name=info.name)
+    array = np.ndarray(info.shape, dtype=np.dtype(info.dtype),
+                       buffer=segment.buf)
+    array.setflags(write=False)
+    return array, segment
+
+
+def attachSharedArrays(infos: dict) -> tuple:
+    """
+    Attach read-only views of several shared arrays.
+
+    Parameters
+    ----------
+    infos : dict
+        :class:`SharedArrayInfo` of the arrays as returned by
+        :meth:`SharedArrayPool.putDict`
+
+    Returns
+    -------
+    arrays : dict
+        Read-only views with the same keys as `infos`
+    segments : list of shared_memory.SharedMemory
+        Segments of the arrays, see :func:`attachSharedArray`
+
+    """
+    arrays, segments = {}, []
+    for key, info in infos.items():
+        arrays[key], segment = attachSharedArray(info)
+        segments.append(segment)
+    return arrays, segments
@@ -0,0 +1,426 @@
+"""Chunked on-disk store for processed spectra."""
+
+import glob
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+__all__ = [
+    "SpectralStore", "convertOutputToStore", "getChunkBands",
+    "getUtcTimestamp", "isWavelength"]
+
+
+class SpectralStore():
+    """
+    Chunked and compressed on-disk store for processed spectra.
+
+    The spectra are stored in one folder with one compressed NPZ file per
+    image and block of bands. The metadata of all spectra (e.g. datetime and
+    zone) are stored as index in a CSV file. Queries by datetime, zone, and
+    wavelength range only read the chunks with matching images and bands.
+    The datetimes are searched with binary search in sorted partitions per
+    zone.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the store. It is created if it does not exist.
+    band_chunk_size : int, optional (default=32)
+        Number of bands per chunk. Only used for new stores.
+
+    Attributes
+    ----------
+    index : pd.DataFrame
+        Metadata of all spectra with the columns image (number of the image
+        chunk) and row (row in the image chunk)
+    wavelengths : np.ndarray of str or None
+        Wavelengths of the spectra, None for an empty store
+    partitions : dict or None
+        Sorted datetimes (int64 in ns) and positions in `index` per zone, see
+        :meth:`getPartitions`. None if not calculated yet.
+
+    """
+
+    INDEX_FILE = "index.csv"
+    WAVELENGTHS_FILE = "wavelengths.npy"
+    SETTINGS_FILE = "store.json"
+    CHUNK_FILE = "image{0:06d}_band{1:04d}.npz"
+
+    def __init__(self, path: str, band_chunk_size: int = 32):
+        """Initialize SpectralStore instance."""
+        self.path = path
+        self.band_chunk_size = band_chunk_size
+        self.index = pd.DataFrame(columns=["image", "row"])
+        self.wavelengths = None
+        self.partitions = None
+
+        os.makedirs(self.path, exist_ok=True)
+        if os.path.isfile(self.getFilePath(self.WAVELENGTHS_FILE)):
+            self.wavelengths = np.load(
+                self.getFilePath(self.WAVELENGTHS_FILE), allow_pickle=False)
+            self.index = pd.read_csv(self.getFilePath(self.INDEX_FILE))
+            if "datetime" in self.index.columns:
+                self.index["datetime"] = pd.to_datetime(
+                    self.index["datetime"], utc=True)
+            if os.path.isfile(self.getFilePath(self.SETTINGS_FILE)):
+                with open(self.getFilePath(self.SETTINGS_FILE)) as file:
+                    self.band_chunk_size = json.load(file)["band_chunk_size"]
+            else:
+                self.band_chunk_size = self.getBandChunkSize()
+
+    def __len__(self):
+        """Get number of spectra in the store."""
+        return self.index.shape[0]
+
+    def getFilePath(self, filename: str) -> str:
+        """Get path of a file in the store."""
+        return os.path.join(self.path, filename)
+
+    def getChunkPath(self, image: int, band_start: int) -> str:
+        """Get path of the chunk of an image starting at a band."""
+        return self.getFilePath(self.CHUNK_FILE.format(image, band_start))
+
+    def getBandChunkSize(self) -> int:
+        """
+        Get number of bands per chunk from the names of the chunks.
+
+        Only needed for stores without the settings file `store.json`.
+
+        Returns
+        -------
+        int
+            Smallest start band of a second chunk, the number of wavelengths
+            if all images consist of one chunk
+
+        """
+        pattern = re.compile(re.sub(r"\\\{\d:\d+d\\\}", r"(\\d+)",
+                                    re.escape(self.CHUNK_FILE)) + "$")
+        band_starts = [int(match.group(2)) for match in map(
+            pattern.match, os.listdir(self.path)) if match is not None]
+        band_starts = [band_start for band_start in band_starts
+                       if band_start > 0]
+        if not band_starts:
+            return max(len(self.wavelengths), 1)
+        return min(band_starts)
+
+    def append(self,
+               spectra: np.ndarray,
+               metadata: pd.DataFrame,
+               wavelengths: list):
+        """
+        Append the spectra of one image to the store.
+
+        Parameters
+        ----------
+        spectra : np.ndarray
+            Spectra with shape (rows, wavelengths)
+        metadata : pd.DataFrame
+            Metadata with one row per spectrum, e.g. with the columns datetime
+            and zone, see
+            :func:`hprocessing.ProcessFullDataset.splitSpectra`
+        wavelengths : list
+            Wavelengths of the spectra
+
+        Raises
+        ------
+        ValueError
+            Raised if the wavelengths differ from the ones in the store.
+
+        """
+        wavelengths = np.asarray(wavelengths, dtype=str)
+        if self.wavelengths is None:
+            self.wavelengths = wavelengths
+            np.save(self.getFilePath(self.WAVELENGTHS_FILE), wavelengths)
+            with open(self.getFilePath(self.SETTINGS_FILE), "w") as file:
+                json.dump({"band_chunk_size": self.band_chunk_size}, file)
+        elif not np.array_equal(self.wavelengths, wavelengths):
+            raise ValueError("Wavelengths differ from the ones in the store.")
+
+        image = 0
+        if len(self) > 0:
+            image = int(self.index["image"].max()) + 1
+        for band_start in range(0, len(wavelengths), self.band_chunk_size):
+            np.savez_compressed(
+                self.getChunkPath(image, band_start),
+                spectra=spectra[:, band_start:band_start+self.band_chunk_size])
+
+        image_index = metadata.reset_index(drop=True)
+        image_index.insert(0, "image", image)
+        image_index.insert(1, "row", np.arange(image_index.shape[0]))
+        image_index.to_csv(self.getFilePath(self.INDEX_FILE), mode="a",
+                           header=len(self) == 0, index=False)
+        self.index = pd.concat([self.index, image_index], axis=0,
+                               ignore_index=True)
+        self.index[["image", "row"]] = self.index[["image", "row"]].astype(
+            int)
+        self.partitions = None
+
+    def getPartitions(self) -> dict:
+        """
+        Get the datetime index partitioned by zone.
+
+        The partitions are calculated on the first call after a change of the
+        store.
+
+        Returns
+        -------
+        dict
+            Tuple of the sorted datetimes (int64 in ns) and the respective
+            positions in `index` for every zone. The key None contains all
+            zones.
+
+        """
+        if self.partitions is None:
+            datetimes = self.index["datetime"].values.astype(
+                "datetime64[ns]").astype(np.int64)
+            order = np.argsort(datetimes, kind="stable")
+            datetimes = datetimes[order]
+            zones = self.index["zone"].values[order]
+
+            self.partitions = {None: (datetimes, order)}
+            for zone in np.unique(zones):
+                self.partitions[zone] = (datetimes[zones == zone],
+                                         order[zones == zone])
+        return self.partitions
+
+    def query(self,
+              start=None,
+              end=None,
+              zones: list = None,
+              wavelength_range: tuple = None) -> tuple:
+        """
+        Get spectra and metadata by datetime, zone, and wavelength range.
+
+        Parameters
+        ----------
+        start, end : str or pd.Timestamp or None, optional (default=None)
+            First and last datetime (inclusive). Strings without timezone are
+            interpreted as UTC. None = no limit.
+        zones : list of str or None, optional (default=None)
+            Zones to select. None = all zones.
+        wavelength_range : tuple (float, float) or None, optional
+            Smallest and largest wavelength (inclusive). None = all bands.
+
+        Returns
+        -------
+        spectra : np.ndarray
+            Spectra with shape (rows, wavelengths)
+        metadata : pd.DataFrame
+            Metadata of the spectra
+        wavelengths : np.ndarray of str
+            Wavelengths of the spectra
+
+        """
+        if self.wavelengths is None:
+            return np.empty((0, 0)), self.index.copy(), np.empty(0, dtype=str)
+
+        # binary search in the datetime partitions of the zones
+        partitions = self.getPartitions()
+        positions = [np.empty(0, dtype=int)]
+        for zone in np.unique(zones) if zones is not None else [None]:
+            datetimes, zone_positions = partitions.get(
+                zone, (np.empty(0), np.empty(0, dtype=int)))
+            first, last = 0, len(datetimes)
+            if start is not None:
+                first = np.searchsorted(datetimes,
+                                        getUtcTimestamp(start).value, "left")
+            if end is not None:
+                last = np.searchsorted(datetimes, getUtcTimestamp(end).value,
+                                       "right")
+            positions.append(zone_positions[first:last])
+        return self.getSpectra(np.concatenate(positions),
+                               wavelength_range=wavelength_range)
+
+    def getSpectra(self,
+                   positions,
+                   wavelength_range: tuple = None) -> tuple:
+        """
+        Get spectra and metadata by their positions in the index.
+
+        Parameters
+        ----------
+        positions : array-like of int
+            Positions of the spectra in `index`
+        wavelength_range : tuple (float, float) or None, optional
+            Smallest and largest wavelength (inclusive). None = all bands.
+
+        Returns
+        -------
+        tuple
+            Spectra, metadata, and wavelengths as in :meth:`query`, in the
+            order of `index`
+
+        """
+        metadata = self.index.iloc[np.sort(np.asarray(positions, dtype=int))]
+
+        bands = np.arange(len(self.wavelengths))
+        if wavelength_range is not None:
+            wavelengths_float = self.wavelengths.astype(float)
+            bands = bands[(wavelengths_float >= wavelength_range[0]) &
+                          (wavelengths_float <= wavelength_range[1])]
+        band_starts = np.unique(
+            bands // self.band_chunk_size) * self.band_chunk_size
+        columns = np.searchsorted(getChunkBands(
+            band_starts, self.band_chunk_size, len(self.wavelengths)), bands)
+
+        # the index is sorted by image, i.e. the order of metadata is kept
+        spectra = [np.empty((0, len(bands)))]
+        for image, image_metadata in metadata.groupby("image", sort=False):
+            chunks = [np.empty((image_metadata["row"].max() + 1, 0))]
+            for band_start in band_starts:
+                with np.load(self.getChunkPath(image, band_start),
+                             allow_pickle=False) as chunk:
+                    chunks.append(chunk["spectra"])
+            spectra.append(np.concatenate(chunks[1:] or chunks, axis=1)[
+                image_metadata["row"].values][:, columns])
+
+        return (np.concatenate(spectra, axis=0),
+                metadata.reset_index(drop=True), self.wavelengths[bands])
+
+    def queryNearest(self,
+                     datetime,
+                     zones: list = None,
+                     wavelength_range: tuple = None) -> tuple:
+        """
+        Get spectra and metadata of the image nearest to a datetime.
+
+        The nearest image is searched per zone, i.e. the spectra of
+        different zones can be from different images.
+
+        Parameters
+        ----------
+        datetime : str or pd.Timestamp
+            Datetime, without timezone interpreted as UTC
+        zones : list of str or None, optional (default=None)
+            Zones to select. None = all zones of the nearest image.
+        wavelength_range : tuple (float, float) or None, optional
+            Smallest and largest wavelength (inclusive). None = all bands.
+
+        Returns
+        -------
+        tuple
+            Spectra, metadata, and wavelengths as in :meth:`query`
+
+        """
+        if self.wavelengths is None:
+            return self.query()
+
+        # binary search in the datetime partitions of the zones
+        partitions = self.getPartitions()
+        target = getUtcTimestamp(datetime).value
+        positions = [np.empty(0, dtype=int)]
+        for zone in np.unique(zones) if zones is not None else [None]:
+            if zone not in partitions:
+                continue
+            datetimes, zone_positions = partitions[zone]
+            i = np.searchsorted(datetimes, target)
+            candidates = datetimes[max(i-1, 0):i+1]
+            nearest = candidates[np.argmin(np.abs(candidates - target))]
+            positions.append(zone_positions[datetimes == nearest])
+        return self.getSpectra(np.concatenate(positions),
+                               wavelength_range=wavelength_range)
+
+    def clear(self):
+        """Delete all chunks and the index of the store."""
+        for filepath in glob.glob(self.getFilePath("image*_band*.npz")):
+            os.remove(filepath)
+        for filename in [self.INDEX_FILE, self.WAVELENGTHS_FILE,
+                         self.SETTINGS_FILE]:
+            if os.path.isfile(self.getFilePath(filename)):
+                os.remove(self.getFilePath(filename))
+        self.index = pd.DataFrame(columns=["image", "row"])
+        self.wavelengths = None
+        self.partitions = None
+
+
+def convertOutputToStore(output_path: str,
+                         store_path: str,
+                         band_chunk_size: int = 32) -> SpectralStore:
+    """
+    Convert a CSV output of the processing into a spectral store.
+
+    Parameters
+    ----------
+    output_path : str
+        Path of the CSV output, e.g. from
+        :func:`hprocessing.ProcessFullDataset.processHydReSGeoDataset`
+    store_path : str
+        Folder of the new store. An existing store in it is cleared.
+    band_chunk_size : int, optional (default=32)
+        Number of bands per chunk
+
+    Returns
+    -------
+    SpectralStore
+        Store with one image per datetime of the output
+
+    """
+    output = pd.read_csv(output_path, index_col=0)
+    output["datetime"] = pd.to_datetime(output["datetime"], utc=True)
+    wavelengths = [column for column in output.columns
+                   if isWavelength(column)]
+
+    store = SpectralStore(store_path, band_chunk_size=band_chunk_size)
+    store.clear()
+    for _, image_data in output.groupby("datetime", sort=False):
+        store.append(image_data[wavelengths].values,
+                     image_data.drop(labels=wavelengths, axis=1),
+                     wavelengths)
+    return store
+
+
+def isWavelength(column: str) -> bool:
+    """Check if a column name of the output is a wavelength."""
+    try:
+        float(column)
+    except ValueError:
+        return False
+    return True
+
+
+def getChunkBands(band_starts, band_chunk_size: int, n_bands: int):
+    """
+    Get the bands of concatenated chunks.
+
+    Parameters
+    ----------
+    band_starts : array-like of int
+        First bands of the chunks
+    band_chunk_size : int
+        Number of bands per chunk
+    n_bands : int
+        Total number of bands
+
+    Returns
+    -------
+    np.ndarray of int
+        Band numbers of the columns of the concatenated chunks
+
+    """
+    return np.concatenate([np.empty(0, dtype=int)] + [
+        np.arange(start, min(start+band_chunk_size, n_bands))
+        for start in band_starts]).astype(int)
+
+
+def getUtcTimestamp(datetime) -> pd.Timestamp:
+    """
+    Get timestamp in UTC.
+
+    Parameters
+    ----------
+    datetime : str or pd.Timestamp
+        Datetime, without timezone interpreted as UTC
+
+    Returns
+    -------
+    pd.Timestamp
+        Timestamp in UTC
+
+    """
+    datetime = pd.Timestamp(datetime)
+    if datetime.tzinfo is None:
+        return datetime.tz_localize("UTC")
+    return datetime.tz_convert("UTC")
@@ -0,0 +1,535 @@
+"""File-based work queue to process the dataset on several nodes."""
+
+import glob
+import json
+import os
+import socket
+import time
+import traceback
+
+import pandas as pd
+
+from .ProcessFullDataset import (EnviHeaderCache, SpectralonCache,
+                                 fillSpectralonCache, getHyperspectralFiles,
+                                 getHyperspectralTasks,
+                                 getProcessingParameters,
+                                 getSoilMoistureIndex, getSpectralonCache,
+                                 getSpectralonEntry, processImage,
+                                 readConfig, saveOutput)
+
+__all__ = [
+    "WorkQueue", "createDatasetQueue", "mergeQueueShards", "processQueue",
+    "runQueueWorker", "writeFileAtomically"]
+
+
+class WorkQueue():
+    """
+    Work queue of image tasks in a shared directory.
+
+    The queue needs no broker, only a directory which all nodes can access.
+    Every task is one JSON file which moves between the folders `tasks`
+    (pending), `claimed`, `done`, and `failed`. A task is claimed by an
+    atomic rename, i.e. exactly one worker gets it. The attempt is part of
+    the filename (e.g. `000012.a1.json`). Claims older than `claim_timeout`
+    (e.g. of a crashed worker) and failed attempts are put back into the
+    queue until `max_attempts` is reached. The result of every task is saved
+    as shard in the folder `shards`, together with the spectralon of the
+    image. With the spectralon reuse, the spectralon cache of the workers is
+    filled by the coordinator and saved as `spectralon.npz`.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the queue, see :meth:`create`
+
+    Attributes
+    ----------
+    settings : dict
+        Settings of the queue: config_path, data_directory, claim_timeout (in
+        seconds), and max_attempts
+
+    """
+
+    SETTINGS_FILE = "queue.json"
+    SPECTRALON_FILE = "spectralon.npz"
+    FOLDERS = ["tasks", "claimed", "done", "failed", "shards", "logs", "tmp"]
+
+    def __init__(self, path: str):
+        """Initialize WorkQueue instance."""
+        self.path = path
+        with open(self.getFilePath(self.SETTINGS_FILE)) as settings_file:
+            self.settings = json.load(settings_file)
+
+    @classmethod
+    def create(cls,
+               path: str,
+               config_path: str = None,
+               data_directory: str = None,
+               claim_timeout: float = 3600.,
+               max_attempts: int = 3):
+        """
+        Create an empty queue.
+
+        Parameters
+        ----------
+        path : str
+            Folder of the queue. It is created if it does not exist.
+        config_path, data_directory : str or None, optional (default=None)
+            Config file and dataset folder of the workers, see
+            :func:`hprocessing.ProcessFullDataset.readConfig`
+        claim_timeout : float, optional (default=3600.)
+            Time in seconds after which a claimed task is put back into the
+            queue. It needs to be longer than the processing of one image.
+        max_attempts : int, optional (default=3)
+            Number of attempts per task before it is moved to `failed`
+
+        Returns
+        -------
+        WorkQueue
+            The new queue
+
+        """
+        for folder in cls.FOLDERS:
+            os.makedirs(os.path.join(path, folder), exist_ok=True)
+        settings = {
+            "config_path": (os.path.abspath(config_path)
+                            if config_path is not None else None),
+            # readConfig prepends the folder without a separator
+            "data_directory": (os.path.join(os.path.abspath(data_directory),
+                                            "")
+                               if data_directory is not None else None),
+            "claim_timeout": claim_timeout,
+            "max_attempts": max_attempts}
+        writeFileAtomically(os.path.join(path, cls.SETTINGS_FILE),
+                            json.dumps(settings, indent=2),
+                            tmp_directory=os.path.join(path, "tmp"))
+        return cls(path)
+
+    def getFilePath(self, *names) -> str:
+        """Get path of a file in the queue."""
+        return os.path.join(self.path, *names)
+
+    def put(self, hyp_tasks: list):
+        """
+        Add tasks to the queue.
+
+        Parameters
+        ----------
+        hyp_tasks : list of tuple
+            (hyp_hdr_path, meas_name, file_number, hyp_datetime, zone_list)
+            of every image, see
+            :func:`hprocessing.ProcessFullDataset.getHyperspectralTasks`
+
+        """
+        task_id = len(self.getTaskIds())
+        for hyp_hdr_path, meas_name, file_number, hyp_datetime, zone_list in \
+                hyp_tasks:
+            writeFileAtomically(
+                self.getFilePath("tasks", "{0:06d}.a0.json".format(task_id)),
+                json.dumps({"hyp_hdr_path": hyp_hdr_path,
+                            "meas_name": meas_name,
+                            "file_number": int(file_number),
+                            "hyp_datetime": str(hyp_datetime),
+                            "zone_list": list(zone_list)}),
+                tmp_directory=self.getFilePath("tmp"))
+            task_id += 1
+
+    def getTaskFiles(self, folder: str) -> list:
+        """Get the sorted task files in a folder of the queue."""
+        return sorted(os.path.basename(filepath) for filepath in glob.glob(
+            self.getFilePath(folder, "*.a*.json")))
+
+    def getTaskIds(self) -> list:
+        """Get the IDs of all tasks in the queue."""
+        return sorted({filename.split(".")[0]
+                       for folder in ["tasks", "claimed", "done", "failed"]
+                       for filename in self.getTaskFiles(folder)})
+
+    def getStatus(self) -> dict:
+        """Get the number of pending, claimed, done, and failed tasks."""
+        return {folder: len(self.getTaskFiles(folder))
+                for folder in ["tasks", "claimed", "done", "failed"]}
+
+    def isFinished(self) -> bool:
+        """Check if no task is pending or claimed."""
+        status = self.getStatus()
+        return status["tasks"] == 0 and status["claimed"] == 0
+
+    def claim(self):
+        """
+        Claim the next pending task.
+
+        Returns
+        -------
+        tuple or None
+            Filename of the claimed task and the task (tuple as in
+            :meth:`put`). None if no task is pending.
+
+        """
+        for filename in self.getTaskFiles("tasks"):
+            try:
+                # the modification time is the start of the claim
+                os.utime(self.getFilePath("tasks", filename))
+                os.rename(self.getFilePath("tasks", filename),
+                          self.getFilePath("claimed", filename))
+            except FileNotFoundError:
+                continue    # claimed by another worker
+            with open(self.getFilePath("claimed", filename)) as task_file:
+                task = json.load(task_file)
+            return filename, (task["hyp_hdr_path"], task["meas_name"],
+                              task["file_number"],
+                              pd.Timestamp(task["hyp_datetime"]),
+                              task["zone_list"])
+        return None
+
+    def complete(self, filename: str, result, spectralon: dict = None):
+        """
+        Save the result of a claimed task and mark it as done.
+
+        Parameters
+        ----------
+        filename : str
+            Filename of the task as returned by :meth:`claim`
+        result : tuple
+            Output of :meth:`ProcessFullDataset.process` and the wavelengths,
+            see :func:`hprocessing.ProcessFullDataset.processImage`
+        spectralon : dict or None, optional (default=None)
+            Spectralon of the image, see
+            :func:`hprocessing.ProcessFullDataset.getSpectralonEntry`
+
+        """
+        task_id = filename.split(".")[0]
+        shards = [(task_id + ".pkl", result)]
+        if spectralon is not None:
+            shards.append((task_id + ".spectralon.pkl", spectralon))
+        for shard_name, shard in shards:
+            tmp_path = self.getFilePath("tmp", "{0}.{1}".format(
+                shard_name, os.getpid()))
+            pd.to_pickle(shard, tmp_path)
+            os.replace(tmp_path, self.getFilePath("shards", shard_name))
+        self.moveTask(filename, "claimed", "done")
+
+    def fail(self, filename: str, message: str = ""):
+        """
+        Put a claimed task back into the queue after a failed attempt.
+
+        The task is moved to `failed` after `max_attempts` attempts.
+
+        Parameters
+        ----------
+        filename : str
+            Filename of the task as returned by :meth:`claim`
+        message : str, optional (default="")
+            Error message, saved in the folder `logs`
+
+        """
+        task_id, attempt, _ = filename.split(".")
+        with open(self.getFilePath("logs", "{0}.{1}.txt".format(
+                task_id, attempt)), "w") as log_file:
+            log_file.write(message)
+
+        attempt = int(attempt[1:]) + 1
+        folder = "tasks"
+        if attempt >= self.settings["max_attempts"]:
+            folder = "failed"
+        self.moveTask(filename, "claimed", folder,
+                      "{0}.a{1}.json".format(task_id, attempt))
+
+    def requeueStaleTasks(self) -> int:
+        """
+        Put claims older than `claim_timeout` back into the queue.
+
+        Returns
+        -------
+        int
+            Number of stale claims
+
+        """
+        n_stale = 0
+        now = time.time()
+        for filename in self.getTaskFiles("claimed"):
+            try:
+                claim_time = os.path.getmtime(self.getFilePath("claimed",
+                                                               filename))
+            except FileNotFoundError:
+                continue
+            if now - claim_time > self.settings["claim_timeout"]:
+                self.fail(filename, "Claim timed out.")
+                n_stale += 1
+        return n_stale
+
+    def moveTask(self,
+                 filename: str,
+                 source: str,
+                 destination: str,
+                 new_filename: str = None) -> bool:
+        """
+        Move a task between two folders of the queue.
+
+        Parameters
+        ----------
+        filename : str
+            Filename of the task
+        source, destination : str
+            Folders of the queue, e.g. "claimed" and "done"
+        new_filename : str or None, optional (default=None)
+            New filename of the task. If None, the filename is kept.
+
+        Returns
+        -------
+        bool
+            False if the task was moved by another worker in the meantime
+
+        """
+        try:
+            os.rename(self.getFilePath(source, filename),
+                      self.getFilePath(destination, new_filename or filename))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def getResults(self):
+        """
+        Iterate over the results of all done tasks in the order of the tasks.
+
+        Yields
+        ------
+        tuple
+            Result of a task as saved by :meth:`complete`
+
+        """
+        for filename in self.getTaskFiles("done"):
+            yield pd.read_pickle(self.getFilePath(
+                "shards", filename.split(".")[0] + ".pkl"))
+
+    def getSpectralons(self):
+        """
+        Iterate over the spectralons of all done tasks.
+
+        Yields
+        ------
+        dict
+            Spectralon of an image as saved by :meth:`complete`
+
+        """
+        for filename in self.getTaskFiles("done"):
+            shard_path = self.getFilePath(
+                "shards", filename.split(".")[0] + ".spectralon.pkl")
+            if os.path.isfile(shard_path):
+                yield pd.read_pickle(shard_path)
+
+
+def writeFileAtomically(filepath: str, text: str, tmp_directory: str):
+    """
+    Write a text file which other processes see completely or not at all.
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the file
+    text : str
+        Content of the file
+    tmp_directory : str
+        Folder for the temporary file on the same filesystem as `filepath`
+
+    """
+    tmp_path = os.path.join(tmp_directory, "{0}.{1}.{2}".format(
+        os.path.basename(filepath), socket.gethostname(), os.getpid()))
+    with open(tmp_path, "w") as tmp_file:
+        tmp_file.write(text)
+    os.replace(tmp_path, filepath)
+
+
+def createDatasetQueue(config_path: str,
+                       data_directory: str,
+                       queue_path: str = None,
+                       verbose=0) -> WorkQueue:
+    """
+    Create a work queue with all images of the dataset (coordinator).
+
+    If the spectralon of other images is reused, the spectralon cache is
+    filled with all images before the queue is created, see
+    :func:`hprocessing.ProcessFullDataset.fillSpectralonCache`.
+
+    Parameters
+    ----------
+    config_path : str
+        Path to config file
+    data_directory : str
+        Directory of the dataset folder.
+    queue_path : str or None, optional (default=None)
+        Folder of the queue. If None, the config option `queue` is used.
+    verbose : int, optional (default=0)
+        Controls the verbosity.
+
+    Returns
+    -------
+    WorkQueue
+        Queue with one task per image
+
+    Raises
+    ------
+    FileExistsError
+        Raised if the folder already contains a queue.
+
+    """
+    config = readConfig(config_path=config_path, data_directory=data_directory)
+    if queue_path is None:
+        queue_path = config["queue"]
+    if os.path.isfile(os.path.join(queue_path, WorkQueue.SETTINGS_FILE)):
+        raise FileExistsError("Queue {0} already exists.".format(queue_path))
+
+    hyp_tasks = getHyperspectralTasks(config, verbose=verbose)
+    if config["hyp_spectralon_reuse"] != "none":
+        params = getProcessingParameters(config, verbose=verbose)
+        fillSpectralonCache(hyp_tasks, params)
+        # saved before the settings, i.e. before any worker can start
+        os.makedirs(queue_path, exist_ok=True)
+        params["hyp_spectralon_cache"].save(
+            os.path.join(queue_path, WorkQueue.SPECTRALON_FILE))
+        if config["spectralon_cache"]:
+            params["hyp_spectralon_cache"].save(config["spectralon_cache"])
+
+    work_queue = WorkQueue.create(
+        queue_path, config_path=config_path, data_directory=data_directory,
+        claim_timeout=config["queue_claim_timeout"],
+        max_attempts=config["queue_max_attempts"])
+    work_queue.put(hyp_tasks)
+    if verbose:
+        print("Created queue with {0} task(s).".format(
+            len(work_queue.getTaskIds())))
+    return work_queue
+
+
+def runQueueWorker(queue_path: str,
+                   wait: bool = True,
+                   poll_interval: float = 5.,
+                   verbose=0) -> int:
+    """
+    Process tasks of a work queue until it is finished (worker).
+
+    Any number of workers can run at the same time on different nodes.
+
+    Parameters
+    ----------
+    queue_path : str
+        Folder of the queue, see :func:`createDatasetQueue`
+    wait : bool, optional (default=True)
+        If true, the worker waits for claims of other workers to finish or
+        to time out. Otherwise, it stops if no task is pending.
+    poll_interval : float, optional (default=5.)
+        Time in seconds between two checks of the queue while waiting
+    verbose : int, optional (default=0)
+        Controls the verbosity.
+
+    Returns
+    -------
+    int
+        Number of tasks processed by this worker
+
+    """
+    work_queue = WorkQueue(queue_path)
+    config = readConfig(config_path=work_queue.settings["config_path"],
+                        data_directory=work_queue.settings["data_directory"])
+    params = getProcessingParameters(config, verbose=verbose)
+    params["soilmoisture_data"] = getSoilMoistureIndex(
+        config["data_sm"], params["sensor_registry"])
+    if os.path.isfile(work_queue.getFilePath(WorkQueue.SPECTRALON_FILE)):
+        params["hyp_spectralon_cache"] = SpectralonCache.load(
+            work_queue.getFilePath(WorkQueue.SPECTRALON_FILE))
+    return processQueue(work_queue, params, wait=wait,
+                        poll_interval=poll_interval)
+
+
+def processQueue(work_queue: WorkQueue,
+                 params: dict,
+                 wait: bool = True,
+                 poll_interval: float = 5.) -> int:
+    """
+    Claim and process tasks of a work queue until it is finished.
+
+    Parameters
+    ----------
+    work_queue : WorkQueue
+        Queue with the tasks
+    params : dict
+        Further parameters of
+        :class:`hprocessing.ProcessFullDataset.ProcessFullDataset`
+    wait, poll_interval
+        See :func:`runQueueWorker`
+
+    Returns
+    -------
+    int
+        Number of tasks processed by this worker
+
+    """
+    header_cache = EnviHeaderCache()
+    n_processed = 0
+    while True:
+        work_queue.requeueStaleTasks()
+        claimed = work_queue.claim()
+        if claimed is None:
+            if not wait or work_queue.isFinished():
+                return n_processed
+            time.sleep(poll_interval)
+            continue
+
+        filename, task = claimed
+        try:
+            hyp_files = getHyperspectralFiles(task[0], load_image=True,
+                                              header_cache=header_cache)
+            result = processImage(task, None, hyp_files, params)
+        except Exception:  # pylint: disable=broad-except
+            work_queue.fail(filename, traceback.format_exc())
+            continue
+        work_queue.complete(filename, result,
+                            spectralon=getSpectralonEntry(params, task))
+        n_processed += 1
+
+
+def mergeQueueShards(queue_path: str, allow_failed: bool = False):
+    """
+    Merge the results of a finished work queue into the output.
+
+    The spectralons of the workers are added to the spectralon cache
+    `spectralon_cache` of the config.
+
+    Parameters
+    ----------
+    queue_path : str
+        Folder of the queue, see :func:`createDatasetQueue`
+    allow_failed : bool, optional (default=False)
+        If true, failed tasks are skipped.
+
+    Returns
+    -------
+    pd.DataFrame or tuple or SpectralStore
+        Output data, see
+        :func:`hprocessing.ProcessFullDataset.processHydReSGeoDataset`
+
+    Raises
+    ------
+    RuntimeError
+        Raised if tasks are pending or claimed, or if tasks failed and
+        `allow_failed` is false.
+
+    """
+    work_queue = WorkQueue(queue_path)
+    status = work_queue.getStatus()
+    if not work_queue.isFinished():
+        raise RuntimeError("Queue is not finished: {0} pending and {1} "
+                           "claimed task(s).".format(status["tasks"],
+                                                     status["claimed"]))
+    if status["failed"] > 0 and not allow_failed:
+        raise RuntimeError("{0} task(s) failed, see {1}.".format(
+            status["failed"], work_queue.getFilePath("logs")))
+
+    config = readConfig(config_path=work_queue.settings["config_path"],
+                        data_directory=work_queue.settings["data_directory"])
+    if config["spectralon_cache"]:
+        cache = getSpectralonCache(config)
+        for spectralon in work_queue.getSpectralons():
+            cache.put(**spectralon)
+        cache.save(config["spectralon_cache"])
+    return saveOutput(config, work_queue.getResults())
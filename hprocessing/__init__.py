@@ -1,6 +1,83 @@
-"""Python module for the processing of the HydReSGeo dataset."""
+"""Python module for the processing of the HydReSGeo dataset.
 
+The submodules are imported on first access of one of their names, e.g.
+matplotlib is only imported if a function of `PlotUtils` is used. The
+public names of a submodule are the ones in its `__all__`.
 
-from .PlotUtils import *
-from .ProcessEnviFile import *
-from .ProcessFullDataset import *
+"""
+
+import ast
+import functools
+import importlib
+import importlib.util
+import re
+import sys
+import types
+
+# submodules of the package, SharedArrays requires Python 3.8
+_SUBMODULES = ["ProcessEnviFile", "SpectralStore", "Preprocessing",
+               "ProcessFullDataset", "WorkQueue", "Ingestion", "PlotUtils",
+               "SharedArrays"]
+
+# list of public names in the source code of a submodule
+_ALL_PATTERN = re.compile(r"^__all__ = (\[.*?\])$", re.MULTILINE | re.DOTALL)
+
+
+@functools.lru_cache(maxsize=None)
+def _getModuleOfName() -> dict:
+    """Get the submodule of every public name without importing it."""
+    module_of_name = {}
+    for module_name in _SUBMODULES:
+        spec = importlib.util.find_spec("." + module_name, __name__)
+        with open(spec.origin, encoding="utf-8") as module_file:
+            match = _ALL_PATTERN.search(module_file.read())
+        for name in ast.literal_eval(match.group(1)):
+            module_of_name[name] = module_name
+    return module_of_name
+
+
+def __getattr__(name):
+    """Import the submodule of `name` on first access."""
+    if name == "__all__":
+        # SharedArrays requires Python 3.8
+        return [public_name for public_name, module_name
+                in _getModuleOfName().items()
+                if module_name != "SharedArrays" or
+                sys.version_info >= (3, 8)]
+
+    module_name = _getModuleOfName().get(name)
+    if module_name is None and name in _SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+    if module_name is None:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(
+            __name__, name))
+
+    value = getattr(importlib.import_module("." + module_name, __name__),
+                    name)
+    globals()[name] = value
+
+    # importing a submodule binds it in the package, the classes named like
+    # their submodules (e.g. ProcessEnviFile) are bound instead
+    for submodule_name in _SUBMODULES:
+        submodule = globals().get(submodule_name)
+        if isinstance(submodule, types.ModuleType) and hasattr(
+                submodule, submodule_name):
+            globals()[submodule_name] = getattr(submodule, submodule_name)
+    return value
+
+
+def __dir__():
+    """List the names of the package including the lazy ones."""
+    return sorted(set(globals()) | set(_getModuleOfName()))
+
+
+# module-level __getattr__ requires Python 3.7, SharedArrays is not imported
+# as it requires Python 3.8
+if sys.version_info < (3, 7):
+    from .Ingestion import *
+    from .PlotUtils import *
+    from .ProcessEnviFile import *
+    from .Preprocessing import *
+    from .ProcessFullDataset import *
+    from .SpectralStore import *
+    from .WorkQueue import *
@@ -36,7 +36,8 @@ setuptools.setup(
                       "spectral",
                       "tqdm"],
     extras_require={"docs": ["numpydoc", "sphinx", "sphinx-autobuild",
-                             "sphinx_rtd_theme"]},
+                             "sphinx_rtd_theme"],
+                    "preprocessing": ["scipy"]},
     packages=setuptools.find_packages(),
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -1,6 +1,8 @@
 """Configuration for pytest including fixtures."""
 
+import configparser
 import os
+import shutil
 import sys
 
 import pandas as pd
@@ -74,3 +76,58 @@ def exampleImage():
     wavelengths = hdr_highres["Wavelength"]
     bbl = hdr_highres["bbl"]
     return (img, wavelengths, bbl)
+
+
+@pytest.fixture
+def exampleDataset(tmp_path):
+    """Set up a dataset with one hyperspectral image and its config file.
+
+    There is no LWIR data, the zones 3-8 are ignored.
+
+    """
+    data_directory = str(tmp_path / "data") + "/"
+    hyp_folder = os.path.join(data_directory, "rs/hyp", MEASUREMENT+"_hyp")
+    os.makedirs(hyp_folder)
+    os.makedirs(os.path.join(data_directory, "rs/lwir"))
+    os.makedirs(os.path.join(data_directory, "rs/masks"))
+    os.makedirs(os.path.join(data_directory, "hyd"))
+    for filename in ["Auto017.hdr", "Auto017.cue", "Auto017_highres.hdr"]:
+        shutil.copy("data/testfiles/hyp/"+filename, hyp_folder)
+    shutil.copy("data/testfiles/hyd/TDR.csv",
+                os.path.join(data_directory, "hyd"))
+    shutil.copy("data/testfiles/masks/masks_test.csv",
+                os.path.join(data_directory, "rs/masks"))
+
+    tables = {
+        "positions_hyp.csv": POSITIONS,
+        "positions_lwir.csv": POSITIONS_LWIR,
+        "ignore_measurements.csv": pd.DataFrame(columns=["measurement"]),
+        "ignore_datapoints.csv": pd.DataFrame(
+            columns=["measurement", "filenumber"]),
+        "ignore_fields.csv": pd.DataFrame({"measurement": MEASUREMENT,
+                                           "filenumber": 17,
+                                           "zone": range(3, 9)})}
+    for filename, table in tables.items():
+        table.to_csv(os.path.join(data_directory, "rs/masks", filename),
+                     sep=" ", index=False)
+
+    config = configparser.ConfigParser()
+    config.read("config/HydReSGeo.ini")
+    config["Paths"].update({
+        "positions_hyp": "rs/masks/positions_hyp.csv",
+        "positions_lwir": "rs/masks/positions_lwir.csv",
+        "ignore_hyp_measurements": "rs/masks/ignore_measurements.csv",
+        "ignore_hyp_datapoints": "rs/masks/ignore_datapoints.csv",
+        "ignore_hyp_fields": "rs/masks/ignore_fields.csv",
+        "masks_hyp": "rs/masks/masks_test.csv",
+        "ingest_store": str(tmp_path / "store"),
+        "spectralon_cache": str(tmp_path / "spectralon.npz"),
+        "qa_output": str(tmp_path / "qa")})
+    config["Process"].update({"hyp_prefilter_empty": "False",
+                              "ingest_settle_time": "1",
+                              "ingest_max_wait": "600",
+                              "qa_jobs": "1"})
+    config_path = str(tmp_path / "config.ini")
+    with open(config_path, "w") as config_file:
+        config.write(config_file)
+    return config_path, data_directory
@@ -0,0 +1,91 @@
+"""Test incremental ingestion of new images."""
+
+import os
+import shutil
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../')))
+from conftest import MEASUREMENT
+from hprocessing.Ingestion import *
+from hprocessing.ProcessFullDataset import SpectralonCache
+
+TESTFILE_LWIR = (
+    "data/testfiles/lwir/ir_export_20170815_P0000000_001_17-56-00.csv")
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def testDirectoryWatcher(tmp_path, use_inotify):
+    with DirectoryWatcher([str(tmp_path)],
+                          use_inotify=use_inotify) as watcher:
+        if use_inotify and watcher.mode == "polling":
+            pytest.skip("inotify is not available.")
+        assert(watcher.mode == ("inotify" if use_inotify else "polling"))
+        assert(watcher.wait(0.01) == (not use_inotify))
+
+        os.mkdir(str(tmp_path / "meas1_hyp"))
+        assert(watcher.wait(0.1))
+        with open(str(tmp_path / "meas1_hyp" / "Auto001.hdr"), "w") as file:
+            file.write("ENVI")
+        assert(watcher.wait(0.1))
+        if use_inotify:
+            assert(str(tmp_path / "meas1_hyp") in watcher.watched)
+            assert(not watcher.wait(0.01))
+
+
+def testIngestionDaemon(exampleDataset):
+    config_path, data_directory = exampleDataset
+    now = time.time() + 10.
+
+    with IngestionDaemon(config_path, data_directory,
+                         use_inotify=False) as daemon:
+        # the LWIR export is missing
+        assert(daemon.runOnce(now=now) == 0)
+        assert(list(daemon.pending) == [MEASUREMENT+"_hyp/Auto017.hdr"])
+
+        shutil.copy(TESTFILE_LWIR, os.path.join(data_directory, "rs/lwir"))
+        assert(daemon.runOnce(now=now) == 1)
+        assert(daemon.pending == {})
+        assert(len(daemon.store) == 2)
+        assert(list(daemon.store.index["zone"]) == ["zone1", "zone2"])
+        assert(len(SpectralonCache.load(
+            daemon.config["spectralon_cache"])) == 1)
+        assert(daemon.runOnce(now=now) == 0)
+
+    # a restarted daemon continues with the processed images
+    with IngestionDaemon(config_path, data_directory,
+                         use_inotify=False) as daemon:
+        assert(daemon.ingested == {MEASUREMENT+"_hyp/Auto017.hdr"})
+        assert(daemon.runOnce(now=now) == 0)
+        assert(len(daemon.store) == 2)
+
+
+def testIngestionDaemonWaiting(exampleDataset):
+    config_path, data_directory = exampleDataset
+
+    with IngestionDaemon(config_path, data_directory,
+                         use_inotify=False) as daemon:
+        # files which are still written are not processed
+        now = time.time()
+        assert(daemon.runOnce(now=now) == 0)
+        assert(list(daemon.pending.values()) == [now])
+
+        # without LWIR export, the image is processed after the maximum
+        # waiting time
+        assert(daemon.runOnce(now=now+10.) == 0)
+        assert(daemon.runOnce(now=now+599.) == 0)
+        assert(daemon.runOnce(now=now+600.) == 1)
+        assert(len(daemon.store) == 2)
+
+
+def testRunIngestion(exampleDataset):
+    config_path, data_directory = exampleDataset
+    shutil.copy(TESTFILE_LWIR, os.path.join(data_directory, "rs/lwir"))
+
+    # the new files settle during the first scans
+    start = time.time()
+    assert(runIngestion(config_path, data_directory, max_iterations=3) == 1)
+    assert(time.time() - start < 10.)
@@ -0,0 +1,108 @@
+"""Test PlotUtils functions."""
+
+import os
+import sys
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../')))
+from hprocessing.PlotUtils import *
+from hprocessing.ProcessFullDataset import getMask, readConfig
+
+
+MASKS = pd.read_csv("data/testfiles/masks/masks_test.csv", sep="\s+")
+TESTFILE_HDR = "data/testfiles/hyp/Auto017.hdr"
+RECTANGLES = [[30, 35, 18, 25], [10, 15, 5, 8]]
+
+
+@pytest.mark.parametrize("with_mask", [
+    (True), (False),
+])
+def testPlotEnviImageWithMask(exampleImage, tmp_path, with_mask):
+    img, wavelengths, _ = exampleImage
+    filepath = str(tmp_path / "plot.png")
+    plotEnviImageWithMask(
+        image=img, wavelengths=wavelengths, rectangles=RECTANGLES,
+        mask=getMask(MASKS, 0) if with_mask else None, grid=(2, 1),
+        channel=90, save_to_file=True, filepath=filepath)
+    assert(os.path.isfile(filepath))
+
+
+def testPlotEnviImageWithRectangles(exampleImage, tmp_path):
+    img, wavelengths, _ = exampleImage
+    filepath = str(tmp_path / "plot.png")
+    plotEnviImageWithRectangles(
+        image=img, wavelengths=wavelengths, rectangles=RECTANGLES,
+        channel=90, save_to_file=True, filepath=filepath)
+    assert(os.path.isfile(filepath))
+
+
+def testSaveEnviImagePlots(exampleImage, tmp_path):
+    img, wavelengths, _ = exampleImage
+    filepaths = saveEnviImagePlots(
+        images=[TESTFILE_HDR, img], wavelengths=wavelengths,
+        rectangles_list=[RECTANGLES, RECTANGLES[:1]], channels=(5, 90),
+        output_directory=str(tmp_path / "plots"),
+        masks=[getMask(MASKS, 0), None], grid=(2, 2))
+
+    assert([os.path.basename(f) for f in filepaths] == [
+        "plot_envi_Auto017_band5.png", "plot_envi_Auto017_band90.png",
+        "plot_envi_1_band5.png", "plot_envi_1_band90.png"])
+    for filepath in filepaths:
+        assert(os.path.isfile(filepath))
+
+
+@pytest.mark.parametrize("n_jobs", [
+    (None), (2),
+])
+def testRenderQuickLooks(exampleDataset, tmp_path, n_jobs):
+    config_path, data_directory = exampleDataset
+    filepaths = renderQuickLooks(config_path, data_directory, n_jobs=n_jobs)
+    qa_directory = str(tmp_path / "qa" / "20170815_meas1")
+    assert(filepaths == [os.path.join(qa_directory, "Auto017_ch90.png"),
+                         os.path.join(qa_directory,
+                                      "contact_sheet_ch90.png")])
+    for filepath in filepaths:
+        assert(os.path.isfile(filepath))
+
+    # up-to-date plots are skipped, changed positions are rendered again
+    modified = [os.path.getmtime(filepath) for filepath in filepaths]
+    renderQuickLooks(config_path, data_directory, n_jobs=n_jobs)
+    assert([os.path.getmtime(filepath) for filepath in filepaths] ==
+           modified)
+
+    future = modified[1] + 10
+    os.utime(data_directory + "rs/masks/positions_hyp.csv", (future, future))
+    renderQuickLooks(config_path, data_directory, n_jobs=n_jobs)
+    assert(all(os.path.getmtime(filepath) > modified[i]
+               for i, filepath in enumerate(filepaths)))
+
+
+def testRenderQuickLooksOutputDirectory(exampleDataset, tmp_path):
+    config_path, data_directory = exampleDataset
+    filepaths = renderQuickLooks(config_path, data_directory,
+                                 output_directory=str(tmp_path / "other"),
+                                 channel=5)
+    assert(all(filepath.startswith(str(tmp_path / "other"))
+               for filepath in filepaths))
+    assert([os.path.basename(filepath) for filepath in filepaths] == [
+        "Auto017_ch5.png", "contact_sheet_ch5.png"])
+
+
+@pytest.mark.parametrize("grid_remainder", [
+    ("drop"), ("distribute"),
+])
+def testGetQuickLookTasks(exampleDataset, tmp_path, grid_remainder):
+    config_path, data_directory = exampleDataset
+    config = readConfig(config_path, data_directory)
+    config["grid_remainder"] = grid_remainder
+    tasks = getQuickLookTasks(config, str(tmp_path / "other"), channel=5)
+    assert(len(tasks) == 1)
+    assert(tasks[0]["grid_remainder"] == grid_remainder)
+    assert(renderQuickLook(tasks[0]) == str(
+        tmp_path / "other" / "20170815_meas1" / "Auto017_ch5.png"))
@@ -0,0 +1,80 @@
+"""Test batched preprocessing of spectra."""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../')))
+from hprocessing.Preprocessing import *
+
+
+WAVELENGTHS = np.sort(np.random.default_rng(0).uniform(400, 1000, 60))
+SPECTRA = (np.random.default_rng(1).random((50, 60)) +
+           np.sin(WAVELENGTHS / 50.))
+
+
+def getContinuumOfSpectrum(spectrum, wavelengths):
+    """Get upper convex hull of one spectrum with the gift wrapping method."""
+    hull = [0]
+    while hull[-1] < len(wavelengths) - 1:
+        i = hull[-1]
+        slopes = ((spectrum[i+1:] - spectrum[i]) /
+                  (wavelengths[i+1:] - wavelengths[i]))
+        # the farthest band of the steepest slope
+        hull.append(i + 1 + np.flatnonzero(slopes == slopes.max())[-1])
+    return np.interp(wavelengths, wavelengths[hull], spectrum[hull])
+
+
+def testGetContinuum():
+    continuum = getContinuum(SPECTRA, WAVELENGTHS)
+
+    np.testing.assert_allclose(
+        continuum, [getContinuumOfSpectrum(spectrum, WAVELENGTHS)
+                    for spectrum in SPECTRA])
+    assert((continuum >= SPECTRA - 1e-12).all())
+
+
+def testGetContinuumRemovedSpectra():
+    spectra = SPECTRA.copy()
+    spectra[3, 10] = np.nan
+    removed = getContinuumRemovedSpectra(spectra, WAVELENGTHS)
+
+    assert(np.isnan(removed[3]).all())
+    removed = np.delete(removed, 3, axis=0)
+    assert((removed <= 1 + 1e-12).all())
+    np.testing.assert_allclose(removed[:, [0, -1]], 1.)
+
+
+def testGetDerivativeSpectra():
+    spectra = 2. * WAVELENGTHS + 1.
+    np.testing.assert_allclose(
+        getDerivativeSpectra(np.stack([spectra, -spectra]), WAVELENGTHS),
+        np.stack([np.full(60, 2.), np.full(60, -2.)]))
+
+
+@pytest.mark.parametrize("window,polyorder", [
+    (11, 2), (5, 3), (101, 2),
+])
+def testGetSavgolSpectra(window, polyorder):
+    scipy_signal = pytest.importorskip("scipy.signal")
+    smoothed = getSavgolSpectra(SPECTRA, window=window, polyorder=polyorder)
+
+    for spectrum, spectrum_smoothed in zip(SPECTRA, smoothed):
+        np.testing.assert_allclose(spectrum_smoothed,
+                                   scipy_signal.savgol_filter(
+                                       spectrum, min(window, 59), polyorder))
+
+
+def testPreprocessSpectra():
+    spectra = preprocessSpectra(SPECTRA, WAVELENGTHS,
+                                steps=("derivative", "continuum"))
+    np.testing.assert_allclose(spectra, getContinuumRemovedSpectra(
+        getDerivativeSpectra(SPECTRA, WAVELENGTHS), WAVELENGTHS))
+    np.testing.assert_array_equal(
+        preprocessSpectra(SPECTRA, WAVELENGTHS, steps=()), SPECTRA)
+
+    with pytest.raises(ValueError):
+        preprocessSpectra(SPECTRA, WAVELENGTHS, steps=("continuum", "pca"))
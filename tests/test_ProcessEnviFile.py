@@ -4,6 +4,7 @@ import os
 import sys
 
 import numpy as np
+import pandas as pd
 import pytest
 
 sys.path.insert(0, os.path.abspath(
@@ -53,6 +54,28 @@ def testGetMultipleSpectra(exampleEnviProcessing, setupProcessor, with_mask,
     assert(df.shape == expected_shape)
 
 
+@pytest.mark.parametrize("grid,mode,integral", [
+    ((1, 1), "median", False), ((2, 3), "max10", False),
+    ((0, 0), "mean", False), ((0, 0), "std", True),
+])
+def testGetMultipleSpectraFloat32(exampleEnviProcessing, setupProcessor, grid,
+                                  mode, integral):
+    proc = exampleEnviProcessing
+    proc.grid = grid
+    proc.stat_mode = mode
+    proc.use_integral_image = integral
+    proc.mask = getMask(setupProcessor.masks, setupProcessor.index_of_meas,
+                        setupProcessor.imageshape)
+    expected = proc.getMultipleSpectra()
+    proc.dtype = np.dtype("float32")
+    proc.integral_image = None
+    df = proc.getMultipleSpectra()
+
+    assert((df[proc.wavelengths].dtypes == np.float32).all())
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False,
+                                  check_exact=False, rtol=1e-5)
+
+
 @pytest.mark.parametrize("grid,expected_rows,expected_columns", [
     ((1, 1), 1, 1),
     ((2, 3), 2, 3),
@@ -82,6 +105,225 @@ def testGetEdgesForGrid(exampleEnviProcessing, grid, expected_edges):
     assert(new_edges == expected_edges)
 
 
+@pytest.mark.parametrize("grid_real,remainder,expected_shape", [
+    ((1, 1), "drop", (1, 1)), ((2, 2), "drop", (2, 3)),
+    ((2, 2), "distribute", (2, 2)), ((5, 3), "distribute", (5, 3)),
+    ((3, 2), "distribute", (3, 2)),
+])
+def testGetGridCells(grid_real, remainder, expected_shape):
+    cell_edges, grid_index = getGridCells(EDGES, grid_real,
+                                          remainder=remainder)
+    assert(cell_edges.shape == (np.prod(expected_shape), 4))
+    assert(grid_index.shape == (np.prod(expected_shape), 2))
+    assert(list(grid_index.max(axis=0) + 1) == list(expected_shape))
+    if remainder == "drop":
+        assert(cell_edges.tolist() == getEdgesForGrid(EDGES, grid_real))
+
+    # the grid elements do not overlap, with distribute they cover the zone
+    covered = np.zeros((50, 50), dtype=int)
+    for row_start, row_end, col_start, col_end in cell_edges:
+        covered[row_start:row_end, col_start:col_end] += 1
+    assert(covered.max() == 1)
+    if remainder == "distribute":
+        assert(covered.sum() == (EDGES[1] - EDGES[0])*(EDGES[3] - EDGES[2]))
+
+    with pytest.raises(ValueError):
+        getGridCells(EDGES, grid_real, remainder="keep")
+
+
+@pytest.mark.parametrize("mode", [
+    ("median"), ("mean"), ("max"), ("max10"), ("std"),
+])
+def testGetBlockStatistics(exampleImage, mode):
+    img, _, _ = exampleImage
+    roi = img[10:15, 5:8]
+    blocks = getGridBlocks(img, edges=EDGES, grid_real=(1, 1))
+    assert(blocks.shape == (1, 1, 15, 138))
+    stats = getBlockStatistics(blocks, mode=mode)
+    assert(stats.shape == (1, 1, 138))
+
+    pixels = roi.reshape(15, 138).astype(float)
+    expected = {"median": np.median(pixels, axis=0),
+                "mean": np.mean(pixels, axis=0),
+                "max": np.max(pixels, axis=0),
+                "max10": np.mean(np.sort(pixels, axis=0)[-10:], axis=0),
+                "std": np.std(pixels, axis=0)}[mode]
+    assert(np.allclose(stats[0, 0], expected))
+
+
+def testGetGridBlocks(exampleImage):
+    img, _, _ = exampleImage
+    blocks = getGridBlocks(img, edges=[10, 14, 5, 11], grid_real=(2, 3))
+    assert(blocks.shape == (2, 3, 4, 138))
+    assert(np.array_equal(blocks[1, 2], img[12:14, 9:11].reshape(4, 138)))
+
+    # masked pixels are NaN and ignored
+    mask = np.ones((50, 50), dtype=bool)
+    mask[12, 9] = False
+    blocks = getGridBlocks(img, edges=[10, 14, 5, 11], grid_real=(2, 3),
+                           mask=mask)
+    assert(np.isnan(blocks[1, 2, 0]).all())
+    stats = getBlockStatistics(blocks, mode="mean")
+    assert(np.allclose(stats[1, 2],
+                       img[12:14, 9:11].reshape(4, 138)[1:].mean(axis=0)))
+
+    with pytest.raises(ValueError):
+        getBlockStatistics(blocks, mode="mode")
+
+
+def testGetGridBlocksDistribute(exampleImage):
+    img, _, _ = exampleImage
+    mask = np.ones((50, 50), dtype=bool)
+    mask[14, 7] = False
+    blocks = getGridBlocks(img, edges=EDGES, grid_real=(2, 2), mask=mask,
+                           remainder="distribute")
+    assert(blocks.shape == (2, 2, 6, 138))
+
+    stats = getBlockStatistics(blocks, mode="mean")
+    cell_edges, grid_index = getGridCells(EDGES, (2, 2),
+                                          remainder="distribute")
+    for (row_start, row_end, col_start, col_end), (i, j) in zip(cell_edges,
+                                                                grid_index):
+        pixels = img[row_start:row_end, col_start:col_end].astype(float)
+        pixels = pixels[mask[row_start:row_end, col_start:col_end]]
+        assert(np.allclose(stats[i, j], pixels.mean(axis=0)))
+
+
+@pytest.mark.parametrize("start,end,n,target,remainder,expected", [
+    (10, 15, 5, (120, 130), "drop", ([0, 2, 4, 6, 8], [2, 4, 6, 8, 10])),
+    (10, 14, 3, (120, 130), "drop", ([0, 2, 5, 7], [2, 5, 7, 10])),
+    (10, 16, 4, (120, 130), "distribute", ([0, 1, 5, 6], [1, 5, 6, 10])),
+    (10, 15, 5, (120, 122), "drop", ([0, 0, 0, 1, 1], [1, 1, 1, 2, 2])),
+])
+def testGetMappedGridBounds(start, end, n, target, remainder, expected):
+    starts, ends = getMappedGridBounds(start, end, n, *target,
+                                       remainder=remainder)
+    assert(list(starts - target[0]) == expected[0])
+    assert(list(ends - target[0]) == expected[1])
+    assert(len(starts) == len(getGridBounds(start, end, n,
+                                            remainder=remainder)[0]))
+
+
+def testGetBlocksFromBounds(exampleImage):
+    img, _, _ = exampleImage
+    # overlapping grid elements
+    row_bounds = (np.array([10, 10]), np.array([11, 12]))
+    col_bounds = (np.array([5]), np.array([6]))
+    blocks = getBlocksFromBounds(img, row_bounds, col_bounds)
+    pixels = img[10:12, 5:6].reshape(2, 138)
+    assert(blocks.shape == (2, 1, 2, 138))
+    assert(np.array_equal(blocks[0, 0, 0], pixels[0]))
+    assert(np.isnan(blocks[0, 0, 1]).all())
+    assert(np.array_equal(blocks[1, 0], pixels))
+
+
+@pytest.mark.parametrize("mode,with_mask", [
+    ("mean", False), ("mean", True), ("std", False), ("std", True),
+])
+def testGetIntegralImageStatistics(exampleImage, mode, with_mask):
+    img, _, _ = exampleImage
+    mask = None
+    if with_mask:
+        mask = np.random.RandomState(0).rand(50, 50) > 0.3
+    integral_image = getIntegralImage(img[:, :], mask=mask)
+    assert(integral_image["sum"].shape == (51, 51, 138))
+
+    edges = [[10, 15, 5, 8], [0, 50, 0, 50], [12, 13, 7, 8], [3, 3, 4, 9]]
+    stats = getIntegralImageStatistics(integral_image, edges, mode=mode)
+    assert(stats.shape == (4, 138))
+    for i, rectangle in enumerate(edges[:3]):
+        expected = getBlockStatistics(getGridBlocks(
+            img, rectangle, grid_real=(1, 1), mask=mask), mode=mode)[0, 0]
+        assert(np.allclose(stats[i], expected, atol=1e-3, equal_nan=True))
+    assert(np.isnan(stats[3]).all())
+
+    with pytest.raises(ValueError):
+        getIntegralImageStatistics(integral_image, edges, mode="median")
+
+
+@pytest.mark.parametrize("grid,mode", [
+    ((1, 1), "mean"), ((2, 3), "std"), ((0, 0), "mean"), ((0, 0), "median"),
+])
+def testGetMeanSpectraFromSquareGridIntegralImage(exampleEnviProcessing,
+                                                  setupProcessor, grid, mode):
+    proc = exampleEnviProcessing
+    proc.grid = grid
+    proc.mask = getMask(setupProcessor.masks, setupProcessor.index_of_meas,
+                        setupProcessor.imageshape)
+    expected = proc.getMeanSpectraFromSquareGrid(edges=EDGES, mode=mode)
+    proc.use_integral_image = True
+    spectra = proc.getMeanSpectraFromSquareGrid(edges=EDGES, mode=mode)
+    pd.testing.assert_frame_equal(spectra, expected, check_exact=False,
+                                  atol=1e-3)
+
+
+@pytest.mark.parametrize("grid,mode", [((2, 2), "mean"), ((4, 2), "std")])
+def testGetMeanSpectraFromSquareGridDistribute(exampleEnviProcessing, grid,
+                                               mode):
+    proc = exampleEnviProcessing
+    proc.grid = grid
+    proc.grid_remainder = "distribute"
+    spectra = proc.getMeanSpectraFromSquareGrid(edges=EDGES, mode=mode)
+    assert(spectra.shape == (grid[0]*grid[1], 125+2))
+    assert(spectra["GridElement_Row"].max() == grid[0] - 1)
+    assert(spectra["GridElement_Column"].max() == grid[1] - 1)
+
+    proc.use_integral_image = True
+    pd.testing.assert_frame_equal(
+        proc.getMeanSpectraFromSquareGrid(edges=EDGES, mode=mode), spectra,
+        check_exact=False, atol=1e-3)
+
+
+@pytest.mark.parametrize("window,stride,mode,masked", [
+    ((2, 3), (1, 1), "median", False), ((3, 3), (2, 1), "mean", True),
+    ((4, 2), (3, 2), "max10", False), ((2, 2), (1, 3), "std", True),
+])
+def testGetWindowStatistics(window, stride, mode, masked):
+    rng = np.random.default_rng(0)
+    data = rng.random((9, 8, 4))
+    mask = rng.random((9, 8)) > 0.3 if masked else None
+    stats = getWindowStatistics(data, window=window, stride=stride,
+                                mode=mode, mask=mask)
+
+    rows = range(0, data.shape[0] - window[0] + 1, stride[0])
+    cols = range(0, data.shape[1] - window[1] + 1, stride[1])
+    assert(stats.shape == (len(rows), len(cols), 4))
+    for i, row in enumerate(rows):
+        for j, col in enumerate(cols):
+            edges = [row, row + window[0], col, col + window[1]]
+            expected = getBlockStatistics(
+                getGridBlocks(data, edges, (1, 1), mask=mask), mode=mode)
+            np.testing.assert_allclose(stats[i, j], expected[0, 0])
+
+    with pytest.raises(ValueError):
+        getWindowStatistics(data, window=(10, 1))
+
+
+@pytest.mark.parametrize("zone,mode,integral", [
+    (None, "median", False), ("zone1", "mean", False),
+    ("zone1", "mean", True), ("zone1", "std", True),
+])
+def testGetDenseReflectanceMap(exampleEnviProcessing, zone, mode, integral):
+    proc = exampleEnviProcessing
+    proc.use_integral_image = integral
+    reflectance = proc.getDenseReflectanceMap(
+        window=(3, 2), stride=(2, 1), zone=zone, mode=mode)
+
+    edges = EDGES if zone else [0, proc.image.shape[0],
+                                0, proc.image.shape[1]]
+    spectralon = proc.getMeanSpectrumFromRectangle(
+        edges=proc.getEdgesFromPrefix(prefix="spec"), mode="max10")
+    assert(reflectance.shape == ((edges[1] - edges[0] - 3) // 2 + 1,
+                                 (edges[3] - edges[2] - 2) // 1 + 1, 125))
+    for i, j in [(0, 0), (reflectance.shape[0] - 1, 1)]:
+        row, col = edges[0] + 2 * i, edges[2] + j
+        spectrum = proc.getMeanSpectrumFromRectangle(
+            edges=[row, row + 3, col, col + 2], mode=mode)
+        expected = getCalibratedSpectrum(spectrum, spectralon,
+                                         proc.spectralon_factor)
+        np.testing.assert_allclose(reflectance[i, j], expected, atol=1e-3)
+
+
 @pytest.mark.parametrize("mode", [
     ("median"), ("mean"), ("max"), ("max10"),
 ])
@@ -111,6 +353,35 @@ def testGetEnviFile():
     assert(img.shape == (50, 50, 138))
 
 
+@pytest.mark.parametrize("load,bands,pixel_step", [
+    (False, (5,), 1), (True, (5,), 1), (False, (0, 100), 7),
+])
+def testIsEmptyImage(load, bands, pixel_step):
+    _, img = getEnviFile(filepath=TESTFILE_HDR)
+    if load:
+        img = img.load()
+    assert(not isEmptyImage(img, bands=bands, pixel_step=pixel_step))
+
+    empty_img = np.zeros((50, 50, 138), dtype=np.uint16)
+    assert(isEmptyImage(empty_img, bands=bands, pixel_step=pixel_step))
+    empty_img[1, 1, bands[0]] = 1
+    assert(isEmptyImage(empty_img, bands=bands, pixel_step=2))
+    assert(not isEmptyImage(empty_img, bands=bands, pixel_step=1))
+
+
+@pytest.mark.parametrize("band", [
+    (0), (5), (137),
+])
+def testReadBand(band):
+    _, img = getEnviFile(filepath=TESTFILE_HDR)
+    expected = np.asarray(img.load())[:, :, band]
+    np.testing.assert_array_equal(readBand(img, band), expected)
+    np.testing.assert_array_equal(readBand(img.load(), band), expected)
+
+    data = np.arange(4*3*2).reshape(4, 3, 2)
+    np.testing.assert_array_equal(readBand(data, 1), data[:, :, 1])
+
+
 def testGetEnviHeader():
     hdr = getEnviHeader(TESTFILE_HDR_HIGHRES)
     assert(isinstance(hdr, dict))
@@ -166,6 +437,43 @@ def testGetCalibratedSpectrum(exampleImage):
         soil=list(img[5, 8, :]), spectralon=list(img[30, 25, :]))
 
 
+@pytest.mark.parametrize("filepath", [
+    (TESTFILE_HDR), (TESTFILE_HDR_HIGHRES),
+])
+def testParseEnviHeader(filepath):
+    hdr_spy = getEnviHeader(filepath)
+    hdr = parseEnviHeader(filepath)
+    assert(hdr.keys() == hdr_spy.keys())
+    for key, value in hdr_spy.items():
+        if isinstance(value, list):
+            assert(isinstance(hdr[key], np.ndarray))
+            assert(list(hdr[key]) == value)
+        else:
+            assert(hdr[key] == value)
+
+
+def testParseEnviHeaderRaises():
+    with pytest.raises(IOError):
+        parseEnviHeader("data/testfiles/masks/masks_test.csv")
+
+
+def testEnviHeaderCache():
+    header_cache = EnviHeaderCache()
+    hdr1 = getEnviHeader(TESTFILE_HDR_HIGHRES, header_cache=header_cache)
+    hdr2 = getEnviHeader(TESTFILE_HDR_HIGHRES, header_cache=header_cache)
+    assert(hdr1["Wavelength"] is hdr2["Wavelength"])
+    assert(hdr1["bbl"] is hdr2["bbl"])
+    assert(not hdr1["bbl"].flags.writeable)
+
+    n_fields = len(header_cache)
+    parseEnviHeader(TESTFILE_HDR_HIGHRES, header_cache=header_cache)
+    assert(len(header_cache) == n_fields)
+
+    date, time = readEnviHeader(hdr1)
+    assert(date == "20170815")
+    assert(time == "17:57:02")
+
+
 def testReadEnviHeader():
     hdr_highres = getEnviHeader(TESTFILE_HDR_HIGHRES)
     date, time = readEnviHeader(hdr_highres)
@@ -173,10 +481,41 @@ def testReadEnviHeader():
     assert(time == "17:57:02")
 
 
+def testReadEnviDescription():
+    description = readEnviDescription(TESTFILE_HDR_HIGHRES)
+    assert(description == getEnviHeader(TESTFILE_HDR_HIGHRES)["description"])
+
+
+@pytest.mark.parametrize("timezone,expected", [
+    ("+02:00", ["2017-08-15 15:57:02", "2017-05-16 22:02:24", None]),
+    ("+00:00", ["2017-08-15 17:57:02", "2017-05-17 00:02:24", None]),
+    ("Europe/Berlin", ["2017-08-15 15:57:02", "2017-05-16 22:02:24", None]),
+])
+def testGetDatetimesFromDescriptions(timezone, expected):
+    descriptions = [getEnviHeader(TESTFILE_HDR_HIGHRES)["description"],
+                    "Date: 05/17/2017,\nTime: 12:02:24.34 A,",
+                    "Date:\nTime:\nKomentar:"]
+    datetimes = getDatetimesFromDescriptions(descriptions, timezone=timezone)
+    assert(list(datetimes) == list(pd.to_datetime(expected, utc=True)))
+
+
+@pytest.mark.parametrize("description", [
+    "Date: 05/17/2017,\nTime: 12:02:24.34 A,",
+    "Date: 05/17/2017,\nTime: 12:02:24.34 P,",
+    "Date: 05/17/2017,\nTime: 6:02:24.34 P,",
+])
+def testReadEnviHeaderMatchesDescriptions(description):
+    date, time = readEnviHeader({"description": description})
+    datetimes = getDatetimesFromDescriptions([description], timezone="UTC")
+    assert(pd.Timestamp(date+" "+time, tz="UTC") == datetimes[0])
+
+
 @pytest.mark.parametrize("time,ampm,expected", [
     ("6:02:24", "A", "6:02:24"),
     ("6:02:24", "P", "18:02:24"),
     ("6:02:24", "PM", "18:02:24"),
+    ("12:02:24", "A", "0:02:24"),
+    ("12:02:24", "P", "12:02:24"),
 ])
 def testFormatTime(time, ampm, expected):
     newtime = formatTime(time, ampm)
@@ -1,17 +1,25 @@
 """Test ProcessFullDataset class."""
 
 import os
+import shutil
 import sys
 
+import numpy as np
 import pandas as pd
 import pytest
 
 sys.path.insert(0, os.path.abspath(
     os.path.join(os.path.dirname(__file__), '../')))
+from hprocessing.ProcessEnviFile import EnviHeaderCache
 from hprocessing.ProcessFullDataset import *
+from hprocessing.Preprocessing import preprocessSpectra
 
 
 MASKS = pd.read_csv("data/testfiles/masks/masks_test.csv", sep="\s+")
+TESTFILE_HDR = "data/testfiles/hyp/Auto017.hdr"
+TESTPATH_LWIR = "data/testfiles/lwir/"
+TESTFILE_LWIR = ("data/testfiles/lwir/"
+                 "ir_export_20170815_P0000000_001_17-56-00.csv")
 
 
 def testGetWoodenBarMask(setupProcessor):
@@ -27,6 +35,38 @@ def testGetMask(setupProcessor):
     assert(mask.shape == (50, 50))
 
 
+def testMeasurementGeometry(setupProcessor):
+    positions = pd.concat([setupProcessor.positions_hyp]*3,
+                          ignore_index=True)
+    positions["measurement"] = ["meas0", "meas1", "meas0"]
+    positions.loc[1, "zone2_row_end"] = np.nan
+    masks = pd.concat([MASKS]*2, ignore_index=True)
+    masks["measurement"] = ["meas1", "meas0"]
+    geometry = MeasurementGeometry(positions, masks=masks)
+
+    assert(geometry.index == {"meas0": 0, "meas1": 1})
+    assert(geometry.getIndexOfMeasurement("meas1") == 1)
+    with pytest.raises(KeyError):
+        geometry.getIndexOfMeasurement("meas9")
+    assert(geometry.prefixes == ["zone1", "zone2", "spec"])
+    assert(geometry.edges.shape == (3, 3, 4))
+    assert(geometry.getEdges(0, prefixes=["spec", "zone1"]) == {
+        "spec": [30, 35, 18, 25], "zone1": [10, 15, 5, 8]})
+    assert(np.isnan(geometry.edges[1, 1, 1]))
+    assert(geometry.getEdges(1, prefixes=["zone1"]) == {
+        "zone1": [10, 15, 5, 8]})
+    with pytest.raises(ValueError):
+        geometry.getEdges(1)
+    assert(geometry.getDefinedPrefixes(1) == ["zone1", "spec"])
+    assert(geometry.getDefinedPrefixes(0) == ["zone1", "zone2", "spec"])
+
+    mask = geometry.getMask("meas0", imageshape=(50, 50))
+    assert(np.array_equal(mask, getMask(masks, 1, imageshape=(50, 50))))
+    assert(geometry.getMask("meas0", imageshape=(50, 50)) is mask)
+    assert(not mask.flags.writeable)
+    assert(geometry.getMask("meas9") is None)
+
+
 @pytest.mark.parametrize("zone_list,expected", [
     (["zone1"], (1, 3)),
     (["zone1", "zone2"], (2, 3)),
@@ -48,6 +88,71 @@ def testGetLwirData(setupProcessor):
     assert(lwir_data.shape == (1, 4))
 
 
+def testGetLwirDataFromBatch(setupProcessor):
+    proc = setupProcessor
+    proc.zone_list = ["zone1", "zone2"]
+    lwir_batch = getLwirDataBatch(
+        hyp_datetimes=[proc.datetime], lwir_path=proc.lwir_path,
+        positions_lwir=proc.positions_lwir, zone_list=["zone1", "zone2"])
+    proc.lwir_data = lwir_batch
+    lwir_data = proc.getLwirData()
+    assert(lwir_data.shape == (2, 4))
+    assert(list(lwir_data["zone"]) == ["zone1", "zone2"])
+
+    proc.lwir_data = lwir_batch.iloc[:0]
+    lwir_data = proc.getLwirData()
+    assert(lwir_data.shape == (1, 4))
+    assert(lwir_data.isnull().all(axis=None))
+
+
+@pytest.mark.parametrize("grid,zone_list,expected_rows", [
+    ((1, 1), ["zone1"], 1),
+    ((1, 1), ["zone1", "zone2"], 2),
+    ((2, 3), ["zone1"], 6),
+    ((0, 0), ["zone1", "zone2"], 15+9),
+    ((3, 1), ["zone1"], 5),
+])
+def testGetLwirGridData(setupProcessor, grid, zone_list, expected_rows):
+    proc = setupProcessor
+    proc.grid = grid
+    proc.zone_list = zone_list
+    lwir_data = proc.getLwirGridData()
+    assert(lwir_data.shape == (expected_rows, 6))
+    assert(not lwir_data[["mean", "med", "std"]].isnull().any(axis=None))
+
+    # grid (1, 1) equals the zone-wise data
+    if grid == (1, 1):
+        frames = getLwirFrames([proc.getNearestLwirFile()[0]])
+        edges = getLwirZoneEdges(proc.positions_lwir, 0, zone_list)
+        stats = getLwirZoneStatistics(frames, edges)[0]
+        assert(np.allclose(lwir_data[["mean", "med", "std"]].values, stats))
+
+    # no LWIR data found
+    proc.datetime = pd.to_datetime("2017-08-16 10:30:00+02:00", utc=True)
+    lwir_data = proc.getLwirGridData()
+    assert(lwir_data.shape == (expected_rows, 6))
+    assert(lwir_data[["mean", "med", "std"]].isnull().all(axis=None))
+
+
+@pytest.mark.parametrize("grid,lwir_edges,expected_rows", [
+    ((0, 0), (120, 130, 315, 355), 15),
+    ((3, 1), (120, 130, 315, 355), 5),
+    ((2, 2), (120, 127, 315, 322), 6),
+    # the LWIR zone is smaller than the grid
+    ((0, 0), (120, 122, 315, 317), 15),
+])
+def testProcessLwirGrid(setupProcessor, grid, lwir_edges, expected_rows):
+    positions_lwir = setupProcessor.positions_lwir.copy()
+    positions_lwir.loc[0, ["zone1_row_start", "zone1_row_end",
+                           "zone1_col_start", "zone1_col_end"]] = lwir_edges
+    setupProcessor.positions_lwir = positions_lwir
+    setupProcessor.grid = grid
+    setupProcessor.lwir_grid = True
+    df = setupProcessor.process()
+    assert(df.shape == (expected_rows, 125 + 3 + 1 + 2 + 3))
+    assert(not df[["mean", "med", "std"]].isnull().any(axis=None))
+
+
 @pytest.mark.parametrize("masks", [
     (None), (MASKS),
 ])
@@ -59,6 +164,487 @@ def testProcess(setupProcessor, masks):
     df_lwir_n = 3
     assert(df.shape == (1, df_hyp_n + df_sm_n + df_lwir_n))
 
+
+def testSaveAndReadLongFormat(setupProcessor, tmp_path):
+    setupProcessor.grid = (0, 0)
+    df = setupProcessor.process()
+    spectra, metadata = splitSpectra(df, setupProcessor.hyp_wavelengths)
+    assert(spectra.shape == (15, 125))
+    assert(metadata.shape == (15, 3 + 1 + 2 + 3))
+
+    # missing values in text columns stay missing
+    metadata["comment"] = ["nan", np.nan, None] + ["ok"] * 12
+    metadata.loc[1, "zone"] = np.nan
+
+    filepath = str(tmp_path / "output.npz")
+    saveLongFormat(filepath, spectra, metadata,
+                   setupProcessor.hyp_wavelengths)
+    spectra_read, metadata_read, wavelengths = readLongFormat(filepath)
+
+    np.testing.assert_array_equal(spectra_read, spectra)
+    metadata.loc[2, "comment"] = np.nan
+    pd.testing.assert_frame_equal(metadata_read, metadata)
+    assert(list(wavelengths) == [str(w) for w in
+                                 setupProcessor.hyp_wavelengths])
+
+
+@pytest.mark.parametrize("output_format,expected", [
+    ("csv", "output/HydReSGeo_Output.csv"),
+    ("npz", "output/HydReSGeo_Output.npz"),
+    ("store", "output/HydReSGeo_Output.csv"),
+])
+def testGetOutputPath(output_format, expected):
+    config = {"data_output": "output/HydReSGeo_Output.csv",
+              "output_format": output_format}
+    assert(getOutputPath(config) == expected)
+
+
+def testSaveOutputNpz(setupProcessor, tmp_path):
+    df = setupProcessor.process()
+    config = {"data_output": str(tmp_path / "output.csv"),
+              "output_format": "npz", "overwrite_csv_file": True}
+    saveOutput(config, [(df, setupProcessor.hyp_wavelengths)])
+    assert(os.listdir(str(tmp_path)) == ["output.npz"])
+    spectra, _, _ = readLongFormat(str(tmp_path / "output.npz"))
+    assert(spectra.shape == (1, 125))
+
+
+@pytest.mark.parametrize("prefetch_depth", [
+    (0), (1), (3),
+])
+def testEnviPrefetcher(prefetch_depth):
+    prefetcher = EnviPrefetcher(hyp_hdr_paths=[TESTFILE_HDR]*4,
+                                prefetch_depth=prefetch_depth)
+    hyp_files_list = list(prefetcher)
+    assert(len(hyp_files_list) == 4)
+    for hdr, img, hdr_highres in hyp_files_list:
+        assert(isinstance(hdr, dict))
+        assert(isinstance(hdr_highres, dict))
+        assert(img.shape == (50, 50, 138))
+
+
+def testEnviPrefetcherRaises():
+    prefetcher = EnviPrefetcher(
+        hyp_hdr_paths=[TESTFILE_HDR, "data/testfiles/hyp/Missing.hdr"],
+        prefetch_depth=2)
+    with pytest.raises(Exception):
+        list(prefetcher)
+
+
+def testProcessWithPrefetchedFiles(setupProcessor):
+    hyp_files = next(iter(EnviPrefetcher(
+        [TESTFILE_HDR], header_cache=EnviHeaderCache())))
+    proc = ProcessFullDataset(
+        hyp_hdr_path=TESTFILE_HDR,
+        meas_name=setupProcessor.meas_name,
+        positions_hyp=setupProcessor.positions_hyp,
+        positions_lwir=setupProcessor.positions_lwir,
+        zone_list=setupProcessor.zone_list,
+        lwir_path=setupProcessor.lwir_path,
+        soilmoisture_path=setupProcessor.soilmoisture_path,
+        masks=setupProcessor.masks,
+        hyp_files=hyp_files)
+    df = proc.process()
+    pd.testing.assert_frame_equal(df, setupProcessor.process())
+
+
+def testProcessWithHypDatetime(setupProcessor):
+    catalog = getHyperspectralCatalog("data/testfiles/")
+    proc = ProcessFullDataset(
+        hyp_hdr_path=catalog["path"][0],
+        meas_name=setupProcessor.meas_name,
+        positions_hyp=setupProcessor.positions_hyp,
+        positions_lwir=setupProcessor.positions_lwir,
+        zone_list=setupProcessor.zone_list,
+        lwir_path=setupProcessor.lwir_path,
+        soilmoisture_path=setupProcessor.soilmoisture_path,
+        masks=setupProcessor.masks,
+        hyp_datetime=catalog["datetime"][0])
+    assert(proc.datetime == setupProcessor.datetime)
+    assert(proc.date == setupProcessor.date)
+    assert(proc.time == setupProcessor.time)
+
+
+@pytest.mark.parametrize("datetime,mode,exclude,expected", [
+    ("2017-08-15 10:04", "nearest", None, 1.),
+    ("2017-08-15 10:04", "interpolate", None, 1.4),
+    ("2017-08-15 10:04", "nearest", {"meas1/Auto001"}, 2.),
+    ("2017-08-15 10:12", "interpolate", None, 2.),
+    ("2017-08-15 11:00", "nearest", None, None),
+])
+def testSpectralonCache(tmp_path, datetime, mode, exclude, expected):
+    cache = SpectralonCache()
+    for i, (minute, value) in enumerate([(0, 1.), (10, 2.), (20, 10.),
+                                         (30, np.nan)]):
+        cache.put("meas1/Auto{0:03d}".format(i+1),
+                  pd.Timestamp("2017-08-15 10:{0:02d}".format(minute),
+                               tz="UTC"),
+                  np.full(3, value), [30, 35, 18, 25],
+                  wavelengths=["400", "500", "600"], occluded=(i == 2))
+
+    reference = cache.getReference(pd.Timestamp(datetime, tz="UTC"), 30,
+                                   mode=mode, exclude=exclude)
+    if expected is None:
+        assert(reference is None)
+    else:
+        np.testing.assert_allclose(reference, np.full(3, expected))
+
+    cache.save(str(tmp_path / "spectralon.npz"))
+    loaded = SpectralonCache.load(str(tmp_path / "spectralon.npz"))
+    for array, array_loaded in zip(cache.toArrays(), loaded.toArrays()):
+        if isinstance(array, pd.DataFrame):
+            pd.testing.assert_frame_equal(array_loaded, array,
+                                          check_dtype=False)
+        else:
+            np.testing.assert_array_equal(array_loaded, array)
+    assert(loaded.occluded == {"meas1/Auto003"})
+    assert(loaded.get("meas1/Auto001", edges=[30, 35, 18, 26]) is None)
+    with pytest.raises(ValueError):
+        loaded.put("meas1/Auto005", pd.Timestamp("2017-08-15", tz="UTC"),
+                   np.ones(2), [30, 35, 18, 25], wavelengths=["400", "500"])
+
+
+def testProcessWithSpectralonCache(setupProcessor):
+    key = "20170815_meas1/Auto017"
+    df_expected = setupProcessor.process()
+    wavelengths = setupProcessor.hyp_wavelengths
+    cache = SpectralonCache()
+    setupProcessor.hyp_spectralon_cache = cache
+    pd.testing.assert_frame_equal(setupProcessor.process(), df_expected)
+    assert(len(cache) == 1)
+    spectralon = cache.get(key)
+
+    # the cached spectralon is used
+    cache.spectra[key] = spectralon * 2
+    np.testing.assert_allclose(
+        setupProcessor.process()[wavelengths].values * 2,
+        df_expected[wavelengths].values)
+
+    # the spectralon is occluded compared to an image two minutes later
+    cache = SpectralonCache()
+    cache.put("20170815_meas1/Auto018",
+              setupProcessor.datetime + pd.Timedelta(minutes=2),
+              spectralon * 10, [30, 35, 18, 25])
+    setupProcessor.hyp_spectralon_cache = cache
+    setupProcessor.hyp_spectralon_reuse = "nearest"
+    np.testing.assert_allclose(
+        setupProcessor.process()[wavelengths].values * 10,
+        df_expected[wavelengths].values)
+    assert(cache.occluded == {key})
+
+
+def testMarkOccluded():
+    cache = SpectralonCache()
+    for i, (minute, value) in enumerate([(0, 0.2), (10, 1.), (20, 0.2),
+                                         (30, 2.)]):
+        cache.put("meas1/Auto{0:03d}".format(i+1),
+                  pd.Timestamp("2017-08-15 10:{0:02d}".format(minute),
+                               tz="UTC"),
+                  np.full(3, value), [30, 35, 18, 25])
+
+    # the first image is compared with the images after it, too
+    cache.markOccluded(list(cache.spectra), 30, mode="interpolate")
+    assert(cache.occluded == {"meas1/Auto001", "meas1/Auto003"})
+    cache.markOccluded(["meas1/Auto001"], 30, min_ratio=0.1)
+    assert(cache.occluded == {"meas1/Auto003"})
+
+
+def testFillSpectralonCache(setupProcessor, tmp_path):
+    proc = setupProcessor
+    hyp_tasks = []
+    for i, minute in enumerate([55, 0, 5]):
+        hyp_hdr_path = str(tmp_path / "Auto{0:03d}.hdr".format(i+1))
+        for ending in [".hdr", ".cue", "_highres.hdr"]:
+            shutil.copy(TESTFILE_HDR[:-4]+ending, hyp_hdr_path[:-4]+ending)
+        hyp_tasks.append((hyp_hdr_path, proc.meas_name, i+1, pd.Timestamp(
+            "2017-08-15 {0}:{1:02d}".format(15 + (i > 0), minute),
+            tz="UTC"), ["zone1", "zone2"]))
+    params = {"positions_hyp": proc.positions_hyp,
+              "positions_lwir": proc.positions_lwir,
+              "lwir_path": proc.lwir_path,
+              "soilmoisture_path": proc.soilmoisture_path,
+              "masks": proc.masks,
+              "time_window_width": 30,
+              "hyp_spectralon_cache": SpectralonCache(),
+              "hyp_spectralon_reuse": "interpolate"}
+
+    cache = params["hyp_spectralon_cache"]
+    assert(fillSpectralonCache(hyp_tasks, params) ==
+           [proc.meas_name+"/Auto{0:03d}".format(i) for i in [1, 2, 3]])
+    assert(cache.occluded == set())
+
+    # the cached images are not read again
+    missing_tasks = [(str(tmp_path / "missing" / os.path.basename(task[0])),
+                      ) + task[1:] for task in hyp_tasks]
+    assert(fillSpectralonCache(missing_tasks, params) == [])
+
+    # without reuse, the workers return their spectralons to the driver
+    pytest.importorskip("multiprocessing.shared_memory")
+    hyp_files = [getHyperspectralFiles(task[0], load_image=True)
+                 for task in hyp_tasks]
+    expected = list(processImages(hyp_tasks, [None]*3, hyp_files, params))
+    params_shared = dict(params, hyp_spectralon_cache=SpectralonCache(),
+                         hyp_spectralon_reuse="none")
+    results = list(processImagesShared(
+        hyp_tasks, [None]*3, hyp_files, params_shared, getSoilMoistureIndex(
+            proc.soilmoisture_path, getSoilMoistureSensorRegistry()),
+        n_jobs=2))
+    for (datapoint, _), (expected_datapoint, _) in zip(results, expected):
+        pd.testing.assert_frame_equal(datapoint, expected_datapoint)
+    cache_shared = params_shared["hyp_spectralon_cache"]
+    assert(sorted(cache_shared.spectra) == sorted(cache.spectra))
+    for key, spectrum in cache.spectra.items():
+        np.testing.assert_array_equal(cache_shared.spectra[key], spectrum)
+        assert(cache_shared.getEntry(key)["datetime"] ==
+               cache.getEntry(key)["datetime"])
+
+
+def testProcessWithPreprocessing(setupProcessor):
+    setupProcessor.grid = (0, 0)
+    df_expected = setupProcessor.process()
+    wavelengths = setupProcessor.hyp_wavelengths
+    setupProcessor.hyp_preprocessing = ("derivative", "continuum")
+    df = setupProcessor.process()
+
+    np.testing.assert_allclose(df[wavelengths].values, preprocessSpectra(
+        df_expected[wavelengths].values, wavelengths,
+        steps=("derivative", "continuum")))
+    pd.testing.assert_frame_equal(df.drop(labels=wavelengths, axis=1),
+                                  df_expected.drop(labels=wavelengths, axis=1))
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def testProcessImagesShared(setupProcessor, n_jobs):
+    pytest.importorskip("multiprocessing.shared_memory")
+    proc = setupProcessor
+    params = {"positions_hyp": proc.positions_hyp,
+              "positions_lwir": proc.positions_lwir,
+              "lwir_path": proc.lwir_path,
+              "soilmoisture_path": proc.soilmoisture_path,
+              "masks": proc.masks,
+              "time_window_width": 30}
+    soilmoisture_data = getSoilMoistureIndex(
+        proc.soilmoisture_path, getSoilMoistureSensorRegistry())
+    hyp_datetimes = pd.to_datetime(["2017-08-15 15:55", "2017-08-15 16:00",
+                                    "2017-08-15 16:05"], utc=True)
+    hyp_tasks = [(TESTFILE_HDR, proc.meas_name, i, hyp_datetime, zone_list)
+                 for i, (hyp_datetime, zone_list) in enumerate(zip(
+                     hyp_datetimes, [["zone1"], ["zone1", "zone2"],
+                                     ["zone2"]]))]
+    hyp_files = [getHyperspectralFiles(TESTFILE_HDR, load_image=True)] * 3
+
+    expected = list(processImages(hyp_tasks, [None]*3, hyp_files, params))
+    results = list(processImagesShared(hyp_tasks, [None]*3, hyp_files,
+                                       params, soilmoisture_data,
+                                       n_jobs=n_jobs))
+
+    assert(len(results) == 3)
+    for (datapoint, wavelengths), (expected_datapoint,
+                                   expected_wavelengths) in zip(results,
+                                                                expected):
+        pd.testing.assert_frame_equal(datapoint, expected_datapoint)
+        assert(list(wavelengths) == list(expected_wavelengths))
+
+
+def testProcessFullDatasetIsLazy(setupProcessor):
+    proc = ProcessFullDataset(
+        hyp_hdr_path="data/testfiles/hyp/Missing.hdr",
+        meas_name=setupProcessor.meas_name,
+        positions_hyp=setupProcessor.positions_hyp,
+        positions_lwir=setupProcessor.positions_lwir,
+        zone_list=setupProcessor.zone_list,
+        lwir_path=setupProcessor.lwir_path,
+        soilmoisture_path=setupProcessor.soilmoisture_path,
+        masks=setupProcessor.masks,
+        hyp_datetime=setupProcessor.datetime)
+    pd.testing.assert_frame_equal(proc.getSoilMoistureData(),
+                                  setupProcessor.getSoilMoistureData())
+    assert(proc.index_of_meas == 0)
+    with pytest.raises(Exception):
+        proc.envi_img
+
+    # the datetime is read from the header without opening the image
+    assert(setupProcessor.datetime == proc.datetime)
+    assert(setupProcessor._hyp_files is None)
+    assert(setupProcessor.envi_img.shape == (50, 50, 138))
+    assert(setupProcessor._hyp_files is not None)
+
+
+def testGetHyperspectralCatalog():
+    catalog = getHyperspectralCatalog("data/testfiles/", timezone="+02:00")
+    assert(list(catalog.columns) == ["path", "measurement", "filenumber",
+                                     "datetime"])
+    assert(catalog.shape[0] == 1)
+    assert(catalog["path"][0] == TESTFILE_HDR)
+    assert(catalog["filenumber"][0] == 17)
+    assert(catalog["datetime"][0] ==
+           pd.to_datetime("2017-08-15 17:57:02+02:00", utc=True))
+
+
+def testFilterEmptyImages(tmp_path):
+    empty_hdr = str(tmp_path / "Auto018.hdr")
+    shutil.copy(TESTFILE_HDR, empty_hdr)
+    with open(str(tmp_path / "Auto018.cue"), "wb") as cue_file:
+        cue_file.write(bytes(os.path.getsize(TESTFILE_HDR[:-3]+"cue")))
+    catalog = pd.DataFrame({"path": [empty_hdr, TESTFILE_HDR],
+                            "filenumber": [18, 17]})
+
+    filtered = filterEmptyImages(catalog, bands=(5, 50), pixel_step=3)
+    assert(list(filtered["path"]) == [TESTFILE_HDR])
+    assert(list(filtered["filenumber"]) == [17])
+
+
+def testGetHyperspectralTasks(tmp_path):
+    empty_hdr = str(tmp_path / "Auto018.hdr")
+    shutil.copy(TESTFILE_HDR, empty_hdr)
+    with open(str(tmp_path / "Auto018.cue"), "wb") as cue_file:
+        cue_file.write(bytes(os.path.getsize(TESTFILE_HDR[:-3]+"cue")))
+    datetime = pd.to_datetime("2017-08-15 17:57:02+02:00", utc=True)
+    # the ignored images are not read, e.g. missing files
+    catalog = pd.DataFrame({
+        "path": [empty_hdr, TESTFILE_HDR, "missing/Auto019.hdr",
+                 "missing/Auto001.hdr"],
+        "measurement": ["20170815_meas1"]*3 + ["20170816_meas1"],
+        "filenumber": [18, 17, 19, 1],
+        "datetime": datetime})
+    config = {
+        "ignore_hyp_measurements": pd.DataFrame(
+            {"measurement": ["20170816_meas1"]}),
+        "ignore_hyp_datapoints": pd.DataFrame(
+            {"measurement": ["20170815_meas1"], "filenumber": [19]}),
+        "ignore_hyp_fields": pd.DataFrame(
+            {"measurement": ["20170815_meas1"], "filenumber": [17],
+             "zone": [2]}),
+        "hyp_prefilter_empty": True,
+        "hyp_empty_bands": (5, 50),
+        "hyp_empty_step": 3}
+
+    hyp_tasks = getHyperspectralTasks(config, catalog=catalog)
+    assert(len(hyp_tasks) == 1)
+    assert(hyp_tasks[0][:4] == (TESTFILE_HDR, "20170815_meas1", 17,
+                                datetime))
+    assert(hyp_tasks[0][4] == ["zone1"] + ["zone"+str(i)
+                                           for i in range(3, 9)])
+
+    config["hyp_prefilter_empty"] = False
+    hyp_tasks = getHyperspectralTasks(config, catalog=catalog)
+    assert([task[0] for task in hyp_tasks] == [empty_hdr, TESTFILE_HDR])
+
+
+def testGetIgnoreRules():
+    ignore_rules = getIgnoreRules(
+        ignore_hyp_measurements=pd.DataFrame(
+            {"measurement": ["20170815_meas1", "20170816_meas1"]}),
+        ignore_hyp_datapoints=pd.DataFrame(
+            {"measurement": ["20170817_meas1"], "filenumber": [17]}),
+        ignore_hyp_fields=pd.DataFrame(
+            {"measurement": ["20170818_meas1"]*3,
+             "filenumber": [17, 17, 18],
+             "zone": [1, 3, 2]}))
+    assert(ignore_rules["measurements"] == {"20170815_meas1",
+                                            "20170816_meas1"})
+    assert(("20170817_meas1", 17) in ignore_rules["datapoints"])
+    assert(("20170817_meas1", 18) not in ignore_rules["datapoints"])
+    assert(ignore_rules["fields"] == {
+        ("20170818_meas1", 17): {"zone1", "zone3"},
+        ("20170818_meas1", 18): {"zone2"}})
+
+
+def testGetLwirCatalog():
+    lwir_catalog = getLwirCatalog(TESTPATH_LWIR, timezone="+02:00")
+    assert(lwir_catalog.shape == (1, 2))
+    assert(lwir_catalog["path"][0] == TESTFILE_LWIR)
+    assert(lwir_catalog["datetime"][0] ==
+           pd.to_datetime("2017-08-15 17:56:00+02:00", utc=True))
+
+
+def testGetLwirFrames():
+    frames = getLwirFrames([TESTFILE_LWIR]*2)
+    assert(frames.shape == (2, 512, 640))
+    assert(not np.isnan(frames).any())
+
+
+def testGetLwirZoneStatistics():
+    frames = np.arange(2*4*5, dtype=float).reshape(2, 4, 5)
+    edges = np.array([[0, 2, 0, 2], [1, 4, 2, 5]])
+    stats = getLwirZoneStatistics(frames, edges)
+    assert(stats.shape == (2, 2, 3))
+    roi = frames[1, 1:4, 2:5]
+    assert(np.allclose(stats[1, 1], [roi.mean(), np.median(roi), roi.std()]))
+
+
+@pytest.mark.parametrize("grid_real", [
+    ((1, 1)), ((2, 4)), ((10, 40)),
+])
+def testGetLwirGridStatistics(grid_real):
+    frames = getLwirFrames([TESTFILE_LWIR]*2)
+    edges = [120, 130, 260, 300]
+    stats = getLwirGridStatistics(frames, edges, grid_real)
+    assert(stats.shape == grid_real + (2, 3))
+
+    height = 10 // grid_real[0]
+    width = 40 // grid_real[1]
+    roi = frames[1, 120+height:120+2*height, 260:260+width]
+    if grid_real[0] > 1:
+        assert(np.allclose(stats[1, 0, 1],
+                           [roi.mean(), np.median(roi), roi.std()]))
+
+
+def testGetLwirMeasurementIndex():
+    positions_lwir = pd.DataFrame({"measurement": ["20170814", "20170815"]})
+    meas_index = getLwirMeasurementIndex(
+        positions_lwir, pd.to_datetime(["2017-08-15 17:56:00+02:00",
+                                        "2017-08-14 23:00:00+00:00",
+                                        "2017-08-16 10:00:00+02:00"],
+                                       utc=True), timezone="+02:00")
+    assert(list(meas_index[:2]) == [1, 1])
+    assert(np.isnan(meas_index[2]))
+
+
+@pytest.mark.parametrize("hyp_datetimes,expected_images", [
+    (["2017-08-15 17:57:02+02:00"], [0]),
+    (["2017-08-16 10:30:00+02:00", "2017-08-15 17:54:00+02:00"], [1]),
+    (["2017-08-15 17:52:00+02:00"], []),
+    ([], []),
+])
+def testGetLwirDataBatch(hyp_datetimes, expected_images):
+    zone_list = ["zone1", "zone2"]
+    positions_lwir = pd.DataFrame({
+        "zone1_row_start": [120], "zone1_row_end": [130],
+        "zone1_col_start": [315], "zone1_col_end": [355],
+        "zone2_row_start": [120], "zone2_row_end": [130],
+        "zone2_col_start": [260], "zone2_col_end": [300],
+        "measurement": ["20170815"]})
+    lwir_batch = getLwirDataBatch(
+        hyp_datetimes=pd.to_datetime(hyp_datetimes, utc=True),
+        lwir_path=TESTPATH_LWIR, positions_lwir=positions_lwir,
+        zone_list=zone_list, batch_size=1)
+    assert(list(lwir_batch.columns) == ["image", "datetime", "zone", "mean",
+                                        "med", "std"])
+    assert(list(lwir_batch["image"]) == list(np.repeat(expected_images, 2)))
+
+    if expected_images:
+        roi = getLwirFrames([TESTFILE_LWIR])[0, 120:130, 260:300]
+        assert(np.isclose(lwir_batch["med"].iloc[1], np.median(roi)))
+
+
+def testFindNearestDates():
+    date_list = pd.to_datetime(["2020-01-01 14:00:00+02:00",
+                                "2020-01-01 14:30:00+02:00",
+                                "2020-01-01 14:32:00+02:00"], utc=True)
+    dates = pd.to_datetime(["2020-01-01 14:25:00+02:00",
+                            "2020-01-01 13:00:00+02:00",
+                            "2020-01-01 15:00:00+02:00",
+                            None], utc=True)
+    nearest_index, time_delta = findNearestDates(date_list, dates)
+    assert(list(nearest_index[:3]) == [1, 0, 2])
+    assert(list(time_delta[:3]) == [5, 60, -28])
+    assert(np.isnan(time_delta[3]))
+
+    nearest_index, time_delta = findNearestDates([], dates)
+    assert(list(nearest_index) == [-1]*4)
+
+
 def testGetLineFromPoints():
     m, c = getLineFromPoints(point1=(5, 5), point2=(7.5, 7.5))
     assert(m == 1)
@@ -74,6 +660,43 @@ def testGetAllSoilMoistureSensors():
 def testGetUppermostSoilMoistureSensors():
     uppermost_sensors = getUppermostSoilMoistureSensors()
     assert(uppermost_sensors.shape[0] == 8)
+    assert(list(uppermost_sensors["number"]) == [
+        36554, 36547, 36557, 36553, 36549, 36560, 36562, 36561])
+
+
+def testSoilMoistureSensorRegistry(tmp_path):
+    registry = getSoilMoistureSensorRegistry()
+    assert(registry is getSoilMoistureSensorRegistry())
+    assert(len(registry) == 18)
+    assert(list(registry.name) == getAllSoilMoistureSensors()["name"])
+    assert(list(registry.zone_name[registry.uppermost]) == [
+        "zone"+str(i) for i in range(1, 9)])
+
+    index = registry.getSensorIndex(["T36560", "T36554", "T1", "X", 36561])
+    assert(list(index) == [12, 0, -1, -1, 17])
+
+    with pytest.raises(AttributeError):
+        registry.number = None
+    with pytest.raises(ValueError):
+        registry.depth[0] = 1.
+
+    sensor_file = str(tmp_path / "sensors.csv")
+    pd.DataFrame({"number": [7, 3, 5], "zone": ["A2", "A2", "A1"],
+                  "depth": [5.0, 2.5, 10.0]}).to_csv(sensor_file, sep=" ",
+                                                    index=False)
+    registry = SoilMoistureSensorRegistry.fromFile(sensor_file)
+    assert(list(registry.number[registry.uppermost]) == [5, 3])
+    assert(list(registry.getSensorIndex(["T3", "T4", "T7", "T8"])) ==
+           [1, -1, 0, -1])
+
+    # the registry of a file is shared until the file is modified
+    registry = getSoilMoistureSensorRegistry(sensor_file)
+    assert(registry is getSoilMoistureSensorRegistry(sensor_file))
+    pd.DataFrame({"number": [8], "zone": ["A1"], "depth": [2.5]}).to_csv(
+        sensor_file, sep=" ", index=False)
+    mtime = os.stat(sensor_file).st_mtime_ns + 1000000000
+    os.utime(sensor_file, ns=(mtime, mtime))
+    assert(list(getSoilMoistureSensorRegistry(sensor_file).number) == [8])
 
 
 def testFindNearestDate():
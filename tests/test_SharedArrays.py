@@ -0,0 +1,77 @@
+"""Test shared-memory transport of arrays."""
+
+import concurrent.futures
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# multiprocessing.shared_memory requires Python 3.8
+pytest.importorskip("multiprocessing.shared_memory")
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../')))
+from hprocessing.SharedArrays import *
+
+
+def getSharedSum(info):
+    """Sum a shared array in a worker process."""
+    array, segment = attachSharedArray(info)
+    result = array.sum(axis=(0, 1))
+    del array
+    segment.close()
+    return result
+
+
+@pytest.mark.parametrize("array", [
+    np.arange(24, dtype=np.uint16).reshape(2, 3, 4),
+    np.random.default_rng(0).random((5, 5, 3)).astype(np.float32),
+    np.empty((0, 3), dtype=np.int64),
+])
+def testAttachSharedArray(array):
+    with SharedArrayPool() as pool:
+        info = pool.put(array)
+        shared, segment = attachSharedArray(info)
+
+        assert(shared.dtype == array.dtype)
+        np.testing.assert_array_equal(shared, array)
+        assert(not shared.flags.writeable)
+        del shared
+        segment.close()
+
+
+def testAttachSharedArrayInWorker():
+    arrays = {"cube": np.random.default_rng(0).random((4, 6, 3)),
+              "sensor": np.arange(10)}
+    with SharedArrayPool() as pool:
+        infos = pool.putDict(arrays)
+        assert(len(pool) == 2)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+            result = executor.submit(getSharedSum, infos["cube"]).result()
+        np.testing.assert_allclose(result, arrays["cube"].sum(axis=(0, 1)))
+
+        shared, segments = attachSharedArrays(infos)
+        np.testing.assert_array_equal(shared["sensor"], arrays["sensor"])
+        del shared
+        for segment in segments:
+            segment.close()
+
+
+def testSharedArrayPoolLifetime():
+    pool = SharedArrayPool()
+    first = pool.put(np.ones(3))
+    second = pool.put(np.zeros(3))
+
+    pool.release(first)
+    assert(len(pool) == 1)
+    with pytest.raises(FileNotFoundError):
+        attachSharedArray(first)
+
+    pool.close()
+    assert(len(pool) == 0)
+    with pytest.raises(FileNotFoundError):
+        attachSharedArray(second)
+
+    with pytest.raises(ValueError):
+        pool.put(np.array(["a", None], dtype=object))
@@ -0,0 +1,175 @@
+"""Test SpectralStore class."""
+
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../')))
+from hprocessing.SpectralStore import *
+
+
+WAVELENGTHS = [str(w) for w in range(400, 1000, 20)]
+DATETIMES = pd.to_datetime(["2017-08-15 10:00", "2017-08-15 11:00",
+                            "2017-08-16 10:00"], utc=True)
+
+
+@pytest.fixture
+def exampleStore(tmp_path):
+    """Set up a store with three images of two zones with two spectra."""
+    store = SpectralStore(str(tmp_path / "store"), band_chunk_size=8)
+    spectra_list, metadata_list = [], []
+    for i, datetime in enumerate(DATETIMES):
+        spectra = np.random.default_rng(i).random((4, len(WAVELENGTHS)))
+        metadata = pd.DataFrame({
+            "zone": ["zone1", "zone1", "zone2", "zone2"],
+            "datetime": datetime,
+            "soilmoisture": np.arange(4) + 10.*i})
+        store.append(spectra, metadata, WAVELENGTHS)
+        spectra_list.append(spectra)
+        metadata_list.append(metadata)
+    return (store, np.concatenate(spectra_list),
+            pd.concat(metadata_list, ignore_index=True))
+
+
+@pytest.mark.parametrize("start,end,zones,wavelength_range", [
+    (None, None, None, None),
+    ("2017-08-15 10:30", None, None, None),
+    (None, "2017-08-15 11:00", ["zone2"], None),
+    (None, None, ["zone1"], (500, 700)),
+    ("2017-08-16 12:00+02:00", None, None, (980, 990)),
+    ("2017-08-17", None, None, None),
+    ("2017-08-15 11:00", "2017-08-16 10:00", ["zone2", "zone1"], None),
+    (None, None, ["zone9"], None),
+])
+def testQuery(exampleStore, start, end, zones, wavelength_range):
+    store, spectra, metadata = exampleStore
+    selected = np.ones(metadata.shape[0], dtype=bool)
+    if start is not None:
+        selected &= metadata["datetime"] >= getUtcTimestamp(start)
+    if end is not None:
+        selected &= metadata["datetime"] <= getUtcTimestamp(end)
+    if zones is not None:
+        selected &= metadata["zone"].isin(zones)
+    bands = np.ones(len(WAVELENGTHS), dtype=bool)
+    if wavelength_range is not None:
+        bands = ((np.array(WAVELENGTHS, dtype=float) >= wavelength_range[0]) &
+                 (np.array(WAVELENGTHS, dtype=float) <= wavelength_range[1]))
+
+    spectra_query, metadata_query, wavelengths = store.query(
+        start=start, end=end, zones=zones, wavelength_range=wavelength_range)
+
+    np.testing.assert_array_equal(spectra_query, spectra[selected][:, bands])
+    pd.testing.assert_frame_equal(
+        metadata_query.drop(labels=["image", "row"], axis=1),
+        metadata[selected].reset_index(drop=True), check_dtype=False)
+    assert(list(wavelengths) == list(np.array(WAVELENGTHS)[bands]))
+
+
+def testQueryReadsOnlyRelevantChunks(exampleStore):
+    store, spectra, _ = exampleStore
+    os.remove(store.getChunkPath(0, 0))
+    os.remove(store.getChunkPath(2, 0))
+
+    spectra_query, _, _ = store.query(start="2017-08-15 11:00",
+                                      wavelength_range=(580, 980))
+    np.testing.assert_array_equal(spectra_query, spectra[4:, 9:])
+
+
+@pytest.mark.parametrize("datetime,zones,expected_image", [
+    ("2017-08-15 10:20", None, 0), ("2017-08-15 10:40", ["zone1"], 1),
+    ("2017-08-15 23:00+02:00", None, 1), ("2020-01-01", ["zone2"], 2),
+    ("2000-01-01", None, 0),
+])
+def testQueryNearest(exampleStore, datetime, zones, expected_image):
+    store, spectra, metadata = exampleStore
+    spectra_query, metadata_query, _ = store.queryNearest(datetime,
+                                                          zones=zones)
+
+    assert((metadata_query["image"] == expected_image).all())
+    assert((metadata_query["datetime"] == DATETIMES[expected_image]).all())
+    if zones is not None:
+        assert((metadata_query["zone"].isin(zones)).all())
+    assert(spectra_query.shape == (2 if zones else 4, len(WAVELENGTHS)))
+
+
+def testQueryNearestPerZone(exampleStore):
+    store, spectra, metadata = exampleStore
+    # zone3 is only in the last image
+    store.append(np.ones((1, len(WAVELENGTHS))),
+                 pd.DataFrame({"zone": ["zone3"], "datetime": DATETIMES[2],
+                               "soilmoisture": 30.}), WAVELENGTHS)
+
+    spectra_query, metadata_query, _ = store.queryNearest(
+        "2017-08-15 10:20", zones=["zone3", "zone1"])
+    assert(list(metadata_query["zone"]) == ["zone1", "zone1", "zone3"])
+    assert(list(metadata_query["image"]) == [0, 0, 3])
+    np.testing.assert_array_equal(spectra_query[:2], spectra[:2])
+    np.testing.assert_array_equal(spectra_query[2], 1.)
+
+    # unknown zones are ignored
+    spectra_query, metadata_query, _ = store.queryNearest(
+        "2017-08-15 10:20", zones=["zone9"])
+    assert(spectra_query.shape == (0, len(WAVELENGTHS)))
+    assert(metadata_query.shape[0] == 0)
+
+
+def testConvertOutputToStore(exampleStore, tmp_path):
+    _, spectra, metadata = exampleStore
+    output = pd.concat([pd.DataFrame(spectra, columns=WAVELENGTHS),
+                        metadata], axis=1)
+    output.to_csv(str(tmp_path / "output.csv"))
+    store = convertOutputToStore(str(tmp_path / "output.csv"),
+                                 str(tmp_path / "converted"))
+
+    spectra_query, metadata_query, wavelengths = store.query(
+        start="2017-08-15 11:00", zones=["zone1"])
+    selected = ((metadata["datetime"] >= DATETIMES[1]) &
+                (metadata["zone"] == "zone1")).values
+    np.testing.assert_allclose(spectra_query, spectra[selected])
+    assert(list(wavelengths) == WAVELENGTHS)
+    assert(list(metadata_query["soilmoisture"]) ==
+           list(metadata["soilmoisture"][selected]))
+
+
+def testReopenStore(exampleStore):
+    store, spectra, metadata = exampleStore
+    reopened = SpectralStore(store.path)
+
+    assert(len(reopened) == 12)
+    assert(reopened.band_chunk_size == 8)
+    spectra_query, metadata_query, _ = reopened.query(zones=["zone2"])
+    np.testing.assert_array_equal(spectra_query,
+                                  spectra[metadata["zone"] == "zone2"])
+    assert(metadata_query["datetime"].dt.tz is not None)
+
+    reopened.append(spectra[:2], metadata[:2], WAVELENGTHS)
+    assert(len(SpectralStore(store.path)) == 14)
+    with pytest.raises(ValueError):
+        reopened.append(spectra[:2, :3], metadata[:2], WAVELENGTHS[:3])
+
+
+def testBandChunkSizeOfOldStore(exampleStore):
+    store, _, _ = exampleStore
+    with open(store.getFilePath(SpectralStore.SETTINGS_FILE)) as file:
+        assert(json.load(file) == {"band_chunk_size": 8})
+
+    # stores without settings file, the chunks of the first image are missing
+    os.remove(store.getFilePath(SpectralStore.SETTINGS_FILE))
+    for filepath in glob.glob(store.getFilePath("image000000_band*.npz")):
+        os.remove(filepath)
+    assert(SpectralStore(store.path).band_chunk_size == 8)
+
+
+def testClear(exampleStore):
+    store, _, _ = exampleStore
+    store.clear()
+
+    assert(len(store) == 0)
+    assert(os.listdir(store.path) == [])
+    assert(store.query()[0].shape == (0, 0))
@@ -0,0 +1,170 @@
+"""Test file-based work queue."""
+
+import concurrent.futures
+import configparser
+import os
+import sys
+import time
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../')))
+from hprocessing.ProcessFullDataset import (SpectralonCache,
+                                            getHyperspectralFiles,
+                                            getSoilMoistureIndex,
+                                            getSoilMoistureSensorRegistry,
+                                            processImages)
+from hprocessing.WorkQueue import *
+
+
+TESTFILE_HDR = "data/testfiles/hyp/Auto017.hdr"
+HYP_DATETIMES = pd.to_datetime(["2017-08-15 15:55", "2017-08-15 16:00",
+                                "2017-08-15 16:05"], utc=True)
+
+
+def getTasks(n_tasks: int, hyp_hdr_path: str = TESTFILE_HDR) -> list:
+    """Get tasks of the test image."""
+    return [(hyp_hdr_path, "20170815_meas1", i,
+             HYP_DATETIMES[i % len(HYP_DATETIMES)], ["zone1", "zone2"])
+            for i in range(n_tasks)]
+
+
+def claimAll(queue_path: str) -> list:
+    """Claim tasks until the queue is empty (in a worker process)."""
+    work_queue = WorkQueue(queue_path)
+    filenames = []
+    while True:
+        claimed = work_queue.claim()
+        if claimed is None:
+            return filenames
+        filenames.append(claimed[0])
+
+
+def updateConfig(config_path: str, section: str, **options):
+    """Change options of a config file."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    config[section].update(options)
+    with open(config_path, "w") as config_file:
+        config.write(config_file)
+
+
+def runProcessQueue(queue_path: str, params: dict) -> int:
+    """Process a queue (in a worker process)."""
+    return processQueue(WorkQueue(queue_path), params, poll_interval=0.1)
+
+
+def testClaimIsExclusive(tmp_path):
+    work_queue = WorkQueue.create(str(tmp_path / "queue"))
+    work_queue.put(getTasks(40))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=4) as executor:
+        claimed = [filename for filenames in executor.map(
+            claimAll, [work_queue.path]*4) for filename in filenames]
+
+    assert(sorted(claimed) == ["{0:06d}.a0.json".format(i)
+                               for i in range(40)])
+    assert(work_queue.getStatus() == {"tasks": 0, "claimed": 40, "done": 0,
+                                      "failed": 0})
+
+
+def testStaleClaimsAndRetries(tmp_path):
+    work_queue = WorkQueue.create(str(tmp_path / "queue"), claim_timeout=60.,
+                                  max_attempts=2)
+    work_queue.put(getTasks(2))
+    filename, task = work_queue.claim()
+    assert(filename == "000000.a0.json")
+    assert(task == getTasks(2)[0])
+
+    # claim of a crashed worker
+    assert(work_queue.requeueStaleTasks() == 0)
+    old_time = time.time() - 120.
+    os.utime(work_queue.getFilePath("claimed", filename),
+             (old_time, old_time))
+    assert(work_queue.requeueStaleTasks() == 1)
+    assert(work_queue.getTaskFiles("tasks") == ["000000.a1.json",
+                                                "000001.a0.json"])
+
+    # the second attempt fails, the task is not retried
+    filename, _ = work_queue.claim()
+    work_queue.fail(filename, "Error")
+    assert(work_queue.getTaskFiles("failed") == ["000000.a2.json"])
+    assert(sorted(os.listdir(work_queue.getFilePath("logs"))) == [
+        "000000.a0.txt", "000000.a1.txt"])
+
+    with pytest.raises(RuntimeError):
+        mergeQueueShards(work_queue.path)
+    filename, _ = work_queue.claim()
+    work_queue.complete(filename, (None, None))
+    assert(work_queue.isFinished())
+    with pytest.raises(RuntimeError):
+        mergeQueueShards(work_queue.path)
+
+
+def testProcessQueue(setupProcessor, tmp_path):
+    proc = setupProcessor
+    params = {"positions_hyp": proc.positions_hyp,
+              "positions_lwir": proc.positions_lwir,
+              "lwir_path": proc.lwir_path,
+              "soilmoisture_path": proc.soilmoisture_path,
+              "masks": proc.masks,
+              "time_window_width": 30,
+              "soilmoisture_data": getSoilMoistureIndex(
+                  proc.soilmoisture_path, getSoilMoistureSensorRegistry())}
+    work_queue = WorkQueue.create(str(tmp_path / "queue"), max_attempts=2)
+    work_queue.put(getTasks(6) + getTasks(1, "data/testfiles/hyp/none.hdr"))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=3) as executor:
+        n_processed = list(executor.map(runProcessQueue,
+                                        [work_queue.path]*3, [params]*3))
+
+    assert(sum(n_processed) == 6)
+    assert(work_queue.getStatus() == {"tasks": 0, "claimed": 0, "done": 6,
+                                      "failed": 1})
+    expected = processImages(
+        getTasks(6), [None]*6,
+        [getHyperspectralFiles(TESTFILE_HDR, load_image=True)]*6, params)
+    results = list(work_queue.getResults())
+    assert(len(results) == 6)
+    for (datapoint, wavelengths), (expected_datapoint,
+                                   expected_wavelengths) in zip(results,
+                                                                expected):
+        pd.testing.assert_frame_equal(datapoint, expected_datapoint)
+        assert(list(wavelengths) == list(expected_wavelengths))
+
+
+def testCreateDatasetQueue(exampleDataset, tmp_path):
+    config_path, data_directory = exampleDataset
+    updateConfig(config_path, "Paths",
+                 data_output=str(tmp_path / "output.csv"))
+    queue_path = str(tmp_path / "queue")
+    work_queue = createDatasetQueue(config_path, data_directory,
+                                    queue_path=queue_path)
+    assert(not os.path.isfile(
+        work_queue.getFilePath(WorkQueue.SPECTRALON_FILE)))
+    assert(runQueueWorker(queue_path, wait=False) == 1)
+    assert(work_queue.isFinished())
+
+    # the spectralons of the workers are merged into the cache
+    assert(len(list(work_queue.getSpectralons())) == 1)
+    assert(mergeQueueShards(queue_path).shape[0] == 2)
+    cache = SpectralonCache.load(str(tmp_path / "spectralon.npz"))
+    assert(list(cache.spectra) == ["20170815_meas1/Auto017"])
+
+
+def testCreateDatasetQueueWithReuse(exampleDataset, tmp_path):
+    config_path, data_directory = exampleDataset
+    updateConfig(config_path, "Process", hyp_spectralon_reuse="nearest")
+    queue_path = str(tmp_path / "queue")
+    work_queue = createDatasetQueue(config_path, data_directory,
+                                    queue_path=queue_path)
+
+    # the workers load the spectralon cache of the coordinator
+    cache = SpectralonCache.load(
+        work_queue.getFilePath(WorkQueue.SPECTRALON_FILE))
+    assert(list(cache.spectra) == ["20170815_meas1/Auto017"])
+    assert(os.path.isfile(str(tmp_path / "spectralon.npz")))
+    assert(runQueueWorker(queue_path, wait=False) == 1)
+    assert(work_queue.isFinished())
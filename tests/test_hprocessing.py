@@ -0,0 +1,111 @@
+"""Test lazy imports of the hprocessing package."""
+
+import importlib
+import os
+import subprocess
+import sys
+import types
+
+import pytest
+
+ROOT_DIRECTORY = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../'))
+
+
+def getLoadedModules(code: str) -> set:
+    """Run code in a new interpreter and get the names of loaded modules."""
+    output = subprocess.run(
+        [sys.executable, "-c",
+         code + "\nimport sys\nprint(' '.join(sys.modules))"],
+        cwd=ROOT_DIRECTORY, check=True, stdout=subprocess.PIPE,
+        universal_newlines=True).stdout
+    return set(output.split())
+
+
+@pytest.mark.parametrize("code,expected,not_expected", [
+    ("import hprocessing", [],
+     ["matplotlib", "tqdm", "hprocessing.IRUtils", "hprocessing.PlotUtils",
+      "hprocessing.ProcessEnviFile", "hprocessing.ProcessFullDataset"]),
+    ("from hprocessing import ProcessFullDataset",
+     ["hprocessing.ProcessFullDataset"],
+     ["matplotlib", "tqdm", "hprocessing.IRUtils", "hprocessing.PlotUtils"]),
+    ("from hprocessing.ProcessFullDataset import *",
+     ["hprocessing.ProcessFullDataset"],
+     ["matplotlib", "tqdm", "hprocessing.IRUtils",
+      "hprocessing.Preprocessing", "hprocessing.SpectralStore"]),
+    ("import hprocessing\nhprocessing.SpectralStore",
+     ["hprocessing.SpectralStore"],
+     ["matplotlib", "hprocessing.ProcessFullDataset"]),
+    ("import hprocessing\nhprocessing.plotEnviImageWithMask",
+     ["matplotlib", "hprocessing.PlotUtils"], []),
+    ("import hprocessing\nhprocessing.WorkQueue",
+     ["hprocessing.WorkQueue"],
+     ["matplotlib", "hprocessing.Ingestion", "hprocessing.PlotUtils"]),
+    ("import hprocessing\ntry:\n    hprocessing.missingFunction\n"
+     "except AttributeError:\n    pass",
+     [], ["matplotlib", "hprocessing.ProcessEnviFile",
+          "hprocessing.PlotUtils"]),
+])
+def testLazyImports(code, expected, not_expected):
+    modules = getLoadedModules(code)
+    for module in expected:
+        assert(module in modules)
+    for module in not_expected:
+        assert(module not in modules)
+
+
+def testStarImport():
+    namespace = {}
+    exec("from hprocessing import *", namespace)
+    for name in ["ProcessEnviFile", "ProcessFullDataset", "SpectralStore",
+                 "plotEnviImageWithMask", "getEnviFile", "readConfig"]:
+        assert(name in namespace)
+
+
+def testPackageAttributes():
+    import hprocessing
+
+    assert(hprocessing.getEnviFile is importlib.import_module(
+        "hprocessing.ProcessEnviFile").getEnviFile)
+    assert("readConfig" in dir(hprocessing))
+    with pytest.raises(AttributeError):
+        hprocessing.missingFunction
+
+    # imported modules of the submodules are not part of the package
+    with pytest.raises(AttributeError):
+        hprocessing.np
+
+
+def testClassesNamedLikeSubmodules():
+    # in a new interpreter, the classes replace the submodules of the same
+    # name as with the former star imports
+    output = subprocess.run(
+        [sys.executable, "-c",
+         "from hprocessing import ProcessFullDataset, ProcessEnviFile\n"
+         "print(isinstance(ProcessFullDataset, type),\n"
+         "      isinstance(ProcessEnviFile, type))"],
+        cwd=ROOT_DIRECTORY, check=True, stdout=subprocess.PIPE,
+        universal_newlines=True).stdout
+    assert(output.split() == ["True", "True"])
+
+
+@pytest.mark.parametrize("module_name", [
+    "ProcessEnviFile", "SpectralStore", "Preprocessing", "ProcessFullDataset",
+    "WorkQueue", "Ingestion", "PlotUtils", "SharedArrays",
+])
+def testPublicNames(module_name):
+    import hprocessing
+
+    # all public names defined in the submodule are in its __all__
+    if module_name == "SharedArrays":
+        pytest.importorskip("multiprocessing.shared_memory")
+    module = importlib.import_module("hprocessing." + module_name)
+    public_names = [name for name, value in vars(module).items()
+                    if not name.startswith("_") and
+                    not isinstance(value, types.ModuleType) and
+                    (name.isupper() or
+                     getattr(value, "__module__", None) == module.__name__)]
+    assert(sorted(public_names) == sorted(module.__all__))
+    for name in module.__all__:
+        if name != module_name:
+            assert(getattr(hprocessing, name) is getattr(module, name))